@@ -0,0 +1,90 @@
+"""
+Benchmark of the response layer for a 10k-row /internal/persons.
+
+Compares the previous path (to_dict() per row + Flask's stdlib JSON provider) with the
+serializers of backend/RESTFUL_API/responses.py and shows the bytes on the wire per content encoding.
+No server and no database are needed, the rows are built in memory.
+
+Run from this directory:
+    python benchmark_json_responses.py [number_of_rows]
+"""
+import gzip
+import json
+import os
+import sys
+import timeit
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+# the parent of ApartmentManager must be importable
+sys.path.insert(0, os.path.abspath(os.path.join(TEST_DIR, "../..")))
+
+from ApartmentManager.backend.SQL_API.rental.rental_orm_models import PersonalData
+from ApartmentManager.backend.RESTFUL_API import responses
+
+ROWS = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+REPEAT = 5
+
+
+def build_persons(count: int) -> list[PersonalData]:
+    return [PersonalData(id_personal_data=i,
+                         first_name=f"Vorname{i}",
+                         last_name=f"Müller-{i}",
+                         bank_data=f"DE{i:020d}",
+                         phone_number=f"+49 30 {i:07d}",
+                         email=f"person{i}@example.de",
+                         comment="Mieter seit 2021, Zahlung pünktlich")
+            for i in range(count)]
+
+
+def flask_default_dumps(data) -> bytes:
+    # settings of flask.json.provider.DefaultJSONProvider without debug mode
+    return json.dumps(data, ensure_ascii=True, sort_keys=True, separators=(",", ":")).encode("utf-8")
+
+
+def stdlib_compact_dumps(data) -> bytes:
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def best_time_per_row_us(func) -> float:
+    return min(timeit.repeat(func, number=1, repeat=REPEAT)) / ROWS * 1_000_000
+
+
+def main():
+    persons = build_persons(ROWS)
+    rows = [person.to_dict() for person in persons]
+
+    print(f"/internal/persons with {ROWS} rows, best of {REPEAT} runs\n")
+    print(f"to_dict() per row: {best_time_per_row_us(lambda: [p.to_dict() for p in persons]):.2f} µs/row\n")
+
+    serializers = [("flask jsonify (before)", flask_default_dumps),
+                   ("stdlib json compact", stdlib_compact_dumps)]
+    if responses.orjson is not None:
+        serializers.append(("orjson", lambda data: responses.orjson.dumps(data)))
+    else:
+        print("orjson is not installed, skipped")
+    if responses.msgpack is not None:
+        serializers.append(("msgpack", lambda data: responses.msgpack.packb(data)))
+    else:
+        print("msgpack is not installed, skipped")
+
+    encodings = [("identity", lambda body: body),
+                 ("gzip", lambda body: gzip.compress(body, compresslevel=responses.GZIP_LEVEL))]
+    if responses.brotli is not None:
+        encodings.append(("br", lambda body: responses.brotli.compress(body, quality=responses.BROTLI_QUALITY)))
+    else:
+        print("brotli is not installed, skipped")
+
+    header = f"{'serializer':<24}{'µs/row':>10}" + "".join(f"{name + ' bytes':>16}{name + ' µs/row':>16}"
+                                                        for name, _ in encodings[1:])
+    print(f"\n{header}{'identity bytes':>16}")
+    for name, dumps in serializers:
+        body = dumps(rows)
+        line = f"{name:<24}{best_time_per_row_us(lambda: dumps(rows)):>10.2f}"
+        for _, encode in encodings[1:]:
+            encoded = encode(body)
+            line += f"{len(encoded):>16,}{best_time_per_row_us(lambda: encode(body)):>16.2f}"
+        print(f"{line}{len(body):>16,}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Benchmark of the system prompt rendering per turn.
+
+Compares the previous path (copy.deepcopy of the prompt dictionary and json.dumps of the whole prompt
+on every turn) with the compiled prompts of backend/AI_API/general/prompting.py, which are serialized once
+and only splice the feedback block. Both paths must produce the same text.
+No server, no database and no LLM are needed.
+
+Run from this directory:
+    python benchmark_prompt_rendering.py [number_of_renderings]
+"""
+import copy
+import os
+import sys
+import timeit
+import tracemalloc
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+# the parent of ApartmentManager must be importable
+sys.path.insert(0, os.path.abspath(os.path.join(TEST_DIR, "../..")))
+
+from ApartmentManager.backend.AI_API.general import prompting
+from ApartmentManager.backend.AI_API.general.prompting import Prompt
+from ApartmentManager.backend.AI_API.general.json_serialisation import dumps_for_llm_prompt
+from ApartmentManager.backend.AI_API.general.envelopes.envelopes_api import build_data_answer, AnswerSource
+
+RENDERINGS = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+REPEAT = 5
+
+
+def inject_feedback_before(feedback, operation_id=None, interrupted_operations=None) -> str:
+    # the previous rendering of the CRUD intent prompt, with the feedback digest of today
+    combined_prompt = copy.deepcopy(Prompt.CRUD_INTENT.value)
+    if feedback:
+        combined_prompt["feedback"]["result"] = prompting.build_feedback_digest(feedback)
+    if operation_id:
+        combined_prompt["feedback"]["operation_id"] = operation_id
+    if interrupted_operations:
+        combined_prompt["feedback"]["interrupted_operations"] = interrupted_operations
+    return dumps_for_llm_prompt(combined_prompt)
+
+
+def render_crud_intent(feedback, operation_id=None, interrupted_operations=None) -> str:
+    # the rendering of CrudIntentAssistant
+    feedback_block = prompting.build_feedback_block(feedback, operation_id, interrupted_operations)
+    return prompting.COMPILED_PROMPTS[Prompt.CRUD_INTENT].render(feedback=feedback_block)
+
+
+def best_time_per_rendering_us(func) -> float:
+    return min(timeit.repeat(func, number=RENDERINGS, repeat=REPEAT)) / RENDERINGS * 1_000_000
+
+
+def peak_bytes_per_rendering(func) -> int:
+    """
+    :return: Peak of the memory allocated during one rendering (tracemalloc).
+    """
+    func()  # warm-up, caches of the first call are not counted
+    tracemalloc.start()
+    baseline, _ = tracemalloc.get_traced_memory()
+    tracemalloc.reset_peak()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak - baseline
+
+
+def main():
+    rows = [{"id_personal_data": i, "first_name": f"Vorname{i}", "last_name": f"Müller-{i}"} for i in range(50)]
+    envelope = build_data_answer(payload=rows, payload_comment="Data updated",
+                                 model="gemini", answer_source=AnswerSource.BACKEND).model_dump(mode="json")
+    interrupted = {"update": {"operation_id": "a1b2c3d4", "type": "person"}}
+
+    cases = [
+        ("CRUD intent, first turn", lambda: inject_feedback_before(None),
+         lambda: render_crud_intent(None)),
+        ("CRUD intent with feedback", lambda: inject_feedback_before((envelope, True), "e5f6a7b8", interrupted),
+         lambda: render_crud_intent((envelope, True), "e5f6a7b8", interrupted)),
+        ("GET function call", lambda: dumps_for_llm_prompt(Prompt.GET_FUNCTION_CALL.value),
+         lambda: prompting.compiled_prompt(Prompt.GET_FUNCTION_CALL)),
+        ("UPDATE continuation", lambda: dumps_for_llm_prompt(prompting._with_continuation(Prompt.UPDATE_ENTITY.value)),
+         lambda: prompting.build_continuation_prompt(Prompt.UPDATE_ENTITY)),
+    ]
+
+    print(f"Prompt rendering, {RENDERINGS} renderings, best of {REPEAT} runs\n")
+    print(f"{'prompt':<28}{'before µs':>12}{'compiled µs':>14}{'before peak B':>15}{'compiled peak B':>17}{'prompt chars':>14}")
+    for name, before, compiled in cases:
+        assert before() == compiled(), f"{name}: the compiled prompt differs"
+        before_bytes = peak_bytes_per_rendering(before)
+        compiled_bytes = peak_bytes_per_rendering(compiled)
+        print(f"{name:<28}{best_time_per_rendering_us(before):>12.2f}{best_time_per_rendering_us(compiled):>14.2f}"
+              f"{before_bytes:>15,}{compiled_bytes:>17,}{len(compiled()):>14,}")
+    print("\npeak B: peak of the memory allocated during one rendering (tracemalloc)")
+
+
+if __name__ == "__main__":
+    main()
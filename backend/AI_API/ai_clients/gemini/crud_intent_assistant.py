@@ -1,5 +1,9 @@
-import json
+import asyncio
+import hashlib
+import threading
+import time
 import typing
+from collections import OrderedDict
 
 from google.genai import errors as genai_errors
 from google import genai
@@ -10,10 +14,36 @@ if typing.TYPE_CHECKING:
 from ApartmentManager.backend.AI_API.general.envelopes import envelopes_business_logic
 from ApartmentManager.backend.AI_API.general.envelopes.envelopes_business_logic import CrudIntentModel, validate_model
 from ApartmentManager.backend.AI_API.general.error_texts import ErrorCode, APIError
-from ApartmentManager.backend.AI_API.general.logger import log_error
+from ApartmentManager.backend.AI_API.general.logger import log_error, raise_as_api_error
 from ApartmentManager.backend.SQL_API.logs.create_log import create_new_log_entry
+from ApartmentManager.backend.AI_API.general.stage_timing import CRUD_INTENT_LLM
+from ApartmentManager.backend.AI_API.general.metrics import PROMPT_USAGE, CRUD_INTENT_ROUTES, CRUD_INTENT_CACHE_LOOKUPS
+from ApartmentManager.backend.AI_API.general.intent_classifier import get_crud_intent_classifier
+from ApartmentManager.backend.AI_API.general.answer_cache import normalize_question
+from ApartmentManager.backend.config.server_config import CRUD_INTENT_LOCAL_THRESHOLD, CRUD_INTENT_CACHE_MAX_ENTRIES, \
+    CRUD_INTENT_CACHE_TTL_SECONDS
+from ApartmentManager.backend.AI_API.general.structured_output_repair import load_structured_output, \
+    coerce_structured_output
+from ApartmentManager.backend.AI_API.ai_clients.gemini.provider_call import call_generate_content, \
+    call_generate_content_async
+from ApartmentManager.backend.AI_API.ai_clients.gemini.prompt_cache import cached_content_for
+
+# the schema does not change, build it once
+CRUD_INTENT_SCHEMA = envelopes_business_logic.get_json_schema(CrudIntentModel)
+# log name of the answers of the local classifier, kept apart from the LLM answers it is trained on
+CRUD_INTENT_LOCAL = "CRUD_INTENT_LOCAL"
+# log name of the answers taken from the cache of the CRUD intents
+CRUD_INTENT_CACHED = "CRUD_INTENT_CACHED"
+# a changed prompt (new deployment) never reuses the intents of the old one
+CRUD_INTENT_PROMPT_HASH = hashlib.sha256(
+    prompting.compiled_prompt(prompting.Prompt.CRUD_INTENT).encode("utf-8")).hexdigest()[:16]
 
 class CrudIntentAssistant:
+    # shared by the assistants of all conversations:
+    # (prompt hash, normalized question, model) -> (expiry time, CRUD intent)
+    _intent_cache: OrderedDict[tuple, tuple[float, CrudIntentModel]] = OrderedDict()
+    _intent_cache_lock = threading.Lock()
+
     def __init__(self,
                  llm_client: genai.Client,
                  model_name: str,
@@ -31,55 +61,221 @@ class CrudIntentAssistant:
                               conversation_client: "ConversationClient") -> CrudIntentModel:
         """
         Analyses for CRUD intent in the user question.
+        The answer of the LLM to the same question in a stateless turn
+        or a confident answer of the local classifier saves the LLM call.
+        """
+        cache_key = self._intent_cache_key(conversation_client)
+        cached_answer = self._get_cached_crud_response(conversation_client, cache_key)
+        if cached_answer is not None:
+            return cached_answer
+
+        local_answer = self._get_local_crud_response(conversation_client)
+        if local_answer is not None:
+            return local_answer
+
+        contents, crud_llm_config = self._prepare_crud_request(conversation_client)
+
+        # a Gemini error is raised as it is
+        with raise_as_api_error(ErrorCode.LLM_ERROR_RETRIEVING_CRUD_INTENT_RESPONSE,
+                                passthrough=(genai_errors.APIError,)):
+            llm_answer = call_generate_content(self.llm_client,
+                                               model=self.model,
+                                               contents=contents,
+                                               config=crud_llm_config,
+                                               stage=CRUD_INTENT_LLM)
+
+        crud_intent = self._process_crud_response(conversation_client, llm_answer)
+        self._put_cached_crud_response(cache_key, crud_intent)
+        return crud_intent
+
+    async def get_crud_llm_response_async(self,
+                                          conversation_client: "ConversationClient") -> CrudIntentModel:
+        """
+        Async version of get_crud_llm_response for the ASGI serving mode.
+        """
+        cache_key = self._intent_cache_key(conversation_client)
+        # loading the model and writing the log entry touch the disk, keep them off the event loop
+        cached_answer = await asyncio.to_thread(self._get_cached_crud_response, conversation_client, cache_key)
+        if cached_answer is not None:
+            return cached_answer
+
+        local_answer = await asyncio.to_thread(self._get_local_crud_response, conversation_client)
+        if local_answer is not None:
+            return local_answer
+
+        contents, crud_llm_config = self._prepare_crud_request(conversation_client)
+
+        # a Gemini error is raised as it is
+        with raise_as_api_error(ErrorCode.LLM_ERROR_RETRIEVING_CRUD_INTENT_RESPONSE,
+                                passthrough=(genai_errors.APIError,)):
+            llm_answer = await call_generate_content_async(self.llm_client,
+                                                           model=self.model,
+                                                           contents=contents,
+                                                           config=crud_llm_config,
+                                                           stage=CRUD_INTENT_LLM)
+
+        # parsing and writing the log entry touch SQLite, keep them off the event loop
+        crud_intent = await asyncio.to_thread(self._process_crud_response, conversation_client, llm_answer)
+        self._put_cached_crud_response(cache_key, crud_intent)
+        return crud_intent
+
+    def _get_local_crud_response(self,
+                                 conversation_client: "ConversationClient") -> CrudIntentModel | None:
+        """
+        Answers the CRUD intent with the local classifier if it is confident enough.
+        Turns that depend on the state of the conversation (an active or interrupted write operation,
+        a feedback of the backend) are always left to the LLM.
+        :return: CRUD intent, None if the LLM has to be asked.
+        """
+        user_question = conversation_client.user_question or ""
+        if not self._is_stateless_turn(conversation_client):
+            CRUD_INTENT_ROUTES.inc(("llm_active_operation",))
+            return None
+
+        try:
+            classifier = get_crud_intent_classifier()
+            if classifier is None:
+                CRUD_INTENT_ROUTES.inc(("llm_no_model",))
+                return None
+            crud_intent, confidence = classifier.predict(user_question)
+        except Exception as error:
+            # a broken model file must not break the chat, the LLM answers instead
+            log_error(ErrorCode.ERROR_PARSING_CRUD_INTENT_RESPONSE, exception=error)
+            CRUD_INTENT_ROUTES.inc(("llm_no_model",))
+            return None
+
+        if crud_intent is None or confidence < CRUD_INTENT_LOCAL_THRESHOLD:
+            CRUD_INTENT_ROUTES.inc(("llm_low_confidence",))
+            return None
+
+        CRUD_INTENT_ROUTES.inc(("local",))
+        conversation_client.system_prompt_name = CRUD_INTENT_LOCAL
+        self._log_crud_response(conversation_client, crud_intent, CRUD_INTENT_LOCAL)
+        return crud_intent
+
+    @staticmethod
+    def _is_stateless_turn(conversation_client: "ConversationClient") -> bool:
+        """
+        Without an active or interrupted write operation and a feedback of the backend,
+        the CRUD intent depends only on the question.
+        """
+        return not (conversation_client.operation_id
+                    or conversation_client.extract_operation_ids_from_crud_answer()
+                    or (conversation_client.user_question or "").startswith("Backend"))
+
+    def _intent_cache_key(self, conversation_client: "ConversationClient") -> tuple | None:
+        """
+        :return: Key of the CRUD intent in the cache, None if the turn depends on the state of the conversation.
+        """
+        if not conversation_client.user_question or not self._is_stateless_turn(conversation_client):
+            return None
+        return CRUD_INTENT_PROMPT_HASH, normalize_question(conversation_client.user_question), self.model
+
+    def _get_cached_crud_response(self,
+                                  conversation_client: "ConversationClient",
+                                  cache_key: tuple | None) -> CrudIntentModel | None:
+        """
+        :return: Copy of the cached CRUD intent, None if the LLM has to be asked.
+        """
+        if cache_key is None:
+            return None
+
+        with self._intent_cache_lock:
+            cached = self._intent_cache.get(cache_key)
+            if cached is not None and cached[0] < time.monotonic():
+                del self._intent_cache[cache_key]
+                cached = None
+            elif cached is not None:
+                self._intent_cache.move_to_end(cache_key)
+
+        if cached is None:
+            CRUD_INTENT_CACHE_LOOKUPS.inc(("miss",))
+            return None
+
+        CRUD_INTENT_CACHE_LOOKUPS.inc(("hit",))
+        # the conversation changes the operation IDs of its intent, it gets its own copy
+        crud_intent = cached[1].model_copy(deep=True)
+        conversation_client.system_prompt_name = CRUD_INTENT_CACHED
+        self._log_crud_response(conversation_client, crud_intent, self.model)
+        return crud_intent
+
+    def _put_cached_crud_response(self, cache_key: tuple | None, crud_intent: CrudIntentModel) -> None:
+        if cache_key is None:
+            return
+
+        expires_at = time.monotonic() + CRUD_INTENT_CACHE_TTL_SECONDS
+        with self._intent_cache_lock:
+            self._intent_cache[cache_key] = (expires_at, crud_intent.model_copy(deep=True))
+            self._intent_cache.move_to_end(cache_key)
+            while len(self._intent_cache) > CRUD_INTENT_CACHE_MAX_ENTRIES:
+                self._intent_cache.popitem(last=False)
+
+    def _prepare_crud_request(self,
+                              conversation_client: "ConversationClient") -> (list[types.Content],
+                                                                             types.GenerateContentConfig):
+        """
+        Builds the system prompt with the feedback of the previous turn and the configuration of the LLM call.
+        If the instructions are in the cache of the provider, the feedback block is sent before the question.
         """
         # Extract interrupted operations from previous CRUD answer
         interrupted_ops = conversation_client.extract_operation_ids_from_crud_answer()
 
-        system_prompt_crud_intent = prompting.inject_feedback(
-            conversation_client.result, 
+        feedback_block = prompting.build_feedback_block(
+            conversation_client.result,
             conversation_client.operation_id,
             interrupted_ops
         )
+        system_prompt_crud_intent = prompting.COMPILED_PROMPTS[prompting.Prompt.CRUD_INTENT].render(
+            feedback=feedback_block)
         conversation_client.system_prompt = system_prompt_crud_intent
         conversation_client.system_prompt_name = prompting.Prompt.CRUD_INTENT.name
-        schema_crud = envelopes_business_logic.get_json_schema(CrudIntentModel)
+        PROMPT_USAGE.inc((conversation_client.system_prompt_name,))
+        schema_crud = CRUD_INTENT_SCHEMA
+
+        user_content = types.Content(
+            role="user",
+            parts=[types.Part(text=conversation_client.user_question)]
+        )
+
+        cached_content = cached_content_for(self.model, prompting.crud_intent_instructions())
+        if cached_content:
+            # the instructions (and no tools) are in the cached content
+            prompt_config = {"cached_content": cached_content}
+            feedback_content = types.Content(role="user",
+                                             parts=[types.Part(text=prompting.feedback_message(feedback_block))])
+            contents = [feedback_content, user_content]
+        else:
+            prompt_config = {"tools": [], # do not use tools, no variations
+                             "system_instruction": types.Part(text=system_prompt_crud_intent)}
+            contents = [user_content]
 
         # Configuration for the LLM call
         crud_llm_config = types.GenerateContentConfig(
             response_mime_type="application/json",
             response_schema=schema_crud,
             temperature=0,  # deterministic behavior, only recognize CRUD intents
-            tools=[], # do not use tools, no variations
-            system_instruction=types.Part(text=system_prompt_crud_intent)
+            **prompt_config
         )
 
-        try:
-            user_content = types.Content(
-                role="user",
-                parts=[types.Part(text=conversation_client.user_question)]
-            )
-
-            llm_answer = self.llm_client.models.generate_content(
-                model=self.model,
-                contents=[user_content],
-                config=crud_llm_config,
-            )
-
-        # catch a Gemini error
-        except genai_errors.APIError:
-            raise
-        except Exception as error:
-            trace_id = log_error(ErrorCode.LLM_ERROR_RETRIEVING_CRUD_INTENT_RESPONSE, exception=error)
-            raise APIError(ErrorCode.LLM_ERROR_RETRIEVING_CRUD_INTENT_RESPONSE, trace_id) from error
+        return contents, crud_llm_config
 
+    def _process_crud_response(self,
+                               conversation_client: "ConversationClient",
+                               llm_answer: types.GenerateContentResponse) -> CrudIntentModel:
+        """
+        Parses the LLM answer into the CRUD intent model and writes it to the log.
+        """
         try:
             # Scenario 1: SDK has the parsed version of the answer, get it
             llm_answer_crud = getattr(llm_answer, "parsed", None)
 
-            # Scenario 2: SDK does not have the parsed version of the answer
+            # Scenario 2: SDK does not have the parsed version of the answer,
+            # small glitches of the JSON are repaired locally before it counts as a parse error
             if llm_answer_crud is None:
                 llm_answer_text = llm_answer.candidates[0].content.parts[0].text
-                llm_answer_crud = json.loads(llm_answer_text)
+                llm_answer_crud = load_structured_output(llm_answer_text, CRUD_INTENT_SCHEMA, source=CRUD_INTENT_LLM)
+            else:
+                llm_answer_crud = coerce_structured_output(llm_answer_crud, CRUD_INTENT_SCHEMA, source=CRUD_INTENT_LLM)
 
             parsed_llm_answer= validate_model(CrudIntentModel, llm_answer_crud)
 
@@ -87,11 +283,18 @@ class CrudIntentAssistant:
             trace_id = log_error(ErrorCode.ERROR_PARSING_CRUD_INTENT_RESPONSE, exception=error)
             raise APIError(ErrorCode.ERROR_PARSING_CRUD_INTENT_RESPONSE, trace_id) from error
 
+        self._log_crud_response(conversation_client, parsed_llm_answer, self.model)
+        return parsed_llm_answer
+
+    def _log_crud_response(self,
+                           conversation_client: "ConversationClient",
+                           crud_intent: CrudIntentModel,
+                           llm_model: str) -> None:
         try:
-            llm_answer_crud_str = parsed_llm_answer.model_dump_json(indent=2)
+            llm_answer_crud_str = crud_intent.model_dump_json(indent=2)
             # Add LLM response to log
             create_new_log_entry(
-                llm_model=self.model,
+                llm_model=llm_model,
                 user_question=conversation_client.user_question or "",
                 backend_response="---",
                 llm_answer=llm_answer_crud_str,
@@ -99,6 +302,4 @@ class CrudIntentAssistant:
             )
         except Exception as error:
             trace_id = log_error(ErrorCode.LOG_ERROR_FOR_CRUD_INTENT_RESPONSE, exception=error)
-            raise APIError(ErrorCode.LOG_ERROR_FOR_CRUD_INTENT_RESPONSE, trace_id) from error
-
-        return parsed_llm_answer
\ No newline at end of file
+            raise APIError(ErrorCode.LOG_ERROR_FOR_CRUD_INTENT_RESPONSE, trace_id) from error
\ No newline at end of file
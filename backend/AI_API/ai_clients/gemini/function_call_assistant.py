@@ -1,4 +1,4 @@
-from ApartmentManager.backend.AI_API.general.json_serialisation import dumps_for_llm_prompt
+import asyncio
 import typing
 from google import genai
 from google.genai import types
@@ -9,9 +9,13 @@ if typing.TYPE_CHECKING:
 from ApartmentManager.backend.AI_API.general.envelopes.envelopes_api import build_data_answer, build_text_answer, AnswerSource, \
     EnvelopeApi
 from ApartmentManager.backend.AI_API.general.error_texts import ErrorCode, APIError
-from ApartmentManager.backend.AI_API.general.logger import log_error
-from ApartmentManager.backend.AI_API.general.prompting import Prompt
+from ApartmentManager.backend.AI_API.general.logger import raise_as_api_error
+from ApartmentManager.backend.AI_API.general.prompting import Prompt, compiled_prompt
 from ApartmentManager.backend.RESTFUL_API import execute
+from ApartmentManager.backend.AI_API.general.stage_timing import FUNCTION_CALL_LLM
+from ApartmentManager.backend.AI_API.general.metrics import PROMPT_USAGE
+from ApartmentManager.backend.AI_API.ai_clients.gemini.provider_call import call_generate_content, \
+    call_generate_content_async
 from requests.exceptions import RequestException
 
 class FunctionCallAssistant:
@@ -36,23 +40,98 @@ class FunctionCallAssistant:
         Retrieves a response from LLM with a proposal of function calling.
         Saves the user question to the conversation history.
         """
-        # Convert dict to the string with indentation so that LLM can read it better
-        system_prompt = dumps_for_llm_prompt(Prompt.GET_FUNCTION_CALL.value)
+        config_llm_function_call = self._prepare_function_call_request(conversation_client)
+
+        # Ask LLM to answer the user question with a function calling
+        llm_response_with_func_to_call = call_generate_content(self.client,
+                                                               model=self.model,
+                                                               config=config_llm_function_call,
+                                                               contents=self.session_contents,
+                                                               stage=FUNCTION_CALL_LLM)
+
+        return self._store_function_call_proposal(llm_response_with_func_to_call)
+
+    async def _define_potential_function_call_async(self,
+                                                    conversation_client: "ConversationClient") -> genai.types.Content:
+        """
+        Async version of _define_potential_function_call.
+        """
+        config_llm_function_call = self._prepare_function_call_request(conversation_client)
+
+        llm_response_with_func_to_call = await call_generate_content_async(self.client,
+                                                                           model=self.model,
+                                                                           config=config_llm_function_call,
+                                                                           contents=self.session_contents,
+                                                                           stage=FUNCTION_CALL_LLM)
+
+        return self._store_function_call_proposal(llm_response_with_func_to_call)
+
+    def propose_function_call(self, user_question: str) -> genai.types.Content:
+        """
+        Speculative version of _define_potential_function_call, runs while the CRUD intent is still detected.
+        The conversation history and the conversation client are not touched,
+        the proposal is placed in the history only if it is used, see try_call_function.
+        :param user_question: Question of the running turn.
+        :return: Proposal of the LLM (function call or text).
+        """
+        llm_response_with_func_to_call = call_generate_content(self.client,
+                                                               model=self.model,
+                                                               config=self._function_call_config(),
+                                                               contents=self._proposal_contents(user_question),
+                                                               stage=FUNCTION_CALL_LLM)
+
+        return llm_response_with_func_to_call.candidates[0].content
+
+    async def propose_function_call_async(self, user_question: str) -> genai.types.Content:
+        """
+        Async version of propose_function_call.
+        """
+        llm_response_with_func_to_call = await call_generate_content_async(self.client,
+                                                                           model=self.model,
+                                                                           config=self._function_call_config(),
+                                                                           contents=self._proposal_contents(user_question),
+                                                                           stage=FUNCTION_CALL_LLM)
+
+        return llm_response_with_func_to_call.candidates[0].content
+
+    def _proposal_contents(self, user_question: str) -> list[types.Content]:
+        """
+        The conversation history with the question of the running turn, the history itself is not changed.
+        """
+        user_part_content = types.Content(role="user", parts=[types.Part(text=user_question)])
+        return [*self.session_contents, user_part_content]
+
+    def _prepare_function_call_request(self, conversation_client: "ConversationClient") -> types.GenerateContentConfig:
+        """
+        Builds the configuration with the GET tool and adds the user question to the conversation history.
+        """
+        self._append_user_question(conversation_client)
+        return self._function_call_config()
+
+    def _append_user_question(self, conversation_client: "ConversationClient") -> None:
         conversation_client.system_prompt_name = Prompt.GET_FUNCTION_CALL.name
+        PROMPT_USAGE.inc((conversation_client.system_prompt_name,))
 
-        # Add the user prompt to the summary request to LLM
-        user_part = types.Part(text=conversation_client.user_question)
-        user_part_content = types.Content(
-            role="user",
-            parts=[user_part]
-        )
-        self.session_contents.append(user_part_content)
+        # Add the user prompt to the summary request to LLM (once per turn)
+        self.session_contents.append_user_message(conversation_client.user_question)
+
+    def _function_call_config(self) -> types.GenerateContentConfig:
+        """
+        Configuration of the proposal call with the GET tool.
+        """
+        # the prompt as a string, serialized once at import
+        system_prompt = compiled_prompt(Prompt.GET_FUNCTION_CALL)
 
         # Function declaration for GET
         func_get = types.FunctionDeclaration.from_callable(
             callable=execute.make_restful_api_get,
             client=self.client
         )
+        # Function declaration for GET of one page of a large list
+        func_get_page = types.FunctionDeclaration.from_callable(
+            callable=execute.make_restful_api_get_page,
+            client=self.client
+        )
         # TODO check if POST is relevant for other operations
         # Function declaration for POST
         func_post = types.FunctionDeclaration.from_callable(
@@ -61,7 +140,7 @@ class FunctionCallAssistant:
         )
 
         # Tools to choose different functions that LLM should propose
-        get_tool = types.Tool(function_declarations=[func_get])
+        get_tool = types.Tool(function_declarations=[func_get, func_get_page])
         #TODO check if POST is relevant for other operations
         post_tool = types.Tool(function_declarations=[func_post])
 
@@ -72,14 +151,14 @@ class FunctionCallAssistant:
             tools=[get_tool]
         )
 
-        # Ask LLM to answer the user question with a function calling
-        llm_response_with_func_to_call = self.client.models.generate_content(
-            model=self.model,
-            config=config_llm_function_call,
-            contents=self.session_contents
-        )
+        return config_llm_function_call
+
+    def _store_function_call_proposal(self,
+                                      llm_response_with_func_to_call: types.GenerateContentResponse) -> genai.types.Content:
+        """
+        Places the answer of the LLM in the conversation history.
+        """
         func_to_call = llm_response_with_func_to_call.candidates[0].content
-        # Place the answer of the LLM in the conversation history.
         self.session_contents.append(func_to_call)
 
         return func_to_call
@@ -93,10 +172,12 @@ class FunctionCallAssistant:
         :return: Object containing the SQL data to the LLM.
         """
         func_calling_result = None
-        try:
+        with raise_as_api_error(ErrorCode.LLM_ERROR_CALLING_FUNCTION_PROPOSED_BY_LLM,
+                                passthrough=(RequestException, genai_errors.APIError)):
             # Dictionary that maps the function name (str) with the function itself
             dispatch = {
                 execute.make_restful_api_get.__name__: execute.make_restful_api_get,
+                execute.make_restful_api_get_page.__name__: execute.make_restful_api_get_page,
                 execute.make_restful_api_post.__name__: execute.make_restful_api_post,
             }
 
@@ -120,16 +201,10 @@ class FunctionCallAssistant:
 
             # Add the actual result of the function execution back into the conversation history,
             # so the model can use it to generate the final response to the user in the human-like form.
-            self.session_contents.append(types.Content(role="assistant", parts=[function_response_part]))
+            # (Gemini expects the function response in the role "user")
+            self.session_contents.append(types.Content(role="user", parts=[function_response_part]))
 
             return func_calling_result
-        except RequestException:
-            raise
-        except genai_errors.APIError:
-            raise
-        except Exception as error:
-            trace_id = log_error(ErrorCode.LLM_ERROR_CALLING_FUNCTION_PROPOSED_BY_LLM, exception=error)
-            raise APIError(ErrorCode.LLM_ERROR_CALLING_FUNCTION_PROPOSED_BY_LLM, trace_id) from error
 
 
     @staticmethod
@@ -147,17 +222,69 @@ class FunctionCallAssistant:
                     return part.text
         return None
 
-    def try_call_function(self, conversation_client: "ConversationClient") -> EnvelopeApi:
+    def try_call_function(self,
+                          conversation_client: "ConversationClient",
+                          proposal: genai.types.Content = None) -> EnvelopeApi:
         """
         Gives the user a response using data, retrieved from a function, being called by LLM.
         If LLM decides not to call the function, the answer of the LLM is returned instead.
         :param conversation_client:
+        :param proposal: Proposal of a speculative propose_function_call, replaces the proposal call.
         :return: dict with function call as string or LLM answer as Content.
         """
         # STEP 1: get the potential function calling response
-        response_func_candidate = self._define_potential_function_call(conversation_client)
+        if proposal is not None:
+            response_func_candidate = self._commit_proposal(conversation_client, proposal)
+        else:
+            response_func_candidate = self._define_potential_function_call(conversation_client)
+
+        func_call_obj = FunctionCallAssistant._extract_function_call(response_func_candidate)
+
+        # STEP 2: the LLM model does the function call
+        func_calling_result = None
+        if func_call_obj:
+            func_calling_result = self._execute_function_call(func_call_obj)
+            conversation_client.emit_event("stage", {"name": "db_read_done"})
+
+        return self._build_function_call_envelope(response_func_candidate, func_call_obj, func_calling_result)
+
+    async def try_call_function_async(self,
+                                      conversation_client: "ConversationClient",
+                                      proposal: genai.types.Content = None) -> EnvelopeApi:
+        """
+        Async version of try_call_function.
+        The function call itself is a blocking HTTP request to the internal API, so it runs in a worker thread.
+        """
+        if proposal is not None:
+            response_func_candidate = self._commit_proposal(conversation_client, proposal)
+        else:
+            response_func_candidate = await self._define_potential_function_call_async(conversation_client)
+
+        func_call_obj = FunctionCallAssistant._extract_function_call(response_func_candidate)
 
-        # Try to extract a function call from the candidate response
+        func_calling_result = None
+        if func_call_obj:
+            func_calling_result = await asyncio.to_thread(self._execute_function_call, func_call_obj)
+            conversation_client.emit_event("stage", {"name": "db_read_done"})
+
+        return self._build_function_call_envelope(response_func_candidate, func_call_obj, func_calling_result)
+
+    def _commit_proposal(self,
+                         conversation_client: "ConversationClient",
+                         proposal: genai.types.Content) -> genai.types.Content:
+        """
+        Places the user question and the speculative proposal in the conversation history,
+        as if the proposal call was done now.
+        """
+        self._append_user_question(conversation_client)
+        self.session_contents.append(proposal)
+        return proposal
+
+    @staticmethod
+    def _extract_function_call(response_func_candidate: genai.types.Content) -> FunctionCall | None:
+        """
+        Tries to extract a function call from the candidate response.
+        """
         func_call_obj = None
         try:
             # functionCall object in an OpenAPI compatible schema specifying how to call one or
@@ -167,25 +294,24 @@ class FunctionCallAssistant:
         except Exception:
             pass # if no function call goes further, don't throw an exception!!!
 
-        # STEP 2: the LLM model does the function call
-        if func_call_obj:
-            print(f".... LLM want to call the function: {func_call_obj.name} with arguments: {func_call_obj.args}")
-
-            try:
-                # Execute the function with its parameters
-                # and save the function call result to the conversation history.
-                func_calling_result = self._do_call_function(func_call_obj)
-
-            except APIError:
-                raise
-            except genai_errors.APIError:
-                raise
-            except RequestException:
-                raise
-            except Exception as error:
-                trace_id = log_error(ErrorCode.LLM_ERROR_DOING_FUNCTION_CALL, exception=error)
-                raise APIError(ErrorCode.LLM_ERROR_DOING_FUNCTION_CALL, trace_id) from error
+        return func_call_obj
 
+    def _execute_function_call(self, func_call_obj: FunctionCall) -> dict:
+        """
+        Executes the function with its parameters
+        and saves the function call result to the conversation history.
+        """
+        print(f".... LLM want to call the function: {func_call_obj.name} with arguments: {func_call_obj.args}")
+
+        with raise_as_api_error(ErrorCode.LLM_ERROR_DOING_FUNCTION_CALL,
+                                passthrough=(APIError, genai_errors.APIError, RequestException)):
+            return self._do_call_function(func_call_obj)
+
+    def _build_function_call_envelope(self,
+                                      response_func_candidate: genai.types.Content,
+                                      func_call_obj: FunctionCall | None,
+                                      func_calling_result: dict | None) -> EnvelopeApi:
+        if func_call_obj:
             # STEP 3: Return envelope for the LLM answers
             # The answer can contain the data from the function call.
             result = build_data_answer(payload=func_calling_result or {},
@@ -203,4 +329,4 @@ class FunctionCallAssistant:
             result = build_text_answer(message=llm_answer_without_func_call,
                                        model=self.model,
                                        answer_source=AnswerSource.LLM)
-        return result
\ No newline at end of file
+        return result
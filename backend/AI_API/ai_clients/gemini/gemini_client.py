@@ -7,6 +7,8 @@ from ApartmentManager.backend.AI_API.ai_clients.gemini.write_actions_assistant i
 from google import genai
 from dotenv import load_dotenv
 from ApartmentManager.backend.AI_API.ai_clients.gemini.general_answer_assistant import GeneralAnswerAssistant
+from ApartmentManager.backend.AI_API.ai_clients.gemini.session_history import SessionHistory
+from ApartmentManager.backend.AI_API.ai_clients.gemini.prompt_cache import start_prompt_caches
 
 
 class GeminiClient:
@@ -17,20 +19,26 @@ class GeminiClient:
     the abstract base class LLM-Client and implements all required methods.
     """
 
-    def __init__(self, some_gemini_model: str):
-        # Load variables from environment
-        load_dotenv()
-        gemini_api_key = os.getenv("GEMINI_API_KEY")
-        self.client = genai.Client(api_key=gemini_api_key)
+    def __init__(self, some_gemini_model: str, client: genai.Client = None):
+        if client is None:
+            # Load variables from environment
+            load_dotenv()
+            gemini_api_key = os.getenv("GEMINI_API_KEY")
+            client = genai.Client(api_key=gemini_api_key)
+        # the client can be shared between conversations, it holds no conversation state
+        self.client = client
 
         # Specify the model to use
         self.model_name = some_gemini_model
 
+        # cached contents of the large static prompts, created once per process (if configured)
+        start_prompt_caches(self.client, self.model_name)
+
         # Specify creativity of LLM answers (0 ... 2)
         self.temperature = 0.3 # for precise answers
 
-        # volatile memory of the conversation
-        self.session_contents: list[types.Content] = []
+        # volatile memory of the conversation, compacted at the start of each turn
+        self.session_contents: SessionHistory = SessionHistory()
 
         # Create an object to let the LLM Model call functions
         self.function_call_assistant = FunctionCallAssistant(llm_client=self.client,
@@ -58,4 +66,17 @@ class GeminiClient:
                                                                model_name=self.model_name,
                                                                session_contents=self.session_contents,
                                                                temperature=self.temperature,
-                                                               function_call_service=self.function_call_assistant)
\ No newline at end of file
+                                                               function_call_service=self.function_call_assistant)
+
+    def start_turn(self, write_operation_active: bool) -> None:
+        """
+        Compacts the conversation history before the first LLM call of a turn.
+        :param write_operation_active: The collected data of the operation is kept verbatim.
+        """
+        self.session_contents.start_turn(fold=not write_operation_active)
+
+    def record_exchange(self, question: str, answer_text: str) -> None:
+        """
+        Places a turn answered without the LLM (a command of the chat) in the conversation history.
+        """
+        self.session_contents.append_exchange(question, answer_text)
@@ -1,3 +1,4 @@
+import asyncio
 import json
 import typing
 from google import genai
@@ -10,9 +11,15 @@ from ApartmentManager.backend.AI_API.general.envelopes.envelopes_api import Answ
 from ApartmentManager.backend.AI_API.ai_clients.gemini.function_call_assistant import FunctionCallAssistant
 from ApartmentManager.backend.AI_API.general.envelopes.envelopes_api import build_text_answer
 from ApartmentManager.backend.AI_API.general.error_texts import ErrorCode, APIError
-from ApartmentManager.backend.AI_API.general.logger import log_error
+from ApartmentManager.backend.AI_API.general.logger import log_error, raise_as_api_error
 from ApartmentManager.backend.SQL_API.logs.create_log import create_new_log_entry
 from ApartmentManager.backend.AI_API.general.json_serialisation import dumps_for_logging
+from ApartmentManager.backend.AI_API.general.stage_timing import GENERAL_ANSWER_LLM
+from ApartmentManager.backend.AI_API.general.metrics import PROMPT_USAGE
+from ApartmentManager.backend.AI_API.general.answer_cache import answer_cache_key, is_cacheable_question, \
+    get_cached_answer, put_cached_answer, ANSWER_CACHE_PROMPT_NAME
+from ApartmentManager.backend.AI_API.ai_clients.gemini.provider_call import call_generate_content, \
+    call_generate_content_async, call_generate_content_stream
 
 class GeneralAnswerAssistant:
     def __init__(self,
@@ -31,40 +38,28 @@ class GeneralAnswerAssistant:
         self.function_call_service = function_call_service
 
 
-    def answer_general_question(self, conversation_client: "ConversationClient") -> EnvelopeApi:
+    def answer_general_question(self,
+                                conversation_client: "ConversationClient",
+                                proposal: types.Content = None) -> EnvelopeApi:
         """
         Analyzes if the GET operation is required and performs the function call to retrieve the data from the databank.
         Then convert the data to the plain text.
         If no data bank calling was done, then it responds to the question directly.
         :param conversation_client:
-        :param system_prompt: System prompt with instructions for function calling.
+        :param proposal: Function call proposal made speculatively during the CRUD intent check, if any.
         :return: Data from the database as a dictionary.
         """
+        cache_key = self._answer_cache_key(conversation_client)
 
-        try:
-            # STEP 1: LLM generates an answer as dict with the possible function call inside using GET tool
-            func_call_data_or_llm_text_dict = self.function_call_service.try_call_function(conversation_client)
-
-            func_result_data_or_text = func_call_data_or_llm_text_dict.result
-
-            llm_answer_in_text_format = False
+        # STEP 1: LLM generates an answer as dict with the possible function call inside using GET tool
+        with self._calling_function():
+            func_call_data_or_llm_text_dict = self.function_call_service.try_call_function(conversation_client,
+                                                                                           proposal)
 
-            if isinstance(func_result_data_or_text, TextResult):
-                llm_answer_in_text_format = True
-
-        # catch a Gemini error
-        except genai_errors.APIError:
-            raise
-        except RequestException:
-            raise
-        except Exception as error:
-            trace_id = log_error(ErrorCode.ERROR_CALLING_FUNCTION, exception=error)
-            raise APIError(ErrorCode.ERROR_CALLING_FUNCTION, trace_id) from error
-
-        try:
+        with self._interpreting_function_call():
             # Scenario 1: LLM answered with plain text without function call,
             # or the result of the answer was the structured data.
-            if llm_answer_in_text_format:
+            if isinstance(func_call_data_or_llm_text_dict.result, TextResult):
                 # Returns the structured output or
                 # Dictionary with the reason why the LLM decided not to call a function.
                 result = func_call_data_or_llm_text_dict
@@ -74,14 +69,95 @@ class GeneralAnswerAssistant:
                 # LLM is interpreting the data from a function call to the human language.
                 # Dictionary with data for the interpretation is taken from the conversation history.
                 result = self.get_textual_llm_response(conversation_client)
-        # catch a Gemini error
-        except genai_errors.APIError:
-            raise
-        except Exception as error:
-            trace_id = log_error(ErrorCode.ERROR_INTERPRETING_THE_FUNCTION_CALL, exception=error)
-            raise APIError(ErrorCode.ERROR_INTERPRETING_THE_FUNCTION_CALL, trace_id) from error
 
         # STEP 2: Unified logging
+        self._store_general_answer(conversation_client, func_call_data_or_llm_text_dict, result, cache_key)
+        return result
+
+    async def answer_general_question_async(self,
+                                            conversation_client: "ConversationClient",
+                                            proposal: types.Content = None) -> EnvelopeApi:
+        """
+        Async version of answer_general_question for the ASGI serving mode.
+        """
+        cache_key = self._answer_cache_key(conversation_client)
+
+        with self._calling_function():
+            func_call_data_or_llm_text_dict = await self.function_call_service.try_call_function_async(conversation_client,
+                                                                                                       proposal)
+
+        with self._interpreting_function_call():
+            if isinstance(func_call_data_or_llm_text_dict.result, TextResult):
+                result = func_call_data_or_llm_text_dict
+            else:
+                result = await self.get_textual_llm_response_async(conversation_client)
+
+        # the log entry is an SQLite write, keep it off the event loop
+        await asyncio.to_thread(self._store_general_answer,
+                                conversation_client, func_call_data_or_llm_text_dict, result, cache_key)
+        return result
+
+    @staticmethod
+    def _calling_function():
+        # a Gemini or network error is raised as it is
+        return raise_as_api_error(ErrorCode.ERROR_CALLING_FUNCTION,
+                                  passthrough=(genai_errors.APIError, RequestException))
+
+    @staticmethod
+    def _interpreting_function_call():
+        return raise_as_api_error(ErrorCode.ERROR_INTERPRETING_THE_FUNCTION_CALL,
+                                  passthrough=(genai_errors.APIError,))
+
+    def _store_general_answer(self,
+                              conversation_client: "ConversationClient",
+                              func_call_data_or_llm_text_dict: EnvelopeApi,
+                              result: EnvelopeApi,
+                              cache_key: tuple | None) -> None:
+        """
+        Writes the answer to the log and to the answer cache.
+        """
+        self._log_general_answer(conversation_client, func_call_data_or_llm_text_dict, result)
+        if cache_key:
+            put_cached_answer(cache_key, result)
+
+    def answer_from_cache(self, conversation_client: "ConversationClient") -> EnvelopeApi | None:
+        """
+        Answers the question with the answer given to the same question since the last change of the database.
+        The question and the answer are placed in the conversation history like a new answer,
+        so the next questions can refer to them.
+        :return: The cached answer, None if the question has to be answered by the LLM.
+        """
+        cache_key = self._answer_cache_key(conversation_client)
+        result = get_cached_answer(cache_key) if cache_key else None
+        if result is None:
+            return None
+
+        answer_text = result.result.message
+        self.session_contents.append_exchange(conversation_client.user_question, answer_text)
+        if answer_text and isinstance(result.result, TextResult):
+            # a streaming client gets the whole text as one delta
+            conversation_client.emit_text_delta(answer_text)
+
+        create_new_log_entry(
+            llm_model=self.model,
+            user_question=conversation_client.user_question or "---",
+            backend_response="---",
+            llm_answer=result.model_dump_json(indent=2),
+            system_prompt_name=ANSWER_CACHE_PROMPT_NAME
+        )
+        return result
+
+    def _answer_cache_key(self, conversation_client: "ConversationClient") -> tuple | None:
+        if not is_cacheable_question(conversation_client.user_question):
+            return None
+        # the answer depends on the earlier turns of the session, not only on the question
+        return answer_cache_key("general", conversation_client.user_question, self.model,
+                                self.session_contents.context_digest())
+
+    def _log_general_answer(self,
+                            conversation_client: "ConversationClient",
+                            func_call_data_or_llm_text_dict: EnvelopeApi,
+                            result: EnvelopeApi) -> None:
         if isinstance(result, EnvelopeApi):
             llm_answer_str = result.model_dump_json(indent=2)
         else:
@@ -111,21 +187,32 @@ class GeneralAnswerAssistant:
             trace_id = log_error(ErrorCode.LOG_ERROR_FOR_FUNCTION_CALLING, exception=error)
             raise APIError(ErrorCode.LOG_ERROR_FOR_FUNCTION_CALLING, trace_id) from error
 
-        return result
-
 
     def get_textual_llm_response(self, conversation_client: "ConversationClient") -> EnvelopeApi:
-        # Add the user prompt to the summary request to LLM
-        user_part = types.Part(text=conversation_client.user_question)
-        user_part_content = types.Content(
-            role="user",
-            parts=[user_part]
-        )
-        self.session_contents.append(user_part_content)
+        self._append_user_question(conversation_client)
+
+        # the streaming endpoint listens, send the answer chunk by chunk
+        if conversation_client.event_sink:
+            return self.interpret_llm_response_from_conversation_stream(
+                system_prompt=conversation_client.system_prompt,
+                on_text_delta=conversation_client.emit_text_delta)
+
         result = self.interpret_llm_response_from_conversation(system_prompt=conversation_client.system_prompt)
 
         return result
 
+    async def get_textual_llm_response_async(self, conversation_client: "ConversationClient") -> EnvelopeApi:
+        self._append_user_question(conversation_client)
+        result = await self.interpret_llm_response_from_conversation_async(system_prompt=conversation_client.system_prompt)
+
+        return result
+
+    def _append_user_question(self, conversation_client: "ConversationClient") -> None:
+        PROMPT_USAGE.inc((conversation_client.system_prompt_name,))
+
+        # The function call assistant has already recorded the question of the turn, it is not sent twice
+        self.session_contents.append_user_message(conversation_client.user_question)
+
     def interpret_llm_response_from_conversation(self, system_prompt: str) -> EnvelopeApi:
         """
         Interprets the structured output data from the conversation history and
@@ -133,46 +220,86 @@ class GeneralAnswerAssistant:
         :param system_prompt:
         :return: Interpretation of a machine like response from the LLM (struct output).
         """
+        with self._interpreting_response():
+            llm_response_with_text_answer = call_generate_content(self.client,
+                                                                  model=self.model,
+                                                                  config=self._text_answer_config(system_prompt),
+                                                                  contents=self.session_contents,
+                                                                  stage=GENERAL_ANSWER_LLM)
+
+            return self._build_text_envelope(llm_response_with_text_answer.candidates[0].content)
+
+    def interpret_llm_response_from_conversation_stream(self,
+                                                        system_prompt: str,
+                                                        on_text_delta: typing.Callable[[str], None]) -> EnvelopeApi:
+        """
+        Streaming version of interpret_llm_response_from_conversation.
+        Every text chunk is passed to on_text_delta as soon as the model generates it,
+        the complete answer is returned as an envelope at the end.
+        """
+        with self._interpreting_response():
+            text_chunks = []
+            for chunk in call_generate_content_stream(self.client,
+                                                      model=self.model,
+                                                      config=self._text_answer_config(system_prompt),
+                                                      contents=self.session_contents,
+                                                      stage=GENERAL_ANSWER_LLM):
+                chunk_text = chunk.text
+                if chunk_text:
+                    text_chunks.append(chunk_text)
+                    on_text_delta(chunk_text)
+
+            text_answer = types.Content(role="model", parts=[types.Part(text="".join(text_chunks))])
 
+            return self._build_text_envelope(text_answer)
+
+    async def interpret_llm_response_from_conversation_async(self, system_prompt: str) -> EnvelopeApi:
+        """
+        Async version of interpret_llm_response_from_conversation.
+        """
+        with self._interpreting_response():
+            llm_response_with_text_answer = await call_generate_content_async(self.client,
+                                                                              model=self.model,
+                                                                              config=self._text_answer_config(system_prompt),
+                                                                              contents=self.session_contents,
+                                                                              stage=GENERAL_ANSWER_LLM)
+
+            return self._build_text_envelope(llm_response_with_text_answer.candidates[0].content)
+
+    @staticmethod
+    def _interpreting_response():
+        # an APIError of the answer or a Gemini error is raised as it is
+        return raise_as_api_error(ErrorCode.LLM_RESPONSE_INTERPRETATION_ERROR,
+                                  passthrough=(APIError, genai_errors.APIError))
+
+    def _text_answer_config(self, system_prompt: str) -> types.GenerateContentConfig:
         # Configuration of the LLM answer with a new system instruction
-        config_llm_text_answer = types.GenerateContentConfig(
+        return types.GenerateContentConfig(
             temperature=self.temperature, # for stable answers
             system_instruction=types.Part(text=system_prompt)
         )
 
+    def _build_text_envelope(self, text_answer: types.Content) -> EnvelopeApi:
+        """
+        Places the answer of the LLM in the conversation history and wraps its text into an envelope.
+        """
         llm_answer = None
-        try:
-            llm_response_with_text_answer = self.client.models.generate_content(
-                model=self.model,
-                config=config_llm_text_answer,
-                contents=self.session_contents
-            )
-            text_answer = llm_response_with_text_answer.candidates[0].content
-            # Place the answer of the LLM in the conversation history.
-            self.session_contents.append(text_answer)
-
-            if text_answer:
-                for part in text_answer.parts:
-                    # part can be text, function_call, thought_signature etc.
-                    if hasattr(part, "text") and part.text:
-                        llm_answer = part.text
-                        break
-
-            if llm_answer:
-                result = build_text_answer(message=llm_answer,
-                                           model=self.model,
-                                           answer_source=AnswerSource.LLM)
-            else:
-                trace_id = log_error(ErrorCode.LLM_ERROR_NO_TEXT_ANSWER)
-                raise APIError(ErrorCode.LLM_ERROR_NO_TEXT_ANSWER, trace_id)
+        # Place the answer of the LLM in the conversation history.
+        self.session_contents.append(text_answer)
 
-            return result
+        if text_answer:
+            for part in text_answer.parts:
+                # part can be text, function_call, thought_signature etc.
+                if hasattr(part, "text") and part.text:
+                    llm_answer = part.text
+                    break
 
-        except APIError:
-            raise
-        # catch a Gemini error
-        except genai_errors.APIError:
-            raise
-        except Exception as error:
-            trace_id = log_error(ErrorCode.LLM_RESPONSE_INTERPRETATION_ERROR, exception=error)
-            raise APIError(ErrorCode.LLM_RESPONSE_INTERPRETATION_ERROR, trace_id) from error
\ No newline at end of file
+        if llm_answer:
+            result = build_text_answer(message=llm_answer,
+                                       model=self.model,
+                                       answer_source=AnswerSource.LLM)
+        else:
+            trace_id = log_error(ErrorCode.LLM_ERROR_NO_TEXT_ANSWER)
+            raise APIError(ErrorCode.LLM_ERROR_NO_TEXT_ANSWER, trace_id)
+
+        return result
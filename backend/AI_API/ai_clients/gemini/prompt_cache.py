@@ -0,0 +1,141 @@
+"""
+Explicit prompt caching of Gemini.
+
+The CRUD intent and the write prompts are several KB of static instructions sent with every call.
+With EXPLICIT_PROMPT_CACHE the prompts of EXPLICIT_CACHED_PROMPTS are stored once as cached contents of the
+provider, a call refers to the cached content instead of sending the system instruction again.
+A background thread creates the cached contents when the first conversation starts and extends their TTL
+before it ends. Until a cached content is ready, or if it cannot be created (for example a prompt below the
+minimal size of the model), the calls send the system instruction as before.
+apartment_llm_tokens_total{kind="cached"} shows the input tokens served from the cache.
+"""
+import hashlib
+import threading
+import time
+from google import genai
+from google.genai import types
+from ApartmentManager.backend.AI_API.general import prompting
+from ApartmentManager.backend.AI_API.general.logger import log_info
+from ApartmentManager.backend.AI_API.general.metrics import REGISTRY, Counter
+from ApartmentManager.backend.config.server_config import EXPLICIT_PROMPT_CACHE, EXPLICIT_CACHED_PROMPTS, \
+    PROMPT_CACHE_TTL_SECONDS
+
+PROMPT_CACHE_REFRESHES = Counter(REGISTRY, "apartment_prompt_cache_refreshes",
+                                 "Cached contents of the prompts per outcome (created, extended, failed).",
+                                 ("prompt", "outcome"))
+
+# a cached content is not used in its last seconds, the call could reach the provider after the expiry
+_EXPIRY_MARGIN_SECONDS = 60
+
+# (model, hash of the system prompt) -> (name of the cached content, monotonic time of its expiry)
+_cached_contents: dict[tuple[str, str], tuple[str, float]] = {}
+_cached_contents_lock = threading.Lock()
+_started_models: set[str] = set()
+
+
+def start_prompt_caches(llm_client: genai.Client, model: str) -> None:
+    """
+    Starts the thread that creates and refreshes the cached contents of the model, once per process.
+    """
+    if not EXPLICIT_PROMPT_CACHE:
+        return
+
+    with _cached_contents_lock:
+        if model in _started_models:
+            return
+        _started_models.add(model)
+
+    threading.Thread(target=_keep_prompt_caches, args=(llm_client, model),
+                     name="prompt-cache", daemon=True).start()
+
+
+def cached_content_for(model: str, system_prompt: str) -> str | None:
+    """
+    :return: Name of the valid cached content holding the system prompt, None if the prompt has to be sent.
+    """
+    with _cached_contents_lock:
+        entry = _cached_contents.get((model, _prompt_hash(system_prompt)))
+
+    if entry is None or entry[1] <= time.monotonic():
+        return None
+    return entry[0]
+
+
+def system_instruction_config(model: str, system_prompt: str) -> dict:
+    """
+    Arguments of GenerateContentConfig for the system prompt: the cached content if there is one,
+    otherwise the system instruction itself.
+    """
+    cached_content = cached_content_for(model, system_prompt)
+    if cached_content:
+        return {"cached_content": cached_content}
+    return {"system_instruction": types.Part(text=system_prompt)}
+
+
+def _system_prompts_to_cache() -> list[tuple[str, str]]:
+    """
+    :return: (name, text) of the system prompts to cache. The CRUD intent is cached without its feedback block,
+             the block of the turn is sent as a message. A write prompt is cached also with the continuation check.
+    """
+    system_prompts = []
+    for prompt_name in EXPLICIT_CACHED_PROMPTS:
+        prompt = prompting.Prompt[prompt_name]
+        if prompt is prompting.Prompt.CRUD_INTENT:
+            system_prompts.append((prompt_name, prompting.crud_intent_instructions()))
+        elif prompt in (prompting.Prompt.CREATE_ENTITY, prompting.Prompt.UPDATE_ENTITY, prompting.Prompt.DELETE_ENTITY):
+            system_prompts.append((prompt_name, prompting.compiled_prompt(prompt)))
+            system_prompts.append((f"{prompt_name}_CONTINUATION", prompting.build_continuation_prompt(prompt)))
+        else:
+            # the prompts of the function calls go with their tools, they are not cached alone
+            log_info(f"Prompt {prompt_name} cannot be cached explicitly, it is sent with every call.")
+    return system_prompts
+
+
+def _keep_prompt_caches(llm_client: genai.Client, model: str) -> None:
+    system_prompts = _system_prompts_to_cache()
+    while True:
+        for name, system_prompt in system_prompts:
+            _refresh_cached_content(llm_client, model, name, system_prompt)
+        # extended in the middle of the TTL, a failed refresh has a second chance before the expiry
+        time.sleep(PROMPT_CACHE_TTL_SECONDS / 2)
+
+
+def _refresh_cached_content(llm_client: genai.Client, model: str, name: str, system_prompt: str) -> None:
+    key = (model, _prompt_hash(system_prompt))
+    ttl = f"{PROMPT_CACHE_TTL_SECONDS}s"
+    with _cached_contents_lock:
+        entry = _cached_contents.get(key)
+
+    cached_content_name = None
+    if entry is not None:
+        try:
+            llm_client.caches.update(name=entry[0], config=types.UpdateCachedContentConfig(ttl=ttl))
+            cached_content_name = entry[0]
+            PROMPT_CACHE_REFRESHES.inc((name, "extended"))
+        except Exception as error:
+            # expired or deleted on the provider side, a new one is created
+            log_info(f"Cached content of the prompt {name} cannot be extended: {error!r}")
+
+    if cached_content_name is None:
+        try:
+            cached_content = llm_client.caches.create(
+                model=model,
+                config=types.CreateCachedContentConfig(system_instruction=system_prompt,
+                                                       display_name=f"apartment-manager-{name.lower()}",
+                                                       ttl=ttl))
+            cached_content_name = cached_content.name
+            PROMPT_CACHE_REFRESHES.inc((name, "created"))
+        except Exception as error:
+            PROMPT_CACHE_REFRESHES.inc((name, "failed"))
+            log_info(f"Cached content of the prompt {name} cannot be created, it is sent with every call: {error!r}")
+            with _cached_contents_lock:
+                _cached_contents.pop(key, None)
+            return
+
+    expires_at = time.monotonic() + PROMPT_CACHE_TTL_SECONDS - _EXPIRY_MARGIN_SECONDS
+    with _cached_contents_lock:
+        _cached_contents[key] = (cached_content_name, expires_at)
+
+
+def _prompt_hash(system_prompt: str) -> str:
+    return hashlib.sha256(system_prompt.encode("utf-8")).hexdigest()
@@ -0,0 +1,250 @@
+import asyncio
+import time
+import httpx
+from google import genai
+from google.genai import types
+from google.genai import errors as genai_errors
+from ApartmentManager.backend.AI_API.general.deadline import stage_timeout, check_deadline, remaining_seconds, \
+    DeadlineExceeded
+from ApartmentManager.backend.AI_API.general.resilience import CircuitBreaker, backoff_delay, OPEN
+from ApartmentManager.backend.AI_API.general.stage_timing import stage_timer, record_stage
+from ApartmentManager.backend.AI_API.general.metrics import REGISTRY, LLM_CALL_SECONDS, Counter, Gauge
+from ApartmentManager.backend.config.server_config import LLM_MAX_ATTEMPTS, LLM_BACKOFF_BASE_SECONDS, \
+    LLM_BACKOFF_MAX_SECONDS, LLM_CIRCUIT_FAILURE_THRESHOLD, LLM_CIRCUIT_RESET_SECONDS
+
+# Answers of the provider that are worth a retry: the same request may succeed a moment later
+_TRANSIENT_STATUS_CODES = (408, 429, 500, 502, 503, 504)
+
+# One circuit for the process, all conversations share the HTTP client of the provider
+GEMINI_CIRCUIT = CircuitBreaker("Gemini",
+                                failure_threshold=LLM_CIRCUIT_FAILURE_THRESHOLD,
+                                reset_seconds=LLM_CIRCUIT_RESET_SECONDS)
+
+LLM_RETRIES = Counter(REGISTRY, "apartment_llm_retries",
+                      "Retries of LLM calls after transient provider errors.", ("assistant",))
+LLM_TOKENS = Counter(REGISTRY, "apartment_llm_tokens",
+                     "Tokens of the LLM calls per assistant and kind from usage_metadata: prompt (all input tokens), "
+                     "cached (input tokens served from the prompt cache) and output.", ("assistant", "kind"))
+LLM_CIRCUIT_OPEN = Gauge(REGISTRY, "apartment_llm_circuit_open",
+                         "1 while the circuit of the LLM provider is open.",
+                         lambda: 1 if GEMINI_CIRCUIT.state == OPEN else 0)
+
+
+def call_generate_content(llm_client: genai.Client,
+                          model: str,
+                          contents: list,
+                          config: types.GenerateContentConfig,
+                          stage: str) -> types.GenerateContentResponse:
+    """
+    Single place where the Gemini assistants do a blocking generate_content call.
+    Transient provider errors are retried with backoff, see _next_retry_delay.
+    :param llm_client: Gemini client.
+    :param model: Name of the model to call.
+    :param contents: Conversation contents sent to the model.
+    :param config: Configuration of the LLM call.
+    :param stage: Name of the stage (assistant) the call is measured as, see stage_timing and metrics.
+    :return: Raw response of the SDK.
+    """
+    with stage_timer(stage), LLM_CALL_SECONDS.time((stage,)):
+        retry_number = 0
+        while True:
+            attempt_config = _with_deadline(config)
+            GEMINI_CIRCUIT.before_call()
+            try:
+                response = llm_client.models.generate_content(model=model,
+                                                              contents=contents,
+                                                              config=attempt_config)
+            except Exception as error:
+                delay = _next_retry_delay(error, retry_number, stage)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                retry_number += 1
+                continue
+
+            GEMINI_CIRCUIT.record_success()
+            _record_usage(getattr(response, "usage_metadata", None), stage)
+            return response
+
+
+async def call_generate_content_async(llm_client: genai.Client,
+                                      model: str,
+                                      contents: list,
+                                      config: types.GenerateContentConfig,
+                                      stage: str) -> types.GenerateContentResponse:
+    """
+    Async counterpart of call_generate_content.
+    Uses the async transport of the SDK (client.aio), so the event loop is not blocked
+    while waiting for the model.
+    """
+    with stage_timer(stage), LLM_CALL_SECONDS.time((stage,)):
+        retry_number = 0
+        while True:
+            timeout = stage_timeout(None)
+            attempt_config = _with_deadline(config)
+            GEMINI_CIRCUIT.before_call()
+            try:
+                # the transport timeout limits single reads, wait_for the whole call
+                response = await asyncio.wait_for(llm_client.aio.models.generate_content(model=model,
+                                                                                         contents=contents,
+                                                                                         config=attempt_config),
+                                                  timeout)
+            except asyncio.CancelledError:
+                # the client went away or an outer wait_for expired, no verdict on the provider
+                GEMINI_CIRCUIT.release_trial()
+                raise
+            except Exception as error:
+                delay = _next_retry_delay(error, retry_number, stage)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                retry_number += 1
+                continue
+
+            GEMINI_CIRCUIT.record_success()
+            _record_usage(getattr(response, "usage_metadata", None), stage)
+            return response
+
+
+def call_generate_content_stream(llm_client: genai.Client,
+                                 model: str,
+                                 contents: list,
+                                 config: types.GenerateContentConfig,
+                                 stage: str):
+    """
+    Streaming counterpart of call_generate_content.
+    The stage is measured from the request until the last chunk is received.
+    A transient error is retried only before the first chunk, the caller may already have passed the chunks on.
+    :return: Iterator over the response chunks of the SDK.
+    """
+    start = time.perf_counter()
+    try:
+        retry_number = 0
+        received_chunk = False
+        # the chunks report the usage so far, the last one counts
+        usage_metadata = None
+        while True:
+            attempt_config = _with_deadline(config)
+            GEMINI_CIRCUIT.before_call()
+            try:
+                for chunk in llm_client.models.generate_content_stream(model=model,
+                                                                       contents=contents,
+                                                                       config=attempt_config):
+                    received_chunk = True
+                    usage_metadata = chunk.usage_metadata or usage_metadata
+                    # the model may keep sending slowly, stop between the chunks
+                    check_deadline()
+                    yield chunk
+            except DeadlineExceeded:
+                GEMINI_CIRCUIT.release_trial()
+                raise
+            except GeneratorExit:
+                # the caller stopped reading, the provider did answer
+                GEMINI_CIRCUIT.record_success()
+                raise
+            except Exception as error:
+                if received_chunk:
+                    # the chunks were passed on, the call is not repeated
+                    _record_failed_call(error)
+                    raise
+                delay = _next_retry_delay(error, retry_number, stage)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                retry_number += 1
+                continue
+
+            GEMINI_CIRCUIT.record_success()
+            _record_usage(usage_metadata, stage)
+            return
+    finally:
+        duration = time.perf_counter() - start
+        record_stage(stage, duration * 1000)
+        LLM_CALL_SECONDS.observe((stage,), duration)
+
+
+def _record_usage(usage_metadata: types.GenerateContentResponseUsageMetadata | None, stage: str) -> None:
+    """
+    Counts the tokens of a call, the cached tokens show the effect of the prompt caching (implicit and explicit).
+    """
+    if usage_metadata is None:
+        return
+    LLM_TOKENS.inc((stage, "prompt"), usage_metadata.prompt_token_count or 0)
+    LLM_TOKENS.inc((stage, "cached"), usage_metadata.cached_content_token_count or 0)
+    LLM_TOKENS.inc((stage, "output"), usage_metadata.candidates_token_count or 0)
+
+
+def _is_transient(error: Exception) -> bool:
+    if isinstance(error, genai_errors.APIError):
+        return error.code in _TRANSIENT_STATUS_CODES
+    # the request did not reach the provider or the answer did not come back
+    return isinstance(error, (httpx.TimeoutException, httpx.ConnectError))
+
+
+def _record_failed_call(error: Exception) -> bool:
+    """
+    Reports the failed call to the circuit breaker.
+    :return: True if the error is transient and the call may be retried.
+    :raise DeadlineExceeded: The call failed because the deadline of the request has passed.
+    """
+    try:
+        # a timeout caused by the deadline is reported as such and says nothing about the provider
+        check_deadline(error)
+    except DeadlineExceeded:
+        GEMINI_CIRCUIT.release_trial()
+        raise
+
+    if not _is_transient(error):
+        if isinstance(error, genai_errors.APIError):
+            # the provider answered (for example 400), it is not degraded
+            GEMINI_CIRCUIT.record_success()
+        else:
+            GEMINI_CIRCUIT.release_trial()
+        return False
+
+    GEMINI_CIRCUIT.record_failure()
+    return True
+
+
+def _next_retry_delay(error: Exception, retry_number: int, stage: str) -> float | None:
+    """
+    Reports the failed call to the circuit breaker (see _record_failed_call) and decides about a retry.
+    Only transient errors are retried, the request is the same and has no side effects.
+    :param error: Error of the failed call.
+    :param retry_number: Number of retries done so far.
+    :param stage: Stage of the call, label of the retry metric.
+    :return: Delay before the retry in seconds, None if the error has to be raised.
+    :raise DeadlineExceeded: The call failed because the deadline of the request has passed.
+    """
+    if not _record_failed_call(error):
+        return None
+
+    # no retry after the last attempt or when this failure opened the circuit
+    if retry_number + 1 >= LLM_MAX_ATTEMPTS or GEMINI_CIRCUIT.state == OPEN:
+        return None
+
+    delay = backoff_delay(retry_number, LLM_BACKOFF_BASE_SECONDS, LLM_BACKOFF_MAX_SECONDS)
+    remaining = remaining_seconds()
+    if remaining is not None and delay >= remaining:
+        # the retry would not finish within the budget of the request
+        return None
+
+    LLM_RETRIES.inc((stage,))
+    return delay
+
+
+def _with_deadline(config: types.GenerateContentConfig) -> types.GenerateContentConfig:
+    """
+    Passes the remaining budget of the chat request as HTTP timeout to the SDK.
+    Without a deadline the configuration is returned unchanged.
+    :raise DeadlineExceeded: The deadline has already passed.
+    """
+    timeout = stage_timeout(None)
+    if timeout is None:
+        return config
+
+    config = config or types.GenerateContentConfig()
+    http_options = config.http_options or types.HttpOptions()
+    # the SDK expects the timeout in milliseconds
+    http_options = http_options.model_copy(update={"timeout": max(1, int(timeout * 1000))})
+    return config.model_copy(update={"http_options": http_options})
@@ -0,0 +1,215 @@
+"""
+Conversation history of a Gemini conversation with a token budget.
+
+Every LLM call of a turn resends the whole history. Without a limit a long session gets slower and more
+expensive with every turn and finally exceeds the context of the model. At the start of each turn:
+- large function responses of the finished turns are replaced by a short note, the answer of the model
+  already interpreted them,
+- the oldest turns beyond the last HISTORY_VERBATIM_TURNS (or beyond HISTORY_TOKEN_BUDGET) are folded into
+  a rolling summary of the questions and answers, placed as the first message of the history.
+The tokens are estimated from the length of the contents (about 4 characters per token).
+
+The history is a ledger of turns: a user message is recorded once per turn, even if several assistants
+of the turn send it, and the turns of a write operation are tagged with its operation_id.
+An assistant takes the view it needs: the write assistant sees only the turns of its operation.
+"""
+import hashlib
+import json
+from google.genai import types
+from ApartmentManager.backend.AI_API.general.metrics import HISTORY_TOKENS_SAVED
+from ApartmentManager.backend.config.server_config import HISTORY_TOKEN_BUDGET, HISTORY_VERBATIM_TURNS, \
+    HISTORY_SUMMARY_MAX_CHARS, HISTORY_MAX_FUNCTION_RESPONSE_CHARS
+
+SUMMARY_TITLE = "Summary of the earlier conversation (oldest first):"
+# length of a question or an answer in the summary
+_SUMMARY_TEXT_CHARS = 200
+_CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(content: types.Content) -> int:
+    return len(content.model_dump_json(exclude_none=True)) // _CHARS_PER_TOKEN + 1
+
+
+class SessionHistory(list):
+    """
+    List of the contents of the conversation, shared by all assistants like a plain list.
+    ConversationClient marks the start of each turn with start_turn, which compacts the finished turns.
+    """
+    def __init__(self):
+        super().__init__()
+        # indices of the first content of each turn, the summary (if any) is before the first turn
+        self._turn_starts: list[int] = []
+        # operation_id of the write operation of each turn, None for the other turns
+        self._turn_tags: list[str | None] = []
+        self._summary_lines: list[str] = []
+        self._has_summary = False
+        # estimated tokens of the contents removed or shortened so far, not resent by any later call
+        self.saved_tokens = 0
+
+    def start_turn(self, fold: bool = True) -> None:
+        """
+        Compacts the finished turns and marks the start of a new turn.
+        :param fold: False while a write operation collects data, its data is in the answers of the
+                     previous turns and must stay verbatim. Function responses are shortened anyway.
+        """
+        turn_ranges = [turn_range for turn_range in self._turn_ranges() if turn_range[0] < turn_range[1]]
+        turns = [self._drop_interpreted_function_responses(self[start:end]) for start, end, _ in turn_ranges]
+        tags = [tag for _, _, tag in turn_ranges]
+
+        if fold:
+            while turns and (len(turns) > HISTORY_VERBATIM_TURNS or self._estimate(turns) > HISTORY_TOKEN_BUDGET):
+                self._summarize_turn(turns.pop(0))
+                tags.pop(0)
+
+        self._rebuild(turns, tags)
+        self._turn_starts.append(len(self))
+        self._turn_tags.append(None)
+        HISTORY_TOKENS_SAVED.observe((), self.saved_tokens)
+
+    def append_user_message(self, text: str) -> None:
+        """
+        Records a user message of the running turn, a message the turn already has is not added again.
+        """
+        current_turn_start = self._turn_ranges()[-1][0]
+        if any(content.role == "user" and self._text(content) == text for content in self[current_turn_start:]):
+            return
+        self.append(types.Content(role="user", parts=[types.Part(text=text)]))
+
+    def append_exchange(self, question: str, answer_text: str) -> None:
+        """
+        Records a turn answered without an LLM call (a cached answer or a command), so the next questions
+        can refer to it.
+        """
+        self.append_user_message(question)
+        if answer_text:
+            self.append(types.Content(role="model", parts=[types.Part(text=answer_text)]))
+
+    def tag_turn(self, operation_id: str | None) -> None:
+        """
+        Marks the running turn as a turn of the write operation.
+        """
+        if not self._turn_tags:
+            self._turn_starts.append(0)
+            self._turn_tags.append(None)
+        self._turn_tags[-1] = operation_id
+
+    def view(self, operation_id: str = None) -> list[types.Content]:
+        """
+        Contents an assistant sends to the LLM.
+        :param operation_id: Only the turns of this write operation and the running turn, the whole history if None.
+        """
+        if not operation_id:
+            return self
+
+        turn_ranges = self._turn_ranges()
+        contents = []
+        for index, (start, end, tag) in enumerate(turn_ranges):
+            if tag == operation_id or index == len(turn_ranges) - 1:
+                contents.extend(self[start:end])
+        return contents
+
+    def context_digest(self) -> str:
+        """
+        Hash of the contents before the running turn (the summary and the finished turns).
+        A question like "and the second one?" is answered from them, two sessions share an answer
+        only if they have the same context.
+        """
+        context_end = self._turn_ranges()[-1][0]
+        digest = hashlib.sha256()
+        for content in self[:context_end]:
+            digest.update(content.model_dump_json(exclude_none=True).encode("utf-8"))
+        return digest.hexdigest()
+
+    def rollback(self, length: int) -> None:
+        """
+        Removes the contents added after the history had the given length.
+        A running turn left empty is no longer a turn of its write operation.
+        """
+        del self[length:]
+        if self._turn_starts and self._turn_starts[-1] >= length:
+            self._turn_tags[-1] = None
+
+    def _turn_ranges(self) -> list[tuple[int, int, str | None]]:
+        """
+        :return: (start, end, tag) of each turn, the last one is the running turn.
+        """
+        # contents appended without start_turn count as one turn
+        first_turn_start = 1 if self._has_summary else 0
+        marked = [(start, tag) for start, tag in zip(self._turn_starts, self._turn_tags) if first_turn_start <= start]
+        if not marked or marked[0][0] > first_turn_start:
+            marked.insert(0, (first_turn_start, None))
+
+        ends = [start for start, _ in marked[1:]] + [len(self)]
+        return [(start, max(start, end), tag) for (start, tag), end in zip(marked, ends)]
+
+    def _drop_interpreted_function_responses(self, turn: list[types.Content]) -> list[types.Content]:
+        compacted = []
+        for content in turn:
+            parts = content.parts or []
+            if any(part.function_response and self._is_large(part.function_response) for part in parts):
+                before = estimate_tokens(content)
+                content = types.Content(role=content.role, parts=[self._shorten_part(part) for part in parts])
+                self.saved_tokens += before - estimate_tokens(content)
+            compacted.append(content)
+        return compacted
+
+    @staticmethod
+    def _is_large(function_response: types.FunctionResponse) -> bool:
+        return len(json.dumps(function_response.response, default=str)) > HISTORY_MAX_FUNCTION_RESPONSE_CHARS
+
+    def _shorten_part(self, part: types.Part) -> types.Part:
+        if not part.function_response or not self._is_large(part.function_response):
+            return part
+
+        result = (part.function_response.response or {}).get("result")
+        rows = f"{len(result)} entries, " if isinstance(result, list) else ""
+        return types.Part.from_function_response(
+            name=part.function_response.name,
+            response={"result": f"Omitted ({rows}already answered), call the function again for the data."})
+
+    def _summarize_turn(self, turn: list[types.Content]) -> None:
+        self.saved_tokens += self._estimate([turn])
+
+        question = next((self._text(content) for content in turn
+                         if content.role == "user" and self._text(content)), None)
+        answer = next((self._text(content) for content in reversed(turn)
+                       if content.role == "model" and self._text(content)), None)
+        if question:
+            self._summary_lines.append(f"User: {question[:_SUMMARY_TEXT_CHARS]}"
+                                       f" | Assistant: {(answer or '-')[:_SUMMARY_TEXT_CHARS]}")
+
+        # rolling summary, the oldest lines go first
+        while self._summary_lines and sum(len(line) + 1 for line in self._summary_lines) > HISTORY_SUMMARY_MAX_CHARS:
+            self._summary_lines.pop(0)
+
+    def _rebuild(self, turns: list[list[types.Content]], tags: list[str | None]) -> None:
+        old_summary_tokens = estimate_tokens(self[0]) if self._has_summary else 0
+        self._has_summary = bool(self._summary_lines)
+        contents = []
+        if self._has_summary:
+            summary = types.Content(role="user",
+                                    parts=[types.Part(text="\n".join([SUMMARY_TITLE, *self._summary_lines]))])
+            contents.append(summary)
+            # the summary is resent instead of the folded turns
+            self.saved_tokens -= estimate_tokens(summary) - old_summary_tokens
+        else:
+            self.saved_tokens += old_summary_tokens
+
+        self._turn_starts = []
+        self._turn_tags = []
+        for turn, tag in zip(turns, tags):
+            self._turn_starts.append(len(contents))
+            self._turn_tags.append(tag)
+            contents.extend(turn)
+        self[:] = contents
+
+    @staticmethod
+    def _estimate(turns: list[list[types.Content]]) -> int:
+        return sum(estimate_tokens(content) for turn in turns for content in turn)
+
+    @staticmethod
+    def _text(content: types.Content) -> str | None:
+        for part in content.parts or []:
+            if part.text:
+                return part.text
+        return None
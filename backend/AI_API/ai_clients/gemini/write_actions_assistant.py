@@ -1,4 +1,3 @@
-import json
 import typing
 
 from google import genai
@@ -8,10 +7,18 @@ if typing.TYPE_CHECKING:
     from ApartmentManager.backend.AI_API.general.conversation_client import ConversationClient
 from ApartmentManager.backend.AI_API.ai_clients.gemini.crud_intent_assistant import CrudIntentAssistant
 from ApartmentManager.backend.AI_API.ai_clients.gemini.function_call_assistant import FunctionCallAssistant
+from ApartmentManager.backend.AI_API.general.stage_timing import WRITE_COLLECT_LLM
+from ApartmentManager.backend.AI_API.general.metrics import PROMPT_USAGE
+from ApartmentManager.backend.AI_API.ai_clients.gemini.provider_call import call_generate_content, \
+    call_generate_content_async, call_generate_content_stream
+from ApartmentManager.backend.AI_API.ai_clients.gemini.prompt_cache import system_instruction_config
 from ApartmentManager.backend.AI_API.general.envelopes.envelopes_business_logic \
     import get_json_schema, validate_model, CollectCreate
 from ApartmentManager.backend.AI_API.general.error_texts import ErrorCode, APIError
-from ApartmentManager.backend.AI_API.general.logger import log_error
+from ApartmentManager.backend.AI_API.general.logger import log_error, raise_as_api_error
+from ApartmentManager.backend.AI_API.general.streaming import JsonStringFieldStream
+from ApartmentManager.backend.AI_API.general.structured_output_repair import load_structured_output, \
+    coerce_structured_output
 
 class WriteActionsAssistant:
     def __init__(self,
@@ -32,58 +39,143 @@ class WriteActionsAssistant:
         self.function_call = function_call
 
 
-    def do_llm_call(self, conversation_client: "ConversationClient", json_schema: dict) -> dict:
+    def do_llm_call(self,
+                    conversation_client: "ConversationClient",
+                    json_schema: dict,
+                    repair_prompt: str = None) -> dict:
         """
         Request a structured response that conforms to the schema.
         :param conversation_client:
         :param json_schema:
-        :param system_prompt: Instructions how the LLM model should respond.
-        :param user_prompt: Question from the user
+        :param repair_prompt: Validation errors of the previous answer, sent instead of the user question.
         :return:
         """
-        try:
-            json_config = types.GenerateContentConfig(
-                response_mime_type="application/json",
-                response_schema=json_schema,
-                temperature=self.temperature,
-                system_instruction=types.Part(text=conversation_client.system_prompt)
-            )
-
-            # Add the user prompt to the summary request to LLM
-            user_part = types.Part(text=conversation_client.user_question)
-            user_part_content = types.Content(
-                role="user",
-                parts=[user_part]
-            )
-            self.session_contents.append(user_part_content)
+        # a Gemini error is raised as it is
+        with raise_as_api_error(ErrorCode.LLM_ERROR_RETRIEVING_STRUCTURED_CRUD_RESPONSE,
+                                passthrough=(genai_errors.APIError,)):
+            json_config = self._prepare_structured_request(conversation_client, json_schema, repair_prompt)
+
+            # the streaming endpoint listens, send the comment for the user while the JSON is generated
+            # (a repaired answer is not streamed, its comment would be appended to the first one)
+            if conversation_client.event_sink and repair_prompt is None:
+                return self._stream_structured_response(self._operation_view(conversation_client),
+                                                        json_config,
+                                                        json_schema,
+                                                        conversation_client.emit_text_delta)
 
             # get LLM response with possible JSON output
-            response_content = self.llm_client.models.generate_content(
-                model=self.model,
-                config=json_config,
-                contents=self.session_contents)
-
-            # Append the model's response to the session history
-            if response_content.candidates and response_content.candidates[0].content:
-                self.session_contents.append(response_content.candidates[0].content)
-
-            try:
-                # Scenario 1: SDK has the parsed version of the answer, get it
-                llm_response = getattr(response_content, "parsed", None)
-
-                # Scenario 2: SDK does not have the parsed version of the answer
-                if llm_response is None:
-                    llm_answer_text = response_content.candidates[0].content.parts[0].text
-                    llm_response = json.loads(llm_answer_text)
-
-                return llm_response
-
-            except Exception as error:
-                trace_id = log_error(ErrorCode.LLM_ERROR_PARSING_CRUD_ACTION, exception=error)
-                raise APIError(ErrorCode.LLM_ERROR_PARSING_CRUD_ACTION, trace_id) from error
-        # catch a Gemini error
-        except genai_errors.APIError:
-            raise
+            response_content = call_generate_content(self.llm_client,
+                                                     model=self.model,
+                                                     config=json_config,
+                                                     contents=self._operation_view(conversation_client),
+                                                     stage=WRITE_COLLECT_LLM)
+
+            return self._process_structured_response(response_content, json_schema)
+
+    async def do_llm_call_async(self,
+                                conversation_client: "ConversationClient",
+                                json_schema: dict,
+                                repair_prompt: str = None) -> dict:
+        """
+        Async version of do_llm_call for the ASGI serving mode.
+        """
+        with raise_as_api_error(ErrorCode.LLM_ERROR_RETRIEVING_STRUCTURED_CRUD_RESPONSE,
+                                passthrough=(genai_errors.APIError,)):
+            json_config = self._prepare_structured_request(conversation_client, json_schema, repair_prompt)
+
+            response_content = await call_generate_content_async(self.llm_client,
+                                                                 model=self.model,
+                                                                 config=json_config,
+                                                                 contents=self._operation_view(conversation_client),
+                                                                 stage=WRITE_COLLECT_LLM)
+
+            return self._process_structured_response(response_content, json_schema)
+
+    def _prepare_structured_request(self,
+                                    conversation_client: "ConversationClient",
+                                    json_schema: dict,
+                                    repair_prompt: str = None) -> types.GenerateContentConfig:
+        """
+        Builds the configuration of the structured LLM call and
+        adds the user question (or the repair prompt) to the conversation history.
+        """
+        PROMPT_USAGE.inc((conversation_client.system_prompt_name,))
+        json_config = types.GenerateContentConfig(
+            response_mime_type="application/json",
+            response_schema=json_schema,
+            temperature=self.temperature,
+            # the write prompts may be in the cache of the provider, see prompt_cache
+            **system_instruction_config(self.model, conversation_client.system_prompt)
+        )
+
+        # Add the user prompt to the summary request to LLM (once per turn),
+        # the turn belongs to the write operation
+        self.session_contents.tag_turn(conversation_client.operation_id)
+        self.session_contents.append_user_message(repair_prompt or conversation_client.user_question)
+
+        return json_config
+
+    def _operation_view(self, conversation_client: "ConversationClient") -> list[types.Content]:
+        """
+        The data of the write operation is collected in its own turns, the other turns are not sent.
+        """
+        return self.session_contents.view(conversation_client.operation_id)
+
+    def _stream_structured_response(self,
+                                    contents: list[types.Content],
+                                    json_config: types.GenerateContentConfig,
+                                    json_schema: dict,
+                                    on_text_delta: typing.Callable[[str], None]) -> dict:
+        """
+        Streams the structured answer and passes the decoded characters of its 'comment' field to on_text_delta.
+        :return: The complete JSON answer as a dictionary.
+        """
+        comment_stream = JsonStringFieldStream("comment")
+        text_chunks = []
+        for chunk in call_generate_content_stream(self.llm_client,
+                                                  model=self.model,
+                                                  config=json_config,
+                                                  contents=contents,
+                                                  stage=WRITE_COLLECT_LLM):
+            chunk_text = chunk.text
+            if chunk_text:
+                text_chunks.append(chunk_text)
+                comment_delta = comment_stream.feed(chunk_text)
+                if comment_delta:
+                    on_text_delta(comment_delta)
+
+        llm_answer_text = "".join(text_chunks)
+        # Append the model's response to the session history
+        self.session_contents.append(types.Content(role="model", parts=[types.Part(text=llm_answer_text)]))
+
+        try:
+            return load_structured_output(llm_answer_text, json_schema, source=WRITE_COLLECT_LLM)
+        except Exception as error:
+            trace_id = log_error(ErrorCode.LLM_ERROR_PARSING_CRUD_ACTION, exception=error)
+            raise APIError(ErrorCode.LLM_ERROR_PARSING_CRUD_ACTION, trace_id) from error
+
+    def _process_structured_response(self,
+                                     response_content: types.GenerateContentResponse,
+                                     json_schema: dict) -> dict:
+        """
+        Saves the model answer to the conversation history and extracts the JSON from it.
+        Small glitches of the JSON are repaired locally, see structured_output_repair.
+        """
+        # Append the model's response to the session history
+        if response_content.candidates and response_content.candidates[0].content:
+            self.session_contents.append(response_content.candidates[0].content)
+
+        try:
+            # Scenario 1: SDK has the parsed version of the answer, get it
+            llm_response = getattr(response_content, "parsed", None)
+
+            # Scenario 2: SDK does not have the parsed version of the answer
+            if llm_response is None:
+                llm_answer_text = response_content.candidates[0].content.parts[0].text
+                return load_structured_output(llm_answer_text, json_schema, source=WRITE_COLLECT_LLM)
+
+            return coerce_structured_output(llm_response, json_schema, source=WRITE_COLLECT_LLM)
+
         except Exception as error:
-            trace_id = log_error(ErrorCode.LLM_ERROR_RETRIEVING_STRUCTURED_CRUD_RESPONSE, exception=error)
-            raise APIError(ErrorCode.LLM_ERROR_RETRIEVING_STRUCTURED_CRUD_RESPONSE, trace_id) from error
+            trace_id = log_error(ErrorCode.LLM_ERROR_PARSING_CRUD_ACTION, exception=error)
+            raise APIError(ErrorCode.LLM_ERROR_PARSING_CRUD_ACTION, trace_id) from error
@@ -0,0 +1,174 @@
+"""
+Admission control of the chat endpoints.
+
+A chat turn holds the conversation lock, the LLM calls and the SQLite work for seconds.
+Only a limited number of turns run at the same time, the next ones wait in a bounded FIFO queue.
+A request is rejected with HTTP 429 and Retry-After when the queue is full
+or when it waited longer than the maximal queue time.
+
+The same controller serves the Flask threads (admit) and the ASGI handler (admit_async),
+so both serving modes share one limit.
+"""
+import asyncio
+import threading
+from collections import deque
+from contextlib import contextmanager, asynccontextmanager
+from ApartmentManager.backend.AI_API.general.error_texts import APIError, ErrorCode
+from ApartmentManager.backend.AI_API.general.logger import log_error
+from ApartmentManager.backend.AI_API.general.metrics import REGISTRY, Counter, Gauge
+from ApartmentManager.backend.config.server_config import MAX_CONCURRENT_CHAT_TURNS, MAX_QUEUED_CHAT_TURNS, \
+    MAX_CHAT_QUEUE_SECONDS, CHAT_RETRY_AFTER_SECONDS
+
+
+class AdmissionRejected(APIError):
+    """
+    The chat request was not admitted, the client should retry after retry_after seconds.
+    """
+    def __init__(self, error_code_obj, trace_id=None, retry_after: int = CHAT_RETRY_AFTER_SECONDS):
+        super().__init__(error_code_obj, trace_id)
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    def __init__(self, notify):
+        self.notify = notify # wakes up the waiting thread or task
+        self.granted = False # the slot of a finished turn was handed over to this waiter
+
+
+class AdmissionController:
+    def __init__(self, max_in_flight: int, max_queued: int, max_queue_seconds: float):
+        self.max_in_flight = max_in_flight
+        self.max_queued = max_queued
+        self.max_queue_seconds = max_queue_seconds
+
+        self._in_flight = 0
+        self._waiters: deque[_Waiter] = deque()
+        self._lock = threading.Lock()
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    def acquire(self) -> None:
+        """
+        Takes a slot for one chat turn, waits in the queue if all slots are taken.
+        Must be followed by release(), also if the turn fails.
+        """
+        event = threading.Event()
+        waiter = _Waiter(event.set)
+        if self._enter_or_enqueue(waiter):
+            return
+
+        event.wait(self.max_queue_seconds)
+        self._leave_queue(waiter)
+
+    async def acquire_async(self) -> None:
+        """
+        Async counterpart of acquire(), the event loop is not blocked while waiting.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        # release() may run in a Flask thread, the future is resolved in its own loop
+        waiter = _Waiter(lambda: loop.call_soon_threadsafe(_resolve, future))
+        if self._enter_or_enqueue(waiter):
+            return
+
+        try:
+            await asyncio.wait_for(asyncio.shield(future), self.max_queue_seconds)
+        except asyncio.TimeoutError:
+            pass
+        except asyncio.CancelledError:
+            # the client went away while waiting, the slot must not get lost
+            with self._lock:
+                granted = waiter.granted
+                if not granted:
+                    self._waiters.remove(waiter)
+            if granted:
+                self.release()
+            raise
+        self._leave_queue(waiter)
+
+    def release(self) -> None:
+        """
+        Frees the slot of a finished turn, the oldest waiter takes it over.
+        """
+        with self._lock:
+            if self._waiters:
+                waiter = self._waiters.popleft()
+                waiter.granted = True
+                waiter.notify()
+            else:
+                self._in_flight -= 1
+
+    @contextmanager
+    def admit(self):
+        """
+        Runs the block as one admitted chat turn.
+        :raise AdmissionRejected: The queue is full or the request waited too long.
+        """
+        self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    @asynccontextmanager
+    async def admit_async(self):
+        """
+        Async counterpart of admit().
+        """
+        await self.acquire_async()
+        try:
+            yield
+        finally:
+            self.release()
+
+    def _enter_or_enqueue(self, waiter: _Waiter) -> bool:
+        """
+        :return: True if a slot was free, False if the waiter was put into the queue.
+        """
+        with self._lock:
+            # the queue is FIFO, a new request does not overtake the waiting ones
+            if self._in_flight < self.max_in_flight and not self._waiters:
+                self._in_flight += 1
+                return True
+
+            if len(self._waiters) < self.max_queued:
+                self._waiters.append(waiter)
+                return False
+
+        CHAT_REJECTED.inc(("queue_full",))
+        trace_id = log_error(ErrorCode.FLASK_ERROR_TOO_MANY_CHAT_REQUESTS)
+        raise AdmissionRejected(ErrorCode.FLASK_ERROR_TOO_MANY_CHAT_REQUESTS, trace_id)
+
+    def _leave_queue(self, waiter: _Waiter) -> None:
+        with self._lock:
+            # a slot handed over right at the timeout is still taken
+            if waiter.granted:
+                return
+            self._waiters.remove(waiter)
+
+        CHAT_REJECTED.inc(("queue_timeout",))
+        trace_id = log_error(ErrorCode.FLASK_ERROR_CHAT_QUEUE_TIMEOUT)
+        raise AdmissionRejected(ErrorCode.FLASK_ERROR_CHAT_QUEUE_TIMEOUT, trace_id)
+
+
+def _resolve(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+CHAT_ADMISSION = AdmissionController(max_in_flight=MAX_CONCURRENT_CHAT_TURNS,
+                                     max_queued=MAX_QUEUED_CHAT_TURNS,
+                                     max_queue_seconds=MAX_CHAT_QUEUE_SECONDS)
+
+CHAT_IN_FLIGHT = Gauge(REGISTRY, "apartment_chat_in_flight",
+                       "Chat turns running at the moment.", lambda: CHAT_ADMISSION.in_flight)
+CHAT_QUEUED = Gauge(REGISTRY, "apartment_chat_queued",
+                    "Chat requests waiting for a free slot.", lambda: CHAT_ADMISSION.queued)
+CHAT_REJECTED = Counter(REGISTRY, "apartment_chat_rejected",
+                        "Chat requests rejected with HTTP 429.", ("reason",))
@@ -0,0 +1,89 @@
+"""
+Cache of the answers to read-only questions.
+
+Staff ask the same questions again and again ("how many apartments are free?"), the answer changes only
+if the rental database changes. An answer is stored under the normalized question, the model name, the
+context of the conversation and the version of the rental database (see table_versions).
+A general answer may refer to the earlier turns ("and the second one?"), it is shared only between sessions
+with the same earlier turns, usually sessions asking it as their first question. Every create/update/delete bumps the version and
+drops all cached answers, so a stale answer is never returned.
+The cache lives in the memory of the server process. The version is read from the database, an answer cached
+before a write of another worker process (or outside the app) is stored under an old version and not returned.
+"""
+import re
+import threading
+from collections import OrderedDict
+from ApartmentManager.backend.AI_API.general.envelopes.envelopes_api import EnvelopeApi
+from ApartmentManager.backend.AI_API.general.metrics import ANSWER_CACHE_LOOKUPS
+from ApartmentManager.backend.SQL_API.rental.table_versions import get_database_version, add_change_listener
+from ApartmentManager.backend.config.server_config import MAX_CACHED_ANSWERS
+
+# log name of the turns answered from the cache
+ANSWER_CACHE_PROMPT_NAME = "ANSWER_CACHE"
+
+_WHITESPACE = re.compile(r"\s+")
+
+# (kind, normalized question, model, context digest, database version) -> answer
+_answers: OrderedDict[tuple, EnvelopeApi] = OrderedDict()
+_answers_lock = threading.Lock()
+
+
+def normalize_question(question: str) -> str:
+    """
+    Lower case, single spaces and no closing punctuation, "How many apartments?" and "how many  apartments"
+    share the cached answer.
+    """
+    return _WHITESPACE.sub(" ", question).strip().rstrip("?!. ").lower()
+
+
+def is_cacheable_question(question: str | None) -> bool:
+    # the feedback of the backend after an error depends on the failed answer, not on the question
+    return bool(question) and not question.startswith("Backend")
+
+
+def answer_cache_key(kind: str, question: str, model_name: str, context_digest: str = "") -> tuple:
+    """
+    Builds the key with the current database version. Take the key before reading the data:
+    if a write happens in between, the answer is stored under the old version and never returned.
+    :param kind: "general" for the general answer, "show" for the list of the entities.
+    :param context_digest: Hash of the earlier turns the answer depends on, empty if it does not depend on them.
+    """
+    return kind, normalize_question(question), model_name, context_digest, get_database_version()
+
+
+def get_cached_answer(cache_key: tuple) -> EnvelopeApi | None:
+    """
+    :return: The cached answer, None if the question was not answered with this database version.
+    """
+    with _answers_lock:
+        answer = _answers.get(cache_key)
+        if answer is not None:
+            _answers.move_to_end(cache_key)
+
+    ANSWER_CACHE_LOOKUPS.inc((cache_key[0], "miss" if answer is None else "hit"))
+    # the envelopes are not changed after they are built, the same object is returned to all callers
+    return answer
+
+
+def put_cached_answer(cache_key: tuple, answer: EnvelopeApi) -> None:
+    if not answer or cache_key[-1] != get_database_version():
+        # written during the answer, the data of the answer may be old
+        return
+
+    with _answers_lock:
+        _answers[cache_key] = answer
+        _answers.move_to_end(cache_key)
+        while len(_answers) > MAX_CACHED_ANSWERS:
+            _answers.popitem(last=False)
+
+
+def invalidate_answer_cache(table_name: str = None) -> None:
+    """
+    Drops all cached answers. Called after every change of the rental database,
+    a general answer may combine several tables, so the whole cache is dropped.
+    """
+    with _answers_lock:
+        _answers.clear()
+
+
+add_change_listener(invalidate_answer_cache)
@@ -0,0 +1,194 @@
+"""
+Command grammar of the chat for the routine requests of the staff.
+
+    /show <entity>                        all entities, for example "/show apartments"
+    /show <entity> <id>                   one entity, for example "/show person 12"
+    /create <entity> key=value ...        for example "/create person first_name=Anna last_name=Weber"
+    /update <entity> <id> key=value ...   for example "/update tenancy 7 deposit=1500"
+    /delete <entity> <id>                 for example "/delete tenancy 7"
+
+<entity> is person, apartment, tenancy or contract (singular or plural), values with spaces are quoted.
+A command is parsed locally and goes straight to the database, no LLM is called.
+The write commands are validated with the same CollectCreate models the write assistant fills,
+a write command that misses required data is left to the LLM flow, which asks for the rest.
+A command with an invalid value is answered with the validation error.
+An update without a changed field (new_<field>=value, or any field after the ID) is answered with a hint.
+"""
+import shlex
+import typing
+from typing import Optional, Union
+from pydantic import BaseModel, ValidationError
+from ApartmentManager.backend.AI_API.general.envelopes.envelopes_business_logic import DataTypeInDB, CollectCreate, \
+    CrudIntentModel, validate_model, PersonCreate, TenancyCreate, ContractCreate, ApartmentCreate, PersonUpdate, \
+    TenancyUpdate, ContractUpdate, ApartmentUpdate, PersonDelete, TenancyDelete, ContractDelete, ApartmentDelete, \
+    ID_FIELDS
+from ApartmentManager.backend.AI_API.general.intent_classifier import build_intent_model
+
+COMMAND_PREFIX = "/"
+# log name of the turns answered by a command
+COMMAND_PROMPT_NAME = "COMMAND"
+
+COMMAND_USAGE = ("Commands: /show <entity> [id], /create <entity> key=value ..., "
+                 "/update <entity> <id> key=value ..., /delete <entity> <id>. "
+                 "Entities: person, apartment, tenancy, contract.")
+
+_ENTITY_NAMES = {
+    "person": DataTypeInDB.PERSON, "persons": DataTypeInDB.PERSON,
+    "apartment": DataTypeInDB.APARTMENT, "apartments": DataTypeInDB.APARTMENT,
+    "tenancy": DataTypeInDB.TENANCY, "tenancies": DataTypeInDB.TENANCY,
+    "contract": DataTypeInDB.CONTRACT, "contracts": DataTypeInDB.CONTRACT,
+}
+
+# the same data models the write assistant fills, see get_data_model_for_crud_answer
+_WRITE_MODELS = {
+    "create": {DataTypeInDB.PERSON: PersonCreate, DataTypeInDB.TENANCY: TenancyCreate,
+               DataTypeInDB.CONTRACT: ContractCreate, DataTypeInDB.APARTMENT: ApartmentCreate},
+    "update": {DataTypeInDB.PERSON: PersonUpdate, DataTypeInDB.TENANCY: TenancyUpdate,
+               DataTypeInDB.CONTRACT: ContractUpdate, DataTypeInDB.APARTMENT: ApartmentUpdate},
+    "delete": {DataTypeInDB.PERSON: PersonDelete, DataTypeInDB.TENANCY: TenancyDelete,
+               DataTypeInDB.CONTRACT: ContractDelete, DataTypeInDB.APARTMENT: ApartmentDelete},
+}
+
+
+class CommandSyntaxError(ValueError):
+    """
+    The text starts with the command prefix but is not a valid command.
+    """
+
+
+class ChatCommand(BaseModel):
+    action: str # show | create | update | delete
+    entity: DataTypeInDB
+    entity_id: Optional[int] = None
+    fields: dict[str, str] = {}
+
+
+def is_command(user_question: str) -> bool:
+    return isinstance(user_question, str) and user_question.lstrip().startswith(COMMAND_PREFIX)
+
+
+def parse_command(user_question: str) -> ChatCommand:
+    """
+    Parses a command of the chat.
+    :param user_question: Text starting with the command prefix.
+    :return: Parsed command.
+    :raise CommandSyntaxError: Unknown action or entity, or a malformed argument.
+    """
+    try:
+        tokens = shlex.split(user_question.lstrip()[len(COMMAND_PREFIX):])
+    except ValueError as error:
+        raise CommandSyntaxError(f"Cannot read the command: {error}.") from error
+
+    if len(tokens) < 2:
+        raise CommandSyntaxError("A command needs an action and an entity.")
+
+    action = tokens[0].lower()
+    if action not in ("show", "create", "update", "delete"):
+        raise CommandSyntaxError(f"Unknown action '{tokens[0]}'.")
+
+    entity = _ENTITY_NAMES.get(tokens[1].lower())
+    if entity is None:
+        raise CommandSyntaxError(f"Unknown entity '{tokens[1]}'.")
+
+    arguments = tokens[2:]
+    entity_id = None
+    if arguments and "=" not in arguments[0]:
+        if not arguments[0].isdigit():
+            raise CommandSyntaxError(f"The ID '{arguments[0]}' is not a number.")
+        entity_id = int(arguments[0])
+        arguments = arguments[1:]
+
+    fields = {}
+    for argument in arguments:
+        key, separator, value = argument.partition("=")
+        if not separator or not key:
+            raise CommandSyntaxError(f"Expected key=value, got '{argument}'.")
+        fields[key.strip()] = value
+
+    if action == "show" and fields:
+        raise CommandSyntaxError("/show takes only an optional ID.")
+    if action in ("update", "delete") and entity_id is None and not fields:
+        raise CommandSyntaxError(f"/{action} needs the ID of the {entity.value}.")
+    if action == "update" and not fields:
+        raise CommandSyntaxError("/update needs the fields to change as key=value.")
+    if action == "create" and entity_id is not None:
+        raise CommandSyntaxError("/create takes no ID, the database assigns it.")
+
+    return ChatCommand(action=action, entity=entity, entity_id=entity_id, fields=fields)
+
+
+def build_command_intent(command: ChatCommand) -> CrudIntentModel:
+    """
+    CRUD intent of the command, in the form of the answer of the CRUD intent assistant.
+    """
+    return build_intent_model(command.action, command.entity.value, single=command.entity_id is not None)
+
+
+def build_entity_data(command: ChatCommand) -> CollectCreate | None:
+    """
+    Maps a write command onto the CollectCreate model of the write flow.
+    :return: Complete and confirmed data of the write operation,
+             None if required data is missing and the LLM has to collect it.
+    :raise CommandSyntaxError: The command names fields the entity does not have, has an invalid value
+                                or is an update without changed fields.
+    """
+    data_model = _WRITE_MODELS[command.action][command.entity]
+    data = _map_fields(command, data_model)
+
+    if command.action == "update" and not any(key.startswith("new_") for key in data):
+        # without an ID all fields select the entity, the update would change nothing
+        raise CommandSyntaxError(f"/update changes nothing: give the ID of the {command.entity.value} "
+                                 f"or the changed fields as new_<field>=value.")
+
+    try:
+        return validate_model(CollectCreate[data_model], {"ready": True, "data": data, "comment": ""})
+    except ValidationError as error:
+        # a wrong value is an error of the command, the LLM would only guess another value;
+        # each model of a Union reports the same wrong value, it is listed once
+        invalid_values = list(dict.fromkeys(f"{details['loc'][-1]}: {details['msg']}" for details in error.errors()
+                                            if details["type"] != "missing"))
+        if invalid_values:
+            raise CommandSyntaxError(f"Invalid value of the {command.entity.value}: {'; '.join(invalid_values)}.") \
+                from error
+        return None
+
+
+def _map_fields(command: ChatCommand, data_model) -> dict:
+    """
+    Names the arguments like the fields of the data model.
+    For an update the changed fields may be given without the prefix "new_".
+    If the update has no ID, a field that also identifies the entity (for example last_name)
+    selects the entity and is changed only with the prefix.
+    """
+    field_names = _field_names(data_model)
+    data = {}
+    if command.entity_id is not None:
+        data[ID_FIELDS[command.entity]] = command.entity_id
+
+    for key, value in command.fields.items():
+        is_change = command.action == "update" and f"new_{key}" in field_names
+        if is_change and (command.entity_id is not None or key not in field_names):
+            data[f"new_{key}"] = value
+        elif key in field_names:
+            data[key] = value
+        else:
+            allowed = ", ".join(sorted(name for name in field_names if name != ID_FIELDS[command.entity]))
+            raise CommandSyntaxError(f"Unknown field '{key}' of the {command.entity.value}. Fields: {allowed}.")
+
+    if data_model is ContractDelete:
+        # the contract is deleted only by its ID, wrapped in the identification field
+        data = {"identification": data}
+    return data
+
+
+def _field_names(data_model) -> set[str]:
+    models = typing.get_args(data_model) if typing.get_origin(data_model) is Union else (data_model,)
+    names = set()
+    for model in models:
+        for name, field in model.model_fields.items():
+            annotation = field.annotation
+            if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+                names.update(annotation.model_fields)
+            else:
+                names.add(name)
+    return names
@@ -1,38 +1,56 @@
-from ApartmentManager.backend.AI_API.general.json_serialisation import dumps_for_llm_prompt
+import asyncio
 import os
 from google.genai import errors as genai_errors
 from dotenv import load_dotenv
 from requests import RequestException
 from pydantic import ValidationError
 from ApartmentManager.backend.AI_API.ai_clients.gemini.gemini_client import GeminiClient
-from ApartmentManager.backend.AI_API.general.prompting import Prompt
-from ApartmentManager.backend.AI_API.general.conversation_write_actions import write_action_to_entity
-from ApartmentManager.backend.AI_API.general.envelopes.envelopes_api import EnvelopeApi
+from ApartmentManager.backend.AI_API.general.prompting import Prompt, compiled_prompt, build_feedback_digest
+from ApartmentManager.backend.AI_API.general.json_serialisation import dumps_for_llm_prompt
+from ApartmentManager.backend.AI_API.general.conversation_write_actions import write_action_to_entity, \
+    write_action_to_entity_async, call_db_or_collect_missing_data, continue_write_action, continue_write_action_async
+from ApartmentManager.backend.AI_API.general.envelopes.envelopes_api import EnvelopeApi, build_text_answer, AnswerSource, \
+    DataResult
 from ApartmentManager.backend.AI_API.general.error_texts import ErrorCode, APIError
 from ApartmentManager.backend.AI_API.general.logger import log_error
-from ApartmentManager.backend.AI_API.general.conversation_read_action import read_action_to_entity
+from ApartmentManager.backend.AI_API.general.metrics import CHAT_TURN_SECONDS
+from ApartmentManager.backend.AI_API.general.deadline import DeadlineExceeded, check_deadline
+from ApartmentManager.backend.AI_API.general.resilience import ProviderUnavailable
+from ApartmentManager.backend.AI_API.general.conversation_read_action import read_action_to_entity, read_single_entity
+from ApartmentManager.backend.AI_API.general.speculation import SpeculativeCall
+from ApartmentManager.backend.config.server_config import SPECULATIVE_FUNCTION_CALL
+from ApartmentManager.backend.AI_API.general.chat_commands import is_command, parse_command, build_command_intent, \
+    build_entity_data, CommandSyntaxError, COMMAND_USAGE, COMMAND_PROMPT_NAME
 import uuid
 
 class ConversationClient:
     """
     Initializes an LLM and offers methods to open conversation with it.
     """
-    def __init__(self, model_name):
+    def __init__(self, model_name, shared_llm_client=None):
+        """
+        :param model_name: Name of the LLM model.
+        :param shared_llm_client: Optional provider client (HTTP connection) reused between conversations.
+        """
         self.llm_client = None
         self.model_name = model_name
         self.result = None
-        self.system_prompt = Prompt.GET_FUNCTION_CALL.value # separate with the name because of prompt injection
+        self.system_prompt = compiled_prompt(Prompt.GET_FUNCTION_CALL) # separate with the name because of prompt injection
         self.system_prompt_name = Prompt.GET_FUNCTION_CALL.name
         self.user_question = None
         self.crud_intent_answer = None
         self.operation_id = None
 
+        # Callback (event, data) set by the streaming endpoint for the duration of one turn.
+        # If it is None, the answer is returned only as a whole envelope.
+        self.event_sink = None
+
         # Specify the model to use
         load_dotenv()
         some_gemini_model = os.getenv("GEMINI_MODEL") # for example, gemini-2.5-flash
 
         if self.model_name == some_gemini_model:
-            self.llm_client = GeminiClient(some_gemini_model)
+            self.llm_client = GeminiClient(some_gemini_model, shared_llm_client)
             print("Gemini will answer your question.")
         elif self.model_name == "Groq":
             #self.llm_client = GroqClient(active_model_name)
@@ -62,6 +80,25 @@ class ConversationClient:
 
         return interrupted_ops
 
+    def emit_event(self, event: str, data: dict) -> None:
+        """
+        Passes a progress event of the running turn to the streaming endpoint, if any is listening.
+        """
+        if self.event_sink:
+            self.event_sink(event, data)
+
+    def emit_text_delta(self, text: str) -> None:
+        self.emit_event("delta", {"text": text})
+
+    def _emit_intent_detected(self) -> None:
+        intent = "none"
+        for operation_type in ["create", "update", "delete", "show"]:
+            operation = getattr(self.crud_intent_answer, operation_type)
+            if operation.value:
+                intent = operation_type
+                break
+        self.emit_event("stage", {"name": "intent_detected", "intent": intent})
+
 
     def get_llm_answer(self, user_question: str) -> EnvelopeApi:
         """
@@ -69,99 +106,328 @@ class ConversationClient:
         :param user_question: User question.
         :return: Envelope with the type: "text" | "data"
         """
+        with CHAT_TURN_SECONDS.time(("sync",)):
+            self._start_turn()
+            if is_command(user_question):
+                envelope_api = self._answer_command(user_question)
+                if envelope_api is not None:
+                    return envelope_api
+            return self._get_llm_answer(user_question)
+
+    def _get_llm_answer(self, user_question: str) -> EnvelopeApi:
+        # called again with the error as question, if the backend rejects the answer of the LLM
         self.user_question = user_question
 
         # is cyclically set to False by the cycled LLM call.
         # if not reset means a READ operation without extra cycles for collecting information
         cycle_is_ready = True
 
+        speculation = None
+        if self._may_speculate(user_question):
+            speculation = SpeculativeCall.start("function_call_proposal",
+                                                self.llm_client.function_call_assistant.propose_function_call,
+                                                user_question)
+
         try:
+            # A turn of an active write operation is answered by the write assistant alone,
+            # the CRUD intent check runs only if the user interrupted the operation
+            if self._has_active_write_operation():
+                self._emit_intent_detected()
+                continued = continue_write_action(self)
+                if continued is not None:
+                    return self._finish_continued_write_operation(continued)
+
             # Run main head assistant
             # LLM checks if a user asks for one of CRUD operations
             self.crud_intent_answer = self.llm_client.crud_intent_assistant.get_crud_llm_response(self)
+            self._emit_intent_detected()
 
             # Write operations (cyclic behavior)
-            if (self.crud_intent_answer.create.value or
-                self.crud_intent_answer.update.value or
-                self.crud_intent_answer.delete.value):
-
-                # Replace "NEW" markers with actual UUIDs (only for create/update/delete)
-                for operation_type in ["create", "update", "delete"]:
-                    operation = getattr(self.crud_intent_answer, operation_type)
-                    if operation.value and operation.operation_id == "NEW":
-                        operation.operation_id = str(uuid.uuid4())[:8]
-
-                # Sync self.operation_id with the active operation's ID
-                # This ensures we switch IDs correctly if the operation type changes (e.g. Create -> Update)
-                if self.crud_intent_answer.create.value:
-                    self.operation_id = self.crud_intent_answer.create.operation_id
-                elif self.crud_intent_answer.update.value:
-                    self.operation_id = self.crud_intent_answer.update.operation_id
-                elif self.crud_intent_answer.delete.value:
-                    self.operation_id = self.crud_intent_answer.delete.operation_id
+            if self._has_write_intent():
+                self._activate_write_operation()
 
                 # if more cycles are required to collect information, the method sets cycle_is_ready=False
                 envelope_api, cycle_is_ready = write_action_to_entity(self)
 
-                # Clear operation_ids when operations complete (only for create/update/delete)
-                if cycle_is_ready:
-                    self.operation_id = None
-                    if self.crud_intent_answer.create.value:
-                        self.crud_intent_answer.create.operation_id = ""
-                    elif self.crud_intent_answer.update.value:
-                        self.crud_intent_answer.update.operation_id = ""
-                    elif self.crud_intent_answer.delete.value:
-                        self.crud_intent_answer.delete.operation_id = ""
+                self._complete_write_operation(cycle_is_ready)
 
             # Read operation
             elif self.crud_intent_answer.show.value:
                 envelope_api = read_action_to_entity(self)
-                # Show is stateless, ensure no operation_id hangs around (though it shouldn't)
-                self.operation_id = None
+                self._finish_read_action()
 
             # Read operation with interpretation in the second llm call
             else:
                 # No explicit CRUD intent detected at the start of a conversation => NONE
-                self.system_prompt = dumps_for_llm_prompt(Prompt.GET_FUNCTION_CALL.value)
-                self.system_prompt_name = Prompt.GET_FUNCTION_CALL.name
-                envelope_api = self.llm_client.general_answer_assistant.answer_general_question(self)
-                self.operation_id = None
+                self._prepare_general_answer()
+                envelope_api = self.llm_client.general_answer_assistant.answer_from_cache(self)
+                if envelope_api is None:
+                    proposal = speculation.take() if speculation else None
+                    envelope_api = self.llm_client.general_answer_assistant.answer_general_question(self, proposal)
+                self._finish_general_answer(envelope_api)
 
-                if not envelope_api:
-                    trace_id = log_error(ErrorCode.LLM_ERROR_EMPTY_ANSWER)
-                    raise APIError(ErrorCode.LLM_ERROR_EMPTY_ANSWER, trace_id)
+            return self._finish_turn(envelope_api, cycle_is_ready)
 
-            # Read operations do not have the feedback to the LLM
+        # Transport errors were already retried in provider_call, re-prompting the LLM would not help.
+        # The budget of the request is used up or the provider is degraded, another round would only fail later.
+        except (DeadlineExceeded, ProviderUnavailable, genai_errors.APIError, RequestException):
+            raise
 
-            # save the envelope for the feedback to the LLM
-            self.result = (envelope_api.model_dump(mode='json'), cycle_is_ready)
+        except Exception as error:
+            return self._get_llm_answer(self._error_question(user_question, error))
 
-            return envelope_api
+        finally:
+            # the turn did not need the proposal (a CRUD operation or an error)
+            if speculation:
+                speculation.abandon()
 
-        # for the Pydantic check
-        except ValidationError as error:
-            # Prevent infinite recursion if the error persists
-            if "Backend Validation Error:" in user_question:
-                trace_id = log_error(ErrorCode.LLM_WRONG_INPUT_CALLING_MODEL, exception=error)
-                raise APIError(ErrorCode.LLM_WRONG_INPUT_CALLING_MODEL, trace_id) from error
+    async def get_llm_answer_async(self, user_question: str) -> EnvelopeApi:
+        """
+        Async version of get_llm_answer for the ASGI serving mode.
+        LLM calls use the async transport of the SDK, SQLite work runs in worker threads,
+        so a waiting conversation does not hold a thread.
+        :param user_question: User question.
+        :return: Envelope with the type: "text" | "data"
+        """
+        with CHAT_TURN_SECONDS.time(("async",)):
+            # compacting serializes the history to estimate its size, keep it off the event loop
+            await asyncio.to_thread(self._start_turn)
+            if is_command(user_question):
+                # the command goes straight to SQLite, keep it off the event loop
+                envelope_api = await asyncio.to_thread(self._answer_command, user_question)
+                if envelope_api is not None:
+                    return envelope_api
+            return await self._get_llm_answer_async(user_question)
 
-            # Logic to feed back error
-            error_msg = f"Backend Validation Error: {error.errors()}"
-            return self.get_llm_answer(error_msg)
+    async def _get_llm_answer_async(self, user_question: str) -> EnvelopeApi:
+        self.user_question = user_question
+        cycle_is_ready = True
+
+        speculation = None
+        if self._may_speculate(user_question):
+            function_call_assistant = self.llm_client.function_call_assistant
+            speculation = SpeculativeCall.start_async("function_call_proposal",
+                                                      function_call_assistant.propose_function_call_async(user_question))
+
+        try:
+            if self._has_active_write_operation():
+                self._emit_intent_detected()
+                continued = await continue_write_action_async(self)
+                if continued is not None:
+                    return self._finish_continued_write_operation(continued)
+
+            self.crud_intent_answer = await self.llm_client.crud_intent_assistant.get_crud_llm_response_async(self)
+            self._emit_intent_detected()
+
+            if self._has_write_intent():
+                self._activate_write_operation()
+                envelope_api, cycle_is_ready = await write_action_to_entity_async(self)
+                self._complete_write_operation(cycle_is_ready)
+
+            elif self.crud_intent_answer.show.value:
+                envelope_api = await asyncio.to_thread(read_action_to_entity, self)
+                self._finish_read_action()
+
+            else:
+                self._prepare_general_answer()
+                envelope_api = await asyncio.to_thread(self.llm_client.general_answer_assistant.answer_from_cache, self)
+                if envelope_api is None:
+                    proposal = await speculation.take_async() if speculation else None
+                    envelope_api = await self.llm_client.general_answer_assistant.answer_general_question_async(
+                        self, proposal)
+                self._finish_general_answer(envelope_api)
+
+            return self._finish_turn(envelope_api, cycle_is_ready)
+
+        except (DeadlineExceeded, ProviderUnavailable, genai_errors.APIError, RequestException):
+            raise
 
         except Exception as error:
-            # Prevent infinite recursion if the error persists
-            if "Backend Error:" in user_question:
-                 trace_id = log_error(ErrorCode.LLM_GENERAL_ERROR_CALLING_MODEL, exception=error)
-                 raise APIError(ErrorCode.LLM_GENERAL_ERROR_CALLING_MODEL, trace_id) from error
-
-            # Logic to feed back error
-            error_msg = f"Backend Error: {str(error)}"
-            if isinstance(error, APIError):
-                error_msg = f"Backend Error: {error.message}"
-            elif isinstance(error, genai_errors.APIError):
-                error_msg = f"Backend Error: Gemini API Error - {str(error)}"
-            elif isinstance(error, RequestException):
-                error_msg = f"Backend Error: Network Request Error - {str(error)}"
-
-            return self.get_llm_answer(error_msg)
\ No newline at end of file
+            return await self._get_llm_answer_async(self._error_question(user_question, error))
+
+        finally:
+            if speculation:
+                speculation.abandon()
+
+    def _answer_command(self, user_question: str) -> EnvelopeApi | None:
+        """
+        Answers a command of the chat (see chat_commands) without the LLM.
+        The command does not change the operation state of the conversation: an active or interrupted
+        write operation continues with the next question. The command and its answer are recorded
+        like any other turn, so a follow-up question can refer to them.
+        :return: Envelope of the command, None if a write command misses data and the LLM has to collect it.
+        """
+        self.user_question = user_question
+
+        try:
+            command = parse_command(user_question)
+            entity_data = build_entity_data(command) if command.action != "show" else None
+        except CommandSyntaxError as error:
+            return self._record_command_turn(build_text_answer(message=f"{error} {COMMAND_USAGE}",
+                                                               model=self.model_name,
+                                                               answer_source=AnswerSource.BACKEND))
+
+        if command.action != "show" and entity_data is None:
+            return None
+
+        previous_crud_intent = self.crud_intent_answer
+        self.crud_intent_answer = build_command_intent(command)
+        self.system_prompt_name = COMMAND_PROMPT_NAME
+        try:
+            self._emit_intent_detected()
+
+            if command.action == "show":
+                if command.entity_id is None:
+                    envelope_api = read_action_to_entity(self)
+                else:
+                    envelope_api = read_single_entity(self, command.entity_id)
+                self.emit_event("stage", {"name": "db_read_done"})
+            else:
+                envelope_api, _ = call_db_or_collect_missing_data(self, entity_data)
+        finally:
+            self.crud_intent_answer = previous_crud_intent
+
+        return self._record_command_turn(envelope_api)
+
+    def _record_command_turn(self, envelope_api: EnvelopeApi) -> EnvelopeApi:
+        envelope = envelope_api.model_dump(mode='json')
+        self.result = (envelope, True)
+
+        # the rows of a data answer are not resent, their digest names the entity and the IDs
+        answer_text = envelope_api.result.message
+        if isinstance(envelope_api.result, DataResult):
+            answer_text = f"{answer_text}\n{dumps_for_llm_prompt(build_feedback_digest(self.result))}"
+        self.llm_client.record_exchange(self.user_question, answer_text)
+        return envelope_api
+
+    def _start_turn(self) -> None:
+        # an active or interrupted write operation keeps its collected data in the history
+        write_operation_active = bool(self.operation_id or self.extract_operation_ids_from_crud_answer())
+        self.llm_client.start_turn(write_operation_active)
+
+    def _may_speculate(self, user_question: str) -> bool:
+        """
+        The proposal is requested in advance only if no write operation is active or interrupted,
+        then the turn most likely ends in the general answer. The feedback of the backend after an error
+        is not a question for the proposal.
+        """
+        return (SPECULATIVE_FUNCTION_CALL
+                and not user_question.startswith("Backend")
+                and not self.operation_id
+                and not self.extract_operation_ids_from_crud_answer())
+
+    def _has_active_write_operation(self) -> bool:
+        return bool(self.operation_id) and self.crud_intent_answer is not None and self._has_write_intent()
+
+    def _finish_continued_write_operation(self, continued: (EnvelopeApi, bool)) -> EnvelopeApi:
+        envelope_api, cycle_is_ready = continued
+        self._complete_write_operation(cycle_is_ready)
+        return self._finish_turn(envelope_api, cycle_is_ready)
+
+    def _finish_turn(self, envelope_api: EnvelopeApi, cycle_is_ready: bool) -> EnvelopeApi:
+        # save the envelope for the feedback to the LLM
+        self.result = (envelope_api.model_dump(mode='json'), cycle_is_ready)
+        return envelope_api
+
+    def _has_write_intent(self) -> bool:
+        return (self.crud_intent_answer.create.value or
+                self.crud_intent_answer.update.value or
+                self.crud_intent_answer.delete.value)
+
+    def _activate_write_operation(self) -> None:
+        # Replace "NEW" markers with actual UUIDs (only for create/update/delete)
+        for operation_type in ["create", "update", "delete"]:
+            operation = getattr(self.crud_intent_answer, operation_type)
+            if operation.value and operation.operation_id == "NEW":
+                operation.operation_id = str(uuid.uuid4())[:8]
+
+        # Sync self.operation_id with the active operation's ID
+        # This ensures we switch IDs correctly if the operation type changes (e.g. Create -> Update)
+        if self.crud_intent_answer.create.value:
+            self.operation_id = self.crud_intent_answer.create.operation_id
+        elif self.crud_intent_answer.update.value:
+            self.operation_id = self.crud_intent_answer.update.operation_id
+        elif self.crud_intent_answer.delete.value:
+            self.operation_id = self.crud_intent_answer.delete.operation_id
+
+    def _complete_write_operation(self, cycle_is_ready: bool) -> None:
+        # Clear operation_ids when operations complete (only for create/update/delete)
+        if cycle_is_ready:
+            self.operation_id = None
+            if self.crud_intent_answer.create.value:
+                self.crud_intent_answer.create.operation_id = ""
+            elif self.crud_intent_answer.update.value:
+                self.crud_intent_answer.update.operation_id = ""
+            elif self.crud_intent_answer.delete.value:
+                self.crud_intent_answer.delete.operation_id = ""
+
+    def _prepare_general_answer(self) -> None:
+        self.system_prompt = compiled_prompt(Prompt.GET_FUNCTION_CALL)
+        self.system_prompt_name = Prompt.GET_FUNCTION_CALL.name
+
+    def _finish_read_action(self) -> None:
+        self.emit_event("stage", {"name": "db_read_done"})
+        # Show is stateless, ensure no operation_id hangs around (though it shouldn't)
+        self.operation_id = None
+
+    def _finish_general_answer(self, envelope_api: EnvelopeApi | None) -> None:
+        self.operation_id = None
+
+        if not envelope_api:
+            trace_id = log_error(ErrorCode.LLM_ERROR_EMPTY_ANSWER)
+            raise APIError(ErrorCode.LLM_ERROR_EMPTY_ANSWER, trace_id)
+
+    def _error_question(self, user_question: str, error: Exception) -> str:
+        """
+        Maps an error of the turn to the question of the next round: the LLM gets the error and can correct its answer.
+        :raise: The error itself (or its cause) if the LLM cannot fix it or the budget of the request is used up.
+        """
+        check_deadline(error)
+
+        # for the Pydantic check
+        if isinstance(error, ValidationError):
+            return self._validation_error_feedback(user_question, error)
+
+        self._raise_if_not_semantic(error)
+        return self._error_feedback(user_question, error)
+
+    @staticmethod
+    def _validation_error_feedback(user_question: str, error: ValidationError) -> str:
+        # Prevent infinite recursion if the error persists
+        if "Backend Validation Error:" in user_question:
+            trace_id = log_error(ErrorCode.LLM_WRONG_INPUT_CALLING_MODEL, exception=error)
+            raise APIError(ErrorCode.LLM_WRONG_INPUT_CALLING_MODEL, trace_id) from error
+
+        # Logic to feed back error
+        return f"Backend Validation Error: {error.errors()}"
+
+    @staticmethod
+    def _raise_if_not_semantic(error: Exception) -> None:
+        """
+        The assistants wrap errors into their own APIError. If the cause is a failure of the provider
+        or of the network, it is raised as it is: the LLM cannot fix it by getting the error as question.
+        An answer still invalid after the validation repairs of the write assistant is final as well.
+        """
+        if isinstance(error, APIError) and error.error_code == ErrorCode.LLM_WRONG_INPUT_CALLING_MODEL.value[0]:
+            raise error
+
+        cause = error
+        while cause is not None:
+            if isinstance(cause, (ProviderUnavailable, genai_errors.APIError, RequestException)):
+                raise cause
+            cause = cause.__cause__
+
+    @staticmethod
+    def _error_feedback(user_question: str, error: Exception) -> str:
+        # Prevent infinite recursion if the error persists
+        if "Backend Error:" in user_question:
+             trace_id = log_error(ErrorCode.LLM_GENERAL_ERROR_CALLING_MODEL, exception=error)
+             raise APIError(ErrorCode.LLM_GENERAL_ERROR_CALLING_MODEL, trace_id) from error
+
+        # Logic to feed back error
+        # the errors of the provider and of the network never get here, see _raise_if_not_semantic
+        error_msg = f"Backend Error: {str(error)}"
+        if isinstance(error, APIError):
+            error_msg = f"Backend Error: {error.message}"
+
+        return error_msg
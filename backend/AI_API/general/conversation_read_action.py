@@ -13,13 +13,21 @@ if typing.TYPE_CHECKING:
 from ApartmentManager.backend.AI_API.general.envelopes.envelopes_api import build_data_answer, AnswerSource, EnvelopeApi
 from ApartmentManager.backend.AI_API.general.error_texts import ErrorCode, APIError
 from ApartmentManager.backend.AI_API.general.logger import log_error
-from ApartmentManager.backend.SQL_API.rental.CRUD.read import get_persons, get_apartments, get_tenancies, get_contract
+from ApartmentManager.backend.AI_API.general.answer_cache import answer_cache_key, get_cached_answer, put_cached_answer
+from ApartmentManager.backend.SQL_API.rental.CRUD.read import get_persons, get_apartments, get_tenancies, get_contract, \
+    get_single_person, get_single_apartment, get_single_tenancy, get_single_contract
 
 
 def read_action_to_entity(conversation_client: "ConversationClient") -> EnvelopeApi:
     type_to_show = conversation_client.crud_intent_answer.show.type
 
-    result = get_entity_from_db(type_to_show, conversation_client.model_name)
+    # the list depends only on the type, not on the words of the question
+    cache_key = answer_cache_key("show", type_to_show.value, conversation_client.model_name)
+    result = get_cached_answer(cache_key)
+    if result is None:
+        result = get_entity_from_db(type_to_show, conversation_client.model_name)
+        put_cached_answer(cache_key, result)
+
     from ApartmentManager.backend.AI_API.general.json_serialisation import dumps_for_logging
     result_str = dumps_for_logging(result)
 
@@ -34,6 +42,46 @@ def read_action_to_entity(conversation_client: "ConversationClient") -> Envelope
     return result
 
 
+def read_single_entity(conversation_client: "ConversationClient", entity_id: int) -> EnvelopeApi:
+    """
+    Reads one entity by its ID, the type is taken from the CRUD intent like in read_action_to_entity.
+    """
+    type_to_show = conversation_client.crud_intent_answer.show.type
+
+    if type_to_show is DataTypeInDB.PERSON:
+        db_entity = get_single_person(first_name=None, last_name=None, id_personal_data=entity_id)
+
+    elif type_to_show is DataTypeInDB.APARTMENT:
+        db_entity = get_single_apartment(id_apartment=entity_id)
+
+    elif type_to_show is DataTypeInDB.TENANCY:
+        db_entity = get_single_tenancy(id_tenancy=entity_id)
+
+    elif type_to_show is DataTypeInDB.CONTRACT:
+        db_entity = get_single_contract(id_contract=entity_id)
+
+    else:
+        trace_id = log_error(ErrorCode.NOT_ALLOWED_NAME_TO_CHECK_ENTITY_TO_SHOW)
+        raise APIError(ErrorCode.NOT_ALLOWED_NAME_TO_CHECK_ENTITY_TO_SHOW, trace_id)
+
+    # a list like for all entities, the frontend renders both the same way
+    result = build_data_answer(payload=[db_entity.to_dict()],
+                               payload_comment="Data updated",
+                               model=conversation_client.model_name,
+                               answer_source=AnswerSource.BACKEND)
+
+    from ApartmentManager.backend.AI_API.general.json_serialisation import dumps_for_logging
+    create_new_log_entry(
+        llm_model=conversation_client.model_name,
+        user_question=conversation_client.user_question or "---",
+        backend_response=dumps_for_logging(result),
+        llm_answer="---",
+        system_prompt_name=conversation_client.system_prompt_name
+    )
+
+    return result
+
+
 def get_entity_from_db(data_to_show: DataTypeInDB, model_name: str) -> EnvelopeApi:
 
     if data_to_show is DataTypeInDB.PERSON:
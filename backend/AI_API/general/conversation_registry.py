@@ -0,0 +1,186 @@
+import asyncio
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager, asynccontextmanager
+from ApartmentManager.backend.AI_API.general.conversation_client import ConversationClient
+from ApartmentManager.backend.AI_API.general.logger import log_info, log_error
+from ApartmentManager.backend.AI_API.general.error_texts import ErrorCode
+from ApartmentManager.backend.AI_API.general.deadline import stage_timeout, DeadlineExceeded
+
+# Names under which the browser sends its conversation id
+SESSION_HEADER = "X-Session-Id"
+SESSION_COOKIE = "session_id"
+
+_VALID_SESSION_ID = re.compile(r"^[A-Za-z0-9_-]{8,64}$")
+
+
+def resolve_session_id(header_value: str | None, cookie_value: str | None) -> (str, bool):
+    """
+    Picks the session id sent by the client (header first, then cookie).
+    If none or an invalid one was sent, a new id is generated.
+    :return: session id and the flag whether it was newly generated.
+    """
+    for candidate in (header_value, cookie_value):
+        if candidate and _VALID_SESSION_ID.match(candidate):
+            return candidate, False
+    return uuid.uuid4().hex, True
+
+
+class ConversationSession:
+    """
+    One browser conversation: its own ConversationClient and the lock that serializes its turns.
+    The sync Flask workers and the ASGI handler take the same lock, a session may be used by both
+    (under asgi.py the streaming endpoint runs in the Flask app).
+    """
+    def __init__(self, session_id: str, conversation_client: ConversationClient):
+        self.session_id = session_id
+        self.conversation_client = conversation_client
+        self.lock = threading.Lock()
+        self.last_used = time.monotonic()
+        # requests that got the session and did not finish their turn yet, changed under the registry lock
+        self.reservations = 0
+
+    def is_busy(self) -> bool:
+        """
+        True while a request holds the session, from get_session(reserve=True) until the end of its turn.
+        """
+        return self.reservations > 0
+
+
+class ConversationRegistry:
+    """
+    Keeps one ConversationClient per session id.
+    The number of sessions is bounded (LRU eviction) and idle sessions expire after a TTL,
+    so the memory of a worker has a hard ceiling.
+    """
+    def __init__(self, model_name: str, max_sessions: int, idle_ttl_seconds: float):
+        self.model_name = model_name
+        self.max_sessions = max_sessions
+        self.idle_ttl_seconds = idle_ttl_seconds
+
+        # the order of the dict is the LRU order: the oldest session is the first
+        self._sessions: OrderedDict[str, ConversationSession] = OrderedDict()
+        self._registry_lock = threading.Lock()
+
+        # The HTTP client of the provider is shared between the sessions,
+        # only the conversation state is per session.
+        self._shared_llm_client = None
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def get_session(self, session_id: str, reserve: bool = False) -> ConversationSession:
+        """
+        Returns the session for the id, creates a new one if it does not exist (anymore).
+        :param reserve: The session is marked busy before the registry lock is released, so a concurrent
+                        request cannot evict it before the caller takes its lock. Release it with _release_session.
+        """
+        now = time.monotonic()
+        with self._registry_lock:
+            self._evict_idle_sessions(now)
+
+            session = self._sessions.get(session_id)
+            if session:
+                session.last_used = now
+                session.reservations += reserve
+                self._sessions.move_to_end(session_id)
+                return session
+
+        # building the client loads the configuration, do it outside the registry lock
+        conversation_client = ConversationClient(self.model_name, shared_llm_client=self._shared_llm_client)
+        if self._shared_llm_client is None and conversation_client.llm_client is not None:
+            self._shared_llm_client = conversation_client.llm_client.client
+
+        with self._registry_lock:
+            # another request of the same session may have been faster
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = ConversationSession(session_id, conversation_client)
+                session.reservations += reserve
+                self._sessions[session_id] = session
+                self._evict_least_recently_used()
+            else:
+                session.reservations += reserve
+                self._sessions.move_to_end(session_id)
+            session.last_used = now
+            return session
+
+    def _release_session(self, session: ConversationSession) -> None:
+        with self._registry_lock:
+            session.reservations -= 1
+            session.last_used = time.monotonic()
+
+    @contextmanager
+    def conversation(self, session_id: str):
+        """
+        Gives exclusive access to the ConversationClient of the session for one chat turn.
+        The wait for the running turn of the session is limited by the deadline of the request.
+        """
+        session = self.get_session(session_id, reserve=True)
+        try:
+            timeout = stage_timeout(None)
+            if not session.lock.acquire(timeout=-1 if timeout is None else timeout):
+                trace_id = log_error(ErrorCode.CHAT_REQUEST_DEADLINE_EXCEEDED)
+                raise DeadlineExceeded(trace_id)
+            try:
+                yield session.conversation_client
+            finally:
+                session.lock.release()
+        finally:
+            self._release_session(session)
+
+    @asynccontextmanager
+    async def conversation_async(self, session_id: str):
+        """
+        Async version of conversation for the ASGI serving mode.
+        The lock is the one of the sync path, it is waited for in a worker thread.
+        """
+        session = self.get_session(session_id, reserve=True)
+        try:
+            timeout = stage_timeout(None)
+            acquiring = asyncio.ensure_future(asyncio.to_thread(session.lock.acquire,
+                                                                timeout=-1 if timeout is None else timeout))
+            try:
+                acquired = await asyncio.shield(acquiring)
+            except asyncio.CancelledError:
+                # the worker thread may still get the lock, it is released as soon as it does
+                acquiring.add_done_callback(lambda task: task.result() and session.lock.release())
+                raise
+            if not acquired:
+                trace_id = log_error(ErrorCode.CHAT_REQUEST_DEADLINE_EXCEEDED)
+                raise DeadlineExceeded(trace_id)
+            try:
+                yield session.conversation_client
+            finally:
+                session.lock.release()
+        finally:
+            self._release_session(session)
+
+    def _evict_idle_sessions(self, now: float) -> None:
+        # The oldest sessions are at the beginning, stop at the first active one
+        expired = []
+        for session_id, session in self._sessions.items():
+            if now - session.last_used < self.idle_ttl_seconds:
+                break
+            if not session.is_busy():
+                expired.append(session_id)
+        for session_id in expired:
+            del self._sessions[session_id]
+            log_info(f"Conversation session {session_id} expired after being idle.")
+
+    def _evict_least_recently_used(self) -> None:
+        # a session with a running turn is kept, its next request must find the same ConversationClient;
+        # if all sessions are busy, the limit is exceeded until one of them is evicted
+        evicted = []
+        excess = len(self._sessions) - self.max_sessions
+        for session_id, session in self._sessions.items():
+            if len(evicted) >= excess:
+                break
+            if not session.is_busy():
+                evicted.append(session_id)
+        for session_id in evicted:
+            del self._sessions[session_id]
+            log_info(f"Conversation session {session_id} evicted, limit of {self.max_sessions} sessions reached.")
@@ -1,14 +1,17 @@
+import asyncio
 import inspect
 import typing
 from typing import Any
-from pydantic import BaseModel
+from pydantic import BaseModel, ValidationError
 
 from ApartmentManager.backend.AI_API.general.json_serialisation import dumps_for_llm_prompt
 from ApartmentManager.backend.AI_API.general.envelopes.envelopes_business_logic \
     import DataTypeInDB, validate_model, get_json_schema, PersonDelete, TenancyDelete, ContractDelete, ApartmentDelete, \
     PersonUpdate, TenancyUpdate, ContractUpdate, ApartmentUpdate
 from ApartmentManager.backend.AI_API.general.logger import log_error
-from ApartmentManager.backend.AI_API.general.prompting import Prompt
+from ApartmentManager.backend.AI_API.general.metrics import VALIDATION_REPAIRS, WRITE_CONTINUATIONS
+from ApartmentManager.backend.config.server_config import MAX_VALIDATION_REPAIR_ATTEMPTS
+from ApartmentManager.backend.AI_API.general.prompting import Prompt, build_continuation_prompt, compiled_prompt
 from ApartmentManager.backend.SQL_API.logs.create_log import create_new_log_entry
 from ApartmentManager.backend.SQL_API.rental.CRUD.create import create_person, create_apartment, create_tenancy, create_contract
 from ApartmentManager.backend.SQL_API.rental.CRUD.delete import delete_person, delete_apartment, delete_tenancy, delete_contract
@@ -16,6 +19,7 @@ from ApartmentManager.backend.SQL_API.rental.CRUD.update import update_person, u
 from ApartmentManager.backend.AI_API.general.error_texts import ErrorCode, APIError
 from ApartmentManager.backend.AI_API.general.envelopes.envelopes_business_logic import (
     CollectCreate,
+    ContinueCollect,
     PersonCreate,
     TenancyCreate,
     ContractCreate,
@@ -38,11 +42,51 @@ def write_action_to_entity(conversation_client: "ConversationClient") -> (Envelo
 
     return envelope_api, ready
 
+
+async def write_action_to_entity_async(conversation_client: "ConversationClient") -> (EnvelopeApi, bool):
+    """
+    Async version of write_action_to_entity for the ASGI serving mode.
+    The SQL layer is synchronous, so the DB write runs in a worker thread.
+    """
+    db_entity_data = await collect_missing_entity_data_async(conversation_client)
+
+    envelope_api, ready = await asyncio.to_thread(call_db_or_collect_missing_data,
+                                                  conversation_client,
+                                                  db_entity_data)
+
+    return envelope_api, ready
+
+
+def continue_write_action(conversation_client: "ConversationClient") -> tuple[EnvelopeApi, bool] | None:
+    """
+    Turn of an active write operation in one LLM call: the write assistant decides if the user
+    continues the operation and collects the data in the same answer, the CRUD intent check is skipped.
+    :return: Like write_action_to_entity, None if the user interrupted the operation
+             and the question has to go through the CRUD intent check.
+    """
+    db_entity_data = collect_missing_entity_data(conversation_client, continuation=True)
+    if db_entity_data is None:
+        return None
+
+    WRITE_CONTINUATIONS.inc(("continued",))
+    return call_db_or_collect_missing_data(conversation_client, db_entity_data)
+
+
+async def continue_write_action_async(conversation_client: "ConversationClient") -> tuple[EnvelopeApi, bool] | None:
+    db_entity_data = await collect_missing_entity_data_async(conversation_client, continuation=True)
+    if db_entity_data is None:
+        return None
+
+    WRITE_CONTINUATIONS.inc(("continued",))
+    return await asyncio.to_thread(call_db_or_collect_missing_data, conversation_client, db_entity_data)
+
+
 def get_data_model_for_crud_answer(conversation_client: "ConversationClient") -> type[BaseModel] | None:
     crud_intent = conversation_client.crud_intent_answer
 
     if crud_intent.create.value:
-        conversation_client.system_prompt = Prompt.CREATE_ENTITY
+        conversation_client.system_prompt = compiled_prompt(Prompt.CREATE_ENTITY)
+        conversation_client.system_prompt_name = Prompt.CREATE_ENTITY.name
         type_crud = crud_intent.create.type
 
         if type_crud == DataTypeInDB.PERSON:
@@ -55,7 +99,8 @@ def get_data_model_for_crud_answer(conversation_client: "ConversationClient") ->
             return CollectCreate[ApartmentCreate]
 
     elif crud_intent.delete.value:
-        conversation_client.system_prompt = Prompt.DELETE_ENTITY
+        conversation_client.system_prompt = compiled_prompt(Prompt.DELETE_ENTITY)
+        conversation_client.system_prompt_name = Prompt.DELETE_ENTITY.name
         type_crud = crud_intent.delete.type
 
         if type_crud == DataTypeInDB.PERSON:
@@ -68,7 +113,8 @@ def get_data_model_for_crud_answer(conversation_client: "ConversationClient") ->
             return CollectCreate[ApartmentDelete]
 
     elif crud_intent.update.value:
-        conversation_client.system_prompt = Prompt.UPDATE_ENTITY
+        conversation_client.system_prompt = compiled_prompt(Prompt.UPDATE_ENTITY)
+        conversation_client.system_prompt_name = Prompt.UPDATE_ENTITY.name
         type_crud = crud_intent.update.type
 
         if type_crud == DataTypeInDB.PERSON:
@@ -84,24 +130,138 @@ def get_data_model_for_crud_answer(conversation_client: "ConversationClient") ->
     return None
 
 
-def collect_missing_entity_data(conversation_client: "ConversationClient") -> CollectCreate[Any]:
+def collect_missing_entity_data(conversation_client: "ConversationClient",
+                                continuation: bool = False) -> CollectCreate[Any] | None:
     # Do the LLM call to collect the additional data for creating an entry
     # and get the user's confirmation for them.
     # Multiple conversation cycles logic.
 
+    # With continuation=True the answer also says if the user continues the operation,
+    # None is returned if not.
+
+    collection = _EntityDataCollection(conversation_client, continuation)
+    write_assistant = conversation_client.llm_client.write_actions_assistant
+
+    repair_prompt = None
+    while True:
+        db_entity_dict = write_assistant.do_llm_call(conversation_client, collection.json_schema, repair_prompt)
+        repair_prompt = collection.check_answer(db_entity_dict)
+        if repair_prompt is None:
+            return collection.entity_data
+
+
+async def collect_missing_entity_data_async(conversation_client: "ConversationClient",
+                                            continuation: bool = False) -> CollectCreate[Any] | None:
+    collection = _EntityDataCollection(conversation_client, continuation)
+    write_assistant = conversation_client.llm_client.write_actions_assistant
+
+    repair_prompt = None
+    while True:
+        db_entity_dict = await write_assistant.do_llm_call_async(conversation_client,
+                                                                 collection.json_schema,
+                                                                 repair_prompt)
+        repair_prompt = collection.check_answer(db_entity_dict)
+        if repair_prompt is None:
+            return collection.entity_data
+
+
+class _EntityDataCollection:
+    """
+    Checks the answers of the write assistant in one turn, shared by the sync and async collection.
+    An answer that fails the validation is sent back to the same assistant with the errors,
+    the CRUD intent of the turn stays valid and is not asked again.
+    """
+    def __init__(self, conversation_client: "ConversationClient", continuation: bool):
+        self.pydantic_model, self.json_schema = _get_collect_model_and_schema(conversation_client, continuation)
+        self.continuation = continuation
+        self.write_assistant = conversation_client.llm_client.write_actions_assistant
+        self.history_length = len(self.write_assistant.session_contents)
+        self.repair_attempt = 0
+        self.repair_start = None
+        # the validated data, None if the user interrupted the operation
+        self.entity_data = None
+
+    def check_answer(self, db_entity_dict: dict) -> str | None:
+        """
+        :param db_entity_dict: JSON answer of the write assistant.
+        :return: Repair prompt for the next LLM call, None if the collection of the turn is finished.
+        """
+        if self.continuation and _is_interrupted(self.write_assistant, db_entity_dict, self.history_length):
+            return None
+        try:
+            self.entity_data = _validate_collected_entity(self.pydantic_model, db_entity_dict,
+                                                          repaired=self.repair_attempt > 0)
+        except ValidationError as error:
+            repair_prompt = _build_repair_prompt(error, db_entity_dict, self.repair_attempt)
+            if self.repair_start is None:
+                self.repair_start = _rejected_answer_start(self.write_assistant)
+            self.repair_attempt += 1
+            return repair_prompt
+
+        _drop_repair_exchange(self.write_assistant, self.repair_start)
+        return None
+
+
+def _get_collect_model_and_schema(conversation_client: "ConversationClient",
+                                  continuation: bool = False) -> (type[BaseModel], dict):
     pydantic_model = get_data_model_for_crud_answer(conversation_client)
 
     if pydantic_model is None:
         trace_id = log_error(ErrorCode.NOT_ALLOWED_NAME_FOR_ENTITY)
         raise APIError(ErrorCode.NOT_ALLOWED_NAME_FOR_ENTITY, trace_id)
 
+    if continuation:
+        # the same collected data, extended by the continuation flag
+        collected_data_model = pydantic_model.__pydantic_generic_metadata__["args"][0]
+        pydantic_model = ContinueCollect[collected_data_model]
+        conversation_client.system_prompt = build_continuation_prompt(Prompt[conversation_client.system_prompt_name])
+
     json_schema = get_json_schema(pydantic_model)
 
-    db_entity_dict = conversation_client.llm_client.write_actions_assistant.do_llm_call(
-                                                                    conversation_client,
-                                                                    json_schema)
+    return pydantic_model, json_schema
+
+
+def _is_interrupted(write_assistant, db_entity_dict: dict, history_length: int) -> bool:
+    """
+    Checks the continuation flag of the answer. On an interruption the exchange is removed from
+    the conversation history, the question is asked again after the CRUD intent check.
+    """
+    if not isinstance(db_entity_dict, dict) or db_entity_dict.get("continues_operation") is not False:
+        return False
+
+    write_assistant.session_contents.rollback(history_length)
+    WRITE_CONTINUATIONS.inc(("interrupted",))
+    return True
 
+
+def _rejected_answer_start(write_assistant) -> int:
+    """
+    :return: Position of the rejected answer in the conversation history, the repair exchange starts there.
+    """
+    session_contents = write_assistant.session_contents
+    if session_contents and session_contents[-1].role == "model":
+        return len(session_contents) - 1
+    return len(session_contents)
+
+
+def _drop_repair_exchange(write_assistant, repair_start: int | None) -> None:
+    """
+    Keeps only the accepted answer of a repaired turn in the conversation history. The rejected answers
+    and the repair prompts are no input of the user, the next turns must not see them.
+    """
+    if repair_start is None:
+        return
+    accepted_answer = write_assistant.session_contents[-1]
+    write_assistant.session_contents.rollback(repair_start)
+    write_assistant.session_contents.append(accepted_answer)
+
+
+def _validate_collected_entity(pydantic_model: type[BaseModel],
+                               db_entity_dict: dict,
+                               repaired: bool = False) -> CollectCreate[Any]:
     raw_entity = validate_model(pydantic_model, db_entity_dict)
+    if repaired:
+        VALIDATION_REPAIRS.inc(("repaired",))
 
     # solves the problems with returned generic data types
     db_entity = typing.cast(CollectCreate[Any], raw_entity)
@@ -113,6 +273,35 @@ def collect_missing_entity_data(conversation_client: "ConversationClient") -> Co
     return db_entity
 
 
+def _build_repair_prompt(error: ValidationError, previous_answer: dict, repair_attempt: int) -> str:
+    """
+    Builds the message that asks the LLM to correct its previous JSON answer.
+    :param error: Validation error of the previous answer.
+    :param previous_answer: The previous JSON answer of the LLM.
+    :param repair_attempt: Number of repairs done so far in this turn.
+    :return: Repair prompt with the list of the errors and the previous answer.
+    :raise APIError: The answer is still invalid after MAX_VALIDATION_REPAIR_ATTEMPTS repairs.
+    """
+    if repair_attempt >= MAX_VALIDATION_REPAIR_ATTEMPTS:
+        VALIDATION_REPAIRS.inc(("failed",))
+        trace_id = log_error(ErrorCode.LLM_WRONG_INPUT_CALLING_MODEL, exception=error)
+        raise APIError(ErrorCode.LLM_WRONG_INPUT_CALLING_MODEL, trace_id) from error
+
+    # only the JSON-safe part of the errors, the context may hold exception objects
+    validation_errors = [{"field": ".".join(str(part) for part in details["loc"]),
+                          "error": details["msg"],
+                          "value": details.get("input")}
+                         for details in error.errors()]
+
+    return dumps_for_llm_prompt({
+        "backend_validation_errors": validation_errors,
+        "previous_answer": previous_answer,
+        "instruction": "Your previous answer was rejected by the backend. "
+                       "Correct the listed fields and answer again with the complete JSON. "
+                       "Keep all other fields as they were."
+    })
+
+
 def call_db_or_collect_missing_data(conversation_client: "ConversationClient",
                                     entity_data: CollectCreate) -> (EnvelopeApi, bool):
     result = None
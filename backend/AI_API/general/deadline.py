@@ -0,0 +1,82 @@
+"""
+Deadline of one chat request.
+
+The deadline is set once at the entry of the chat endpoint and kept in a ContextVar.
+Every stage (LLM call, loopback HTTP request) takes its timeout from the remaining budget,
+so retries and the error recursion of get_llm_answer cannot extend the request beyond the deadline.
+asyncio.to_thread and contextvars.copy_context copy the context, so worker threads see the same deadline.
+Outside of request_deadline the stages keep their own default timeouts.
+"""
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from ApartmentManager.backend.AI_API.general.error_texts import APIError, ErrorCode
+from ApartmentManager.backend.AI_API.general.logger import log_error
+
+# Absolute deadline on the time.monotonic() clock
+_DEADLINE: ContextVar[float | None] = ContextVar("request_deadline", default=None)
+
+
+class DeadlineExceeded(APIError):
+    """
+    The budget of the chat request is used up, the turn is not retried.
+    """
+    def __init__(self, trace_id=None):
+        super().__init__(ErrorCode.CHAT_REQUEST_DEADLINE_EXCEEDED, trace_id)
+
+
+def deadline_after(seconds: float) -> float:
+    """
+    :return: Deadline in seconds from now, to be passed to request_deadline.
+    """
+    return time.monotonic() + seconds
+
+
+@contextmanager
+def request_deadline(deadline: float):
+    """
+    Sets the deadline of the running request for the block.
+    :param deadline: Absolute deadline, see deadline_after.
+    """
+    token = _DEADLINE.set(deadline)
+    try:
+        yield
+    finally:
+        _DEADLINE.reset(token)
+
+
+def remaining_seconds() -> float | None:
+    """
+    :return: Remaining budget of the request, None if no deadline is set.
+    """
+    deadline = _DEADLINE.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+def check_deadline(cause: Exception = None) -> None:
+    """
+    Fails fast if the budget of the request is used up.
+    :param cause: Error of the stage that ran into the deadline, if any.
+    :raise DeadlineExceeded: The deadline has passed.
+    """
+    remaining = remaining_seconds()
+    if remaining is not None and remaining <= 0:
+        trace_id = log_error(ErrorCode.CHAT_REQUEST_DEADLINE_EXCEEDED, exception=cause)
+        raise DeadlineExceeded(trace_id) from cause
+
+
+def stage_timeout(default_seconds: float | None) -> float | None:
+    """
+    Timeout of the next stage: the default timeout of the stage, cut to the remaining budget.
+    :param default_seconds: Timeout of the stage without a deadline, None for no timeout.
+    :raise DeadlineExceeded: The deadline has already passed.
+    """
+    check_deadline()
+    remaining = remaining_seconds()
+    if remaining is None:
+        return default_seconds
+    if default_seconds is None:
+        return remaining
+    return min(default_seconds, remaining)
@@ -13,6 +13,14 @@ class DataTypeInDB(str, Enum): # str because of serialization in Pydantic
     CONTRACT = "contract"
     TENANCY = "tenancy"
 
+# primary key of each entity in its database rows
+ID_FIELDS = {
+    DataTypeInDB.PERSON: "id_personal_data",
+    DataTypeInDB.APARTMENT: "id_apartment",
+    DataTypeInDB.TENANCY: "id_tenancy",
+    DataTypeInDB.CONTRACT: "id_contract",
+}
+
 # ========= CRUD INTENT =========
 class CrudOperationData(BaseModel):
     value: bool
@@ -206,6 +214,16 @@ class CollectCreate(BaseModel, Generic[CollectedData]):
     data: Optional[CollectedData] = None
     comment: str
 
+class ContinueCollect(BaseModel, Generic[CollectedData]):
+    """
+    Answer of a turn of an active write operation: continuation flag and the collected data in one LLM call.
+    continues_operation comes first, the model decides it before it writes the comment.
+    """
+    continues_operation: bool
+    ready: bool
+    data: Optional[CollectedData] = None
+    comment: str
+
 
 # ========= UNIVERSAL VALIDATION =========
 
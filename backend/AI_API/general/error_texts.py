@@ -36,6 +36,7 @@ class ErrorCode(Enum):
     LLM_ERROR_RETRIEVING_STRUCTURED_CRUD_RESPONSE = (1013, "Failed retrieving structured CRUD response.")
     LLM_WRONG_INPUT_CALLING_MODEL = (1014, "Wrong input calling LLM model.")
     LLM_GENERAL_ERROR_CALLING_MODEL = (1015, "General error calling LLM model.")
+    LLM_PROVIDER_UNAVAILABLE = (1016, "The LLM provider is not available at the moment, please retry later.")
 
     # SQL error
     SQL_ERROR_DELETING_ENTRY = (1501, "Failed deleting entry in database.")
@@ -66,6 +67,10 @@ class ErrorCode(Enum):
     SQL_ERROR_READING_SINGLE_CONTRACT = (1526, "Failed retrieving single contract.")
     SQL_SUCH_CONTRACT_DOES_NOT_EXIST = (1527, "Such contract does not exist in the database.")
     SQL_ERROR_UPDATING_ENTRY = (1528, "Failed updating entry in database.")
+    SQL_INVALID_PAGINATION_CURSOR = (1529, "Invalid pagination cursor.")
+    SQL_INVALID_PAGINATION_LIMIT = (1530, "Invalid pagination limit.")
+    SQL_INVALID_BATCH_REQUEST = (1531, "Invalid batch request.")
+    SQL_ERROR_READING_BATCH = (1532, "Failed reading the batch of entities from the database.")
 
     # CRUD error
     NOT_ALLOWED_NAME_FOR_ENTITY = (1600, "Not allowed name for entity in database.")
@@ -87,6 +92,9 @@ class ErrorCode(Enum):
     FLASK_ERROR_HTTP_REQUEST_INPUT_MUST_BY_JSON = (2007, "HTTP request must have the JSON type")
     FLASK_ERROR_USER_QUESTION_IS_NOT_STRING = (2008, "User question is not a string")
     FLASK_ERROR_NO_PATH_PROVIDED = (2009, "No path provided")
+    FLASK_ERROR_TOO_MANY_CHAT_REQUESTS = (2010, "Too many chat requests at the moment, please retry later.")
+    FLASK_ERROR_CHAT_QUEUE_TIMEOUT = (2011, "The chat request waited too long for a free slot, please retry later.")
+    CHAT_REQUEST_DEADLINE_EXCEEDED = (2012, "The chat request took too long and was stopped.")
 
     # Generic glue / parsing
     ERROR_PARSING_CRUD_INTENT_RESPONSE = (3001, "Failed parsing CRUD intent response.")
@@ -0,0 +1,274 @@
+"""
+Local classifier of the CRUD intent.
+
+The CRUD intent assistant spends a full LLM round trip on every turn to fill the four booleans
+of CrudIntentModel. This classifier is trained offline from the logged CRUD_INTENT turns
+(see train_intent_classifier) and answers the clear cases locally:
+TF-IDF of the word unigrams and bigrams, and one softmax regression per head
+(intent: create/update/delete/show/none, entity type, show single or all).
+It is pure Python, the model is a small JSON file, no numeric library is needed.
+
+The LLM stays responsible for everything that depends on the state of the conversation,
+the classifier is only asked when no write operation is active or interrupted.
+"""
+import json
+import math
+import os
+import random
+import re
+import threading
+from ApartmentManager.backend.AI_API.general.envelopes.envelopes_business_logic import CrudIntentModel, \
+    CrudOperationData, ShowOperationData, DataTypeInDB
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../../"))
+MODEL_PATH = os.path.join(BASE_DIR, "data", "crud_intent_classifier.json")
+
+INTENTS = ("create", "update", "delete", "show")
+NO_INTENT = "none"
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(text: str) -> list[str]:
+    """
+    Lowercase words and word bigrams of the text.
+    """
+    words = _WORD.findall(text.lower())
+    return words + [f"{first} {second}" for first, second in zip(words, words[1:])]
+
+
+class SoftmaxRegression:
+    """
+    Multinomial logistic regression over sparse feature vectors {feature index: value}.
+    """
+    def __init__(self, classes: list[str], weights: list[dict[int, float]] = None, bias: list[float] = None):
+        self.classes = classes
+        self.weights = weights or [{} for _ in classes]
+        self.bias = bias or [0.0 for _ in classes]
+
+    def predict_proba(self, features: dict[int, float]) -> list[float]:
+        scores = [bias + sum(class_weights.get(index, 0.0) * value for index, value in features.items())
+                  for class_weights, bias in zip(self.weights, self.bias)]
+        highest = max(scores)
+        exponents = [math.exp(score - highest) for score in scores]
+        total = sum(exponents)
+        return [exponent / total for exponent in exponents]
+
+    def predict(self, features: dict[int, float]) -> (str, float):
+        """
+        :return: Most probable class and its probability, (None, 0.0) if the head saw no training data.
+        """
+        if not self.classes:
+            return None, 0.0
+        probabilities = self.predict_proba(features)
+        best = max(range(len(self.classes)), key=probabilities.__getitem__)
+        return self.classes[best], probabilities[best]
+
+    def fit(self,
+            samples: list[dict[int, float]],
+            labels: list[str],
+            epochs: int = 30,
+            learning_rate: float = 0.5,
+            l2: float = 1e-4,
+            seed: int = 0) -> "SoftmaxRegression":
+        """
+        Stochastic gradient descent on the cross entropy with L2 regularisation.
+        """
+        order = list(range(len(samples)))
+        shuffler = random.Random(seed)
+        class_index = {name: index for index, name in enumerate(self.classes)}
+
+        for epoch in range(epochs):
+            shuffler.shuffle(order)
+            step = learning_rate / (1 + epoch * 0.1)
+            for sample_index in order:
+                features = samples[sample_index]
+                target = class_index[labels[sample_index]]
+                probabilities = self.predict_proba(features)
+                for current, probability in enumerate(probabilities):
+                    gradient = probability - (1.0 if current == target else 0.0)
+                    class_weights = self.weights[current]
+                    for index, value in features.items():
+                        weight = class_weights.get(index, 0.0)
+                        class_weights[index] = weight - step * (gradient * value + l2 * weight)
+                    self.bias[current] -= step * gradient
+
+        # drop the weights that are practically zero, they only make the model file bigger
+        self.weights = [{index: weight for index, weight in class_weights.items() if abs(weight) > 1e-4}
+                        for class_weights in self.weights]
+        return self
+
+    def to_dict(self) -> dict:
+        return {"classes": self.classes,
+                "weights": [{str(index): round(weight, 6) for index, weight in class_weights.items()}
+                            for class_weights in self.weights],
+                "bias": self.bias}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "SoftmaxRegression":
+        weights = [{int(index): weight for index, weight in class_weights.items()} for class_weights in data["weights"]]
+        return cls(data["classes"], weights, data["bias"])
+
+
+class CrudIntentClassifier:
+    def __init__(self, vocabulary: dict[str, int], idf: list[float], heads: dict[str, SoftmaxRegression]):
+        """
+        :param vocabulary: Term -> feature index.
+        :param idf: Inverse document frequency per feature index.
+        :param heads: "intent", "type" and "single" classifiers.
+        """
+        self.vocabulary = vocabulary
+        self.idf = idf
+        self.heads = heads
+
+    def vectorize(self, text: str) -> dict[int, float]:
+        """
+        L2-normalised TF-IDF vector of the text, unknown terms are ignored.
+        """
+        counts = {}
+        for term in tokenize(text):
+            index = self.vocabulary.get(term)
+            if index is not None:
+                counts[index] = counts.get(index, 0) + 1
+
+        vector = {index: (1 + math.log(count)) * self.idf[index] for index, count in counts.items()}
+        norm = math.sqrt(sum(value * value for value in vector.values()))
+        return {index: value / norm for index, value in vector.items()} if norm else {}
+
+    def predict(self, user_question: str) -> (CrudIntentModel | None, float):
+        """
+        Predicts the CRUD intent of a question without an active operation.
+        :return: The intent in the form of the LLM answer and the confidence of the prediction,
+                 (None, 0.0) if the question has no known terms.
+        """
+        features = self.vectorize(user_question)
+        if not features:
+            return None, 0.0
+
+        intent, confidence = self.heads["intent"].predict(features)
+        entity_type = DataTypeInDB.PERSON.value
+        single = False
+        if intent != NO_INTENT:
+            entity_type, type_confidence = self.heads["type"].predict(features)
+            confidence = min(confidence, type_confidence)
+        if intent == "show":
+            single_label, single_confidence = self.heads["single"].predict(features)
+            single = single_label == "single"
+            confidence = min(confidence, single_confidence)
+        if entity_type is None:
+            return None, 0.0
+
+        return build_intent_model(intent, entity_type, single), confidence
+
+    def save(self, path: str = MODEL_PATH) -> None:
+        data = {"vocabulary": self.vocabulary,
+                "idf": [round(value, 6) for value in self.idf],
+                "heads": {name: head.to_dict() for name, head in self.heads.items()}}
+        temporary_path = f"{path}.tmp"
+        with open(temporary_path, "w", encoding="utf-8") as model_file:
+            json.dump(data, model_file, ensure_ascii=False)
+        # the running server may read the file at any time, replace it at once
+        os.replace(temporary_path, path)
+
+    @classmethod
+    def load(cls, path: str = MODEL_PATH) -> "CrudIntentClassifier":
+        with open(path, encoding="utf-8") as model_file:
+            data = json.load(model_file)
+        heads = {name: SoftmaxRegression.from_dict(head) for name, head in data["heads"].items()}
+        return cls(data["vocabulary"], data["idf"], heads)
+
+    @classmethod
+    def train(cls, questions: list[str], labels: list[dict], min_term_count: int = 2) -> "CrudIntentClassifier":
+        """
+        Builds the vocabulary and trains the heads.
+        :param questions: User questions.
+        :param labels: {"intent": ..., "type": ..., "single": ...} per question, see label_from_llm_answer.
+        :param min_term_count: Terms in fewer questions are not part of the vocabulary.
+        """
+        document_frequency = {}
+        for question in questions:
+            for term in set(tokenize(question)):
+                document_frequency[term] = document_frequency.get(term, 0) + 1
+
+        terms = sorted(term for term, count in document_frequency.items() if count >= min_term_count)
+        vocabulary = {term: index for index, term in enumerate(terms)}
+        idf = [math.log((1 + len(questions)) / (1 + document_frequency[term])) + 1 for term in terms]
+
+        classifier = cls(vocabulary, idf, {})
+        vectors = [classifier.vectorize(question) for question in questions]
+
+        classifier.heads["intent"] = _fit_head(vectors, [label["intent"] for label in labels])
+        with_intent = [index for index, label in enumerate(labels) if label["intent"] != NO_INTENT]
+        classifier.heads["type"] = _fit_head([vectors[index] for index in with_intent],
+                                             [labels[index]["type"] for index in with_intent])
+        shows = [index for index, label in enumerate(labels) if label["intent"] == "show"]
+        classifier.heads["single"] = _fit_head([vectors[index] for index in shows],
+                                               [labels[index]["single"] for index in shows])
+        return classifier
+
+
+def _fit_head(vectors: list[dict[int, float]], labels: list[str]) -> SoftmaxRegression:
+    classes = sorted(set(labels))
+    return SoftmaxRegression(classes).fit(vectors, labels)
+
+
+def build_intent_model(intent: str, entity_type: str, single: bool) -> CrudIntentModel:
+    """
+    Builds the CrudIntentModel the LLM would answer for a question without an active operation:
+    the detected operation is active, a write operation gets the operation_id "NEW".
+    """
+    operations = {}
+    for operation in INTENTS:
+        active = operation == intent
+        operation_id = "NEW" if active and operation != "show" else ""
+        operations[operation] = CrudOperationData(value=active, type=entity_type, operation_id=operation_id)
+    operations["show"] = ShowOperationData(**operations["show"].model_dump(), single=single)
+    return CrudIntentModel(**operations)
+
+
+def label_from_llm_answer(llm_answer: str) -> dict | None:
+    """
+    Reads the training label from a logged CRUD intent answer.
+    :return: {"intent", "type", "single"}, or None if the answer depended on the state of the
+             conversation (a continued or interrupted operation) and cannot be learned from the question alone.
+    """
+    try:
+        answer = CrudIntentModel.model_validate_json(llm_answer)
+    except ValueError:
+        return None
+
+    active = [operation for operation in INTENTS if getattr(answer, operation).value]
+    for operation in INTENTS:
+        operation_id = getattr(answer, operation).operation_id
+        if operation_id not in ("", "NEW"):
+            return None
+    if len(active) > 1:
+        return None
+
+    if not active:
+        return {"intent": NO_INTENT, "type": None, "single": None}
+
+    operation = getattr(answer, active[0])
+    single = "single" if active[0] == "show" and answer.show.single else "all"
+    return {"intent": active[0], "type": operation.type.value, "single": single}
+
+
+_loaded_classifier = None # (modification time of the file, classifier)
+_load_lock = threading.Lock()
+
+
+def get_crud_intent_classifier() -> CrudIntentClassifier | None:
+    """
+    Returns the trained classifier, None if no model was trained yet.
+    A newly trained model file is picked up without restarting the server.
+    """
+    global _loaded_classifier
+    try:
+        modified = os.path.getmtime(MODEL_PATH)
+    except OSError:
+        return None
+
+    with _load_lock:
+        if _loaded_classifier is None or _loaded_classifier[0] != modified:
+            _loaded_classifier = (modified, CrudIntentClassifier.load(MODEL_PATH))
+        return _loaded_classifier[1]
@@ -1,8 +1,10 @@
 import logging
 import os
 from logging.handlers import RotatingFileHandler
+from contextlib import contextmanager
 from contextvars import ContextVar
 from ApartmentManager.backend.AI_API.general.error_texts import ErrorCode, APIError
+from ApartmentManager.backend.AI_API.general.metrics import ERRORS
 
 LOG_NAME = "apartment_manager"
 BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../../"))
@@ -177,6 +179,9 @@ def log_error(error_details: ErrorCode = None, exception: Exception = None) -> s
     trace_id = _ensure_trace_id()
     logger = get_logger()
 
+    if error_details:
+        ERRORS.inc((error_details.value[0], error_details.name))
+
     # If error_details exists, extend the log with it
     extra = _extend_log(error_details, trace_id) if error_details else {
         "trace_id": trace_id,
@@ -198,3 +203,20 @@ def log_error(error_details: ErrorCode = None, exception: Exception = None) -> s
     logger.error(message, exc_info=exc_info_tuple, extra=extra, stacklevel=2)
 
     return trace_id
+
+
+@contextmanager
+def raise_as_api_error(error_details: ErrorCode, passthrough: tuple[type[Exception], ...] = ()):
+    """
+    Logs an error of the block and raises it as APIError with the error code,
+    shared by the sync and async calls of the assistants.
+    :param error_details: Error code of the failed step.
+    :param passthrough: Errors raised as they are, for example the errors of the provider.
+    """
+    try:
+        yield
+    except passthrough:
+        raise
+    except Exception as error:
+        trace_id = log_error(error_details, exception=error)
+        raise APIError(error_details, trace_id) from error
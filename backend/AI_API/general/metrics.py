@@ -0,0 +1,245 @@
+"""
+Prometheus metrics of the chat pipeline, exposed in the text format by GET /metrics.
+
+The metrics stay on in production, so recording must be cheap:
+every thread writes into its own shard of values without taking a lock.
+Only the scrape takes the lock of the registry to sum up the shards.
+A shard of a finished thread is merged into the retired values, so the number of shards stays bounded.
+"""
+import functools
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+
+# Latency buckets in seconds: LLM calls take seconds, SQLite and log writes milliseconds
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+        self._local = threading.local()
+        self._shards: dict[int, dict] = {} # id of the shard -> values of a living thread
+        self._retired: dict = {} # summed values of finished threads
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def shard(self) -> dict:
+        """
+        Values of the current thread: (metric name, label values) -> float or list of floats.
+        """
+        try:
+            return self._local.values
+        except AttributeError:
+            values = {}
+            self._local.values = values
+            with self._lock:
+                self._shards[id(values)] = values
+            # merge the values when the thread object is gone
+            weakref.finalize(threading.current_thread(), self._retire_shard, values)
+            return values
+
+    def _retire_shard(self, values: dict) -> None:
+        with self._lock:
+            self._shards.pop(id(values), None)
+            _merge_values(self._retired, values)
+
+    def collect(self) -> dict:
+        """
+        Sums the values of all shards.
+        """
+        with self._lock:
+            total = {}
+            _merge_values(total, self._retired)
+            for values in list(self._shards.values()):
+                _merge_values(total, values)
+        return total
+
+    def render(self) -> str:
+        """
+        Renders all metrics in the Prometheus text exposition format.
+        """
+        values = self.collect()
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render(values))
+        return "\n".join(lines) + "\n"
+
+
+def _merge_values(target: dict, source: dict) -> None:
+    # the dict of another thread may grow while it is copied, take a snapshot of the items
+    for key, value in list(source.items()):
+        if isinstance(value, list):
+            current = target.get(key)
+            if current is None:
+                target[key] = list(value)
+            else:
+                for index, item in enumerate(value):
+                    current[index] += item
+        else:
+            target[key] = target.get(key, 0) + value
+
+
+def _format_labels(label_names: tuple, label_values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(label_names, label_values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class Counter:
+    def __init__(self, registry: MetricsRegistry, name: str, documentation: str, label_names: tuple = ()):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        registry.register(self)
+
+    def inc(self, label_values: tuple = (), amount: float = 1) -> None:
+        shard = self.registry.shard()
+        key = (self.name, label_values)
+        shard[key] = shard.get(key, 0) + amount
+
+    def render(self, values: dict) -> list[str]:
+        lines = [f"# HELP {self.name}_total {self.documentation}", f"# TYPE {self.name}_total counter"]
+        for (name, label_values), value in sorted(values.items(), key=_sort_key):
+            if name == self.name:
+                lines.append(f"{self.name}_total{_format_labels(self.label_names, label_values)} {value:g}")
+        return lines
+
+
+class Histogram:
+    def __init__(self,
+                 registry: MetricsRegistry,
+                 name: str,
+                 documentation: str,
+                 label_names: tuple = (),
+                 buckets: tuple = DEFAULT_BUCKETS):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self.buckets = buckets
+        registry.register(self)
+
+    def observe(self, label_values: tuple, value: float) -> None:
+        shard = self.registry.shard()
+        key = (self.name, label_values)
+        # counts per bucket (not cumulative) + count above the last bucket + sum
+        entry = shard.get(key)
+        if entry is None:
+            entry = [0.0] * (len(self.buckets) + 2)
+            shard[key] = entry
+        for index, upper_bound in enumerate(self.buckets):
+            if value <= upper_bound:
+                entry[index] += 1
+                break
+        else:
+            entry[len(self.buckets)] += 1
+        entry[-1] += value
+
+    @contextmanager
+    def time(self, label_values: tuple = ()):
+        """
+        Observes the duration of the block in seconds.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(label_values, time.perf_counter() - start)
+
+    def render(self, values: dict) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for (name, label_values), entry in sorted(values.items(), key=_sort_key):
+            if name != self.name:
+                continue
+            cumulative = 0
+            for upper_bound, bucket_count in zip(self.buckets, entry):
+                cumulative += bucket_count
+                labels = _format_labels(self.label_names, label_values, f'le="{upper_bound:g}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative:g}")
+            count = cumulative + entry[len(self.buckets)]
+            labels = _format_labels(self.label_names, label_values, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{labels} {count:g}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, label_values)} {entry[-1]:g}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, label_values)} {count:g}")
+        return lines
+
+
+class Gauge:
+    """
+    Gauge whose value is read by a function at scrape time, for example the length of a queue.
+    """
+    def __init__(self, registry: MetricsRegistry, name: str, documentation: str, read_value):
+        self.name = name
+        self.documentation = documentation
+        self.read_value = read_value
+        registry.register(self)
+
+    def render(self, values: dict) -> list[str]:
+        return [f"# HELP {self.name} {self.documentation}",
+                f"# TYPE {self.name} gauge",
+                f"{self.name} {self.read_value():g}"]
+
+
+def _sort_key(item):
+    (name, label_values), _ = item
+    return name, tuple(str(value) for value in label_values)
+
+
+REGISTRY = MetricsRegistry()
+
+CHAT_TURN_SECONDS = Histogram(REGISTRY, "apartment_chat_turn_duration_seconds",
+                              "End-to-end latency of ConversationClient.get_llm_answer.", ("mode",))
+LLM_CALL_SECONDS = Histogram(REGISTRY, "apartment_llm_call_duration_seconds",
+                             "Latency of one LLM call per assistant.", ("assistant",))
+SQL_FUNCTION_SECONDS = Histogram(REGISTRY, "apartment_sql_function_duration_seconds",
+                                 "Latency of the CRUD functions of the rental database.", ("function",))
+LOG_WRITE_SECONDS = Histogram(REGISTRY, "apartment_log_write_duration_seconds",
+                              "Latency of writing one conversation log entry.")
+HISTORY_TOKENS_SAVED = Histogram(REGISTRY, "apartment_history_tokens_saved",
+                                 "Estimated input tokens per LLM call that a turn does not resend "
+                                 "thanks to the compacted conversation history.",
+                                 buckets=(0, 100, 250, 500, 1000, 2500, 5000, 10000, 25000, 50000, 100000))
+ERRORS = Counter(REGISTRY, "apartment_errors", "Logged errors per ErrorCode.", ("code", "name"))
+PROMPT_USAGE = Counter(REGISTRY, "apartment_prompt_usage", "LLM calls per system prompt (Prompt member).", ("prompt",))
+STRUCTURED_OUTPUT_PARSES = Counter(REGISTRY, "apartment_structured_output_parses",
+                                   "Structured LLM answers per assistant and outcome (clean, repaired, failed).",
+                                   ("source", "outcome"))
+STRUCTURED_OUTPUT_REPAIRS = Counter(REGISTRY, "apartment_structured_output_repairs",
+                                    "Local repairs of structured LLM answers per assistant and kind.", ("source", "kind"))
+VALIDATION_REPAIRS = Counter(REGISTRY, "apartment_validation_repairs",
+                             "Repair calls of the write flow after a failed validation, per outcome.", ("outcome",))
+WRITE_CONTINUATIONS = Counter(REGISTRY, "apartment_write_continuations",
+                              "Turns of an active write operation answered with one LLM call (continued) "
+                              "or passed on to the CRUD intent check (interrupted).", ("outcome",))
+CRUD_INTENT_ROUTES = Counter(REGISTRY, "apartment_crud_intent_routes",
+                             "CRUD intent turns answered by the local classifier or the LLM, per route.", ("route",))
+CRUD_INTENT_CACHE_LOOKUPS = Counter(REGISTRY, "apartment_crud_intent_cache_lookups",
+                                    "Lookups of cached CRUD intents of stateless turns per outcome (hit, miss).",
+                                    ("outcome",))
+ANSWER_CACHE_LOOKUPS = Counter(REGISTRY, "apartment_answer_cache_lookups",
+                               "Lookups of cached read answers per kind (general, show) and outcome (hit, miss).",
+                               ("kind", "outcome"))
+
+
+def observe_sql_function(func):
+    """
+    Decorator for the CRUD functions, observes their latency in SQL_FUNCTION_SECONDS.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with SQL_FUNCTION_SECONDS.time((func.__name__,)):
+            return func(*args, **kwargs)
+    return wrapper
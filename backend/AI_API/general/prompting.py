@@ -2,6 +2,8 @@ import copy
 from enum import Enum
 from ApartmentManager.backend.AI_API.general.json_serialisation import dumps_for_llm_prompt
 from ApartmentManager.backend.AI_API.general.envelopes.envelopes_api import EnvelopeApi
+from ApartmentManager.backend.AI_API.general.envelopes.envelopes_business_logic import ID_FIELDS
+from ApartmentManager.backend.config.server_config import FEEDBACK_DIGEST_MAX_BYTES
 
 GET_FUNCTION_CALL_PROMPT = {
   "role": "system",
@@ -18,6 +20,7 @@ GET_FUNCTION_CALL_PROMPT = {
           "Never modify, filter, or extend endpoint paths.",
           "Return only data that the API can actually retrieve — do not summarize, assume, or interpolate."
         ],
+        "paging": "For a large list use make_restful_api_get_page with after='' for the first page. If the user asks for more records, pass the 'next' value of the previous page as 'after'. A 'next' of null means that all records were retrieved."
       },
 
       "data_integrity": {
@@ -42,7 +45,8 @@ GET_FUNCTION_CALL_PROMPT = {
 
     "examples": [
       {"user": "Show me all apartments.", "action": "GET /apartments"},
-      {"user": "List all tenants.", "action": "GET /persons"}
+      {"user": "List all tenants.", "action": "GET /persons"},
+      {"user": "Show me the first 50 persons.", "action": "GET page /persons, limit=50, after=''"}
     ],
 
     "response_behavior": {
@@ -86,23 +90,6 @@ POST_FUNCTION_CALL_PROMPT = {
 }
 
 CRUD_INTENT_PROMPT = {
-  "feedback": {
-    # Injected dynamically by the backend on each turn.
-    # operation_id indicates the state:
-    # - Empty or None → no active operation, ready for new operation
-    # - Non-empty → operation is in progress (not ready)
-    "operation_id": None, # Unique ID of the current active operation (if any)
-
-    # Dictionary of interrupted operations (short-term memory)
-    # Structure: {operation_type: {"operation_id": str, "type": str, "envelope": dict}}
-    # Example: {"update": {"operation_id": "abc123", "type": "person", "envelope": {...}}}
-    "interrupted_operations": {},
-
-    # The result is an opaque backend payload (for example, an envelope).
-    # You MUST NOT use it to decide the current CRUD/SHOW booleans.
-    # Its structure is not part of this prompt's contract.
-    "result": None,
-  },
   "role": "system",
   "instructions": {
     "task": (
@@ -255,6 +242,25 @@ CRUD_INTENT_PROMPT = {
         # Implicitly, the model should generate a text response asking to cancel one of the operations
       }
     ]
+  },
+  # volatile state of the turn after the static instructions, the instructions are a stable prefix
+  # that the provider can cache (see prompt_cache)
+  "feedback": {
+    # Injected dynamically by the backend on each turn.
+    # operation_id indicates the state:
+    # - Empty or None → no active operation, ready for new operation
+    # - Non-empty → operation is in progress (not ready)
+    "operation_id": None, # Unique ID of the current active operation (if any)
+
+    # Dictionary of interrupted operations (short-term memory)
+    # Structure: {operation_type: {"operation_id": str, "type": str, "envelope": dict}}
+    # Example: {"update": {"operation_id": "abc123", "type": "person", "envelope": {...}}}
+    "interrupted_operations": {},
+
+    # The result is an opaque backend payload, a short digest of the previous answer (see build_feedback_digest).
+    # You MUST NOT use it to decide the current CRUD/SHOW booleans.
+    # Its structure is not part of this prompt's contract.
+    "result": None,
   }
 }
 
@@ -464,19 +470,181 @@ class Prompt(Enum):
   POST_FUNCTION_CALL = POST_FUNCTION_CALL_PROMPT
 
 
-def inject_feedback(feedback: (EnvelopeApi, bool), operation_id: str = None, interrupted_operations: dict = None):
-  # create a copy and do not touch the originals
-  combined_prompt = copy.deepcopy(Prompt.CRUD_INTENT.value)
+# Added to the write prompt on the turns of an active write operation, see build_continuation_prompt
+CONTINUATION_RULES = (
+  "A write operation is in progress and this turn replaces the separate CRUD intent check. "
+  "The JSON object has the additional key continues_operation:boolean. "
+  "Set continues_operation to true if the latest user message continues the current operation "
+  "(data, corrections, answers to your questions, confirmation or refusal of optional fields). "
+  "Set it to false if the user starts a different operation, cancels the current one, "
+  "or asks a separate question; then set ready to false, data to null and comment to an empty string, "
+  "the backend handles the message itself."
+)
+
+
+class PromptTemplate:
+  """
+  Prompt serialized once. The dynamic parts (slots) are marked in the serialized text,
+  a rendering splices only their serialized values between the static fragments.
+  """
+  def __init__(self, prompt: dict, slots: tuple[tuple[str, ...], ...] = ()):
+    """
+    :param prompt: Prompt as dictionary, it is not changed.
+    :param slots: Key paths of the dynamic values, for example (("feedback",),).
+    """
+    marked_prompt = copy.deepcopy(prompt)
+    markers = {}
+    for path in slots:
+      marker = f"\u0000slot:{'.'.join(path)}\u0000"
+      parent = marked_prompt
+      for key in path[:-1]:
+        parent = parent[key]
+      markers[path] = (dumps_for_llm_prompt(marker), parent[path[-1]])
+      parent[path[-1]] = marker
+
+    text = dumps_for_llm_prompt(marked_prompt)
+    # the slots in the order of their appearance in the text
+    ordered_slots = sorted(slots, key=lambda slot_path: text.index(markers[slot_path][0]))
+    self.slot_names = [path[-1] for path in ordered_slots]
+    self.defaults = {path[-1]: markers[path][1] for path in ordered_slots}
+
+    self.fragments = []
+    for path in ordered_slots:
+      fragment, text = text.split(markers[path][0], 1)
+      self.fragments.append(fragment)
+    self.fragments.append(text)
+
+    # the prompt as sent without dynamic values
+    self.static_text = self.render()
+
+  def render(self, **slot_values) -> str:
+    """
+    :param slot_values: Values of the slots by the last key of their path, missing slots keep the value of the prompt.
+    """
+    if not self.slot_names:
+      return self.fragments[0]
+
+    parts = [self.fragments[0]]
+    for slot_name, fragment in zip(self.slot_names, self.fragments[1:]):
+      parts.append(dumps_for_llm_prompt(slot_values.get(slot_name, self.defaults[slot_name])))
+      parts.append(fragment)
+    return "".join(parts)
+
+
+def _with_continuation(write_prompt: dict) -> dict:
+  combined_prompt = copy.deepcopy(write_prompt)
+  combined_prompt["instructions"]["continuation"] = CONTINUATION_RULES
+  return combined_prompt
+
+
+# every prompt is serialized once at import, a turn only splices its dynamic values
+COMPILED_PROMPTS = {prompt: PromptTemplate(prompt.value, slots=(("feedback",),) if prompt is Prompt.CRUD_INTENT else ())
+                    for prompt in Prompt}
+_CRUD_INTENT_INSTRUCTIONS = dumps_for_llm_prompt({key: value for key, value in Prompt.CRUD_INTENT.value.items()
+                                                  if key != "feedback"})
+_COMPILED_CONTINUATION_PROMPTS = {prompt: PromptTemplate(_with_continuation(prompt.value))
+                                  for prompt in (Prompt.CREATE_ENTITY, Prompt.UPDATE_ENTITY, Prompt.DELETE_ENTITY)}
+
+
+def compiled_prompt(prompt: "Prompt") -> str:
+  """
+  Serialized prompt without dynamic values.
+  """
+  return COMPILED_PROMPTS[prompt].static_text
+
+
+def build_continuation_prompt(write_prompt: "Prompt") -> str:
+  """
+  Write prompt with the continuation check, for the single LLM call of a continuation turn.
+  """
+  return _COMPILED_CONTINUATION_PROMPTS[write_prompt].static_text
+
+
+def build_feedback_block(feedback: (EnvelopeApi, bool), operation_id: str = None, interrupted_operations: dict = None):
+  """
+  The feedback block of the CRUD intent prompt for the running turn.
+  """
+  # a new feedback block, the originals are not touched
+  feedback_block = dict(COMPILED_PROMPTS[Prompt.CRUD_INTENT].defaults["feedback"])
 
   if feedback:
-    combined_prompt["feedback"]["result"] = feedback[0]
+    feedback_block["result"] = build_feedback_digest(feedback)
 
   if operation_id:
-    combined_prompt["feedback"]["operation_id"] = operation_id
+    feedback_block["operation_id"] = operation_id
 
   if interrupted_operations:
-    combined_prompt["feedback"]["interrupted_operations"] = interrupted_operations
-
-  system_prompt = dumps_for_llm_prompt(combined_prompt)
+    feedback_block["interrupted_operations"] = interrupted_operations
+
+  return feedback_block
+
+
+def crud_intent_instructions() -> str:
+  """
+  The static part of the CRUD intent prompt, without the feedback block (see prompt_cache).
+  """
+  return _CRUD_INTENT_INSTRUCTIONS
+
+
+def feedback_message(feedback_block: dict) -> str:
+  """
+  The feedback block as a message, sent with the question if the instructions come from the cache of the provider.
+  """
+  return dumps_for_llm_prompt({"feedback": feedback_block})
+
+# entity of a database row, recognized by its primary key
+_ENTITY_OF_ID_FIELD = {id_field: entity.value for entity, id_field in ID_FIELDS.items()}
+_FEEDBACK_MESSAGE_CHARS = 160
+_FEEDBACK_MAX_IDS = 20
+
+
+def build_feedback_digest(feedback: (dict, bool)) -> dict:
+  """
+  Digest of the previous answer for the CRUD intent prompt: the type of the envelope, the entity type,
+  the number of rows, the IDs and the beginning of the message.
+  The whole envelope of a SHOW turn holds the complete table, the digest stays below FEEDBACK_DIGEST_MAX_BYTES.
+  :param feedback: (envelope as dictionary, cycle_is_ready) of the previous turn.
+  """
+  envelope, cycle_is_ready = feedback
+  result = envelope.get("result") or {}
+  rows = _payload_rows(result.get("payload"))
+
+  entity_type, ids = None, []
+  for row in rows:
+    id_field = next((key for key in row if key in _ENTITY_OF_ID_FIELD), None)
+    if id_field is not None:
+      entity_type = entity_type or _ENTITY_OF_ID_FIELD[id_field]
+      ids.append(row[id_field])
+
+  digest = {
+    "type": envelope.get("type"),
+    "ready": cycle_is_ready,
+    "entity_type": entity_type,
+    "rows": len(rows),
+    "ids": ids[:_FEEDBACK_MAX_IDS],
+    "message": str(result.get("message") or "")[:_FEEDBACK_MESSAGE_CHARS],
+  }
 
-  return system_prompt
\ No newline at end of file
+  # the IDs and then the message are shortened until the digest fits
+  while len(dumps_for_llm_prompt(digest).encode("utf-8")) > FEEDBACK_DIGEST_MAX_BYTES:
+    if digest["ids"]:
+      digest["ids"] = digest["ids"][:len(digest["ids"]) // 2]
+    elif digest["message"]:
+      digest["message"] = digest["message"][:len(digest["message"]) // 2]
+    else:
+      break
+
+  return digest
+
+
+def _payload_rows(payload) -> list[dict]:
+  # a list of rows, one row, or a response of the internal API with the rows in one of its fields
+  if isinstance(payload, list):
+    return [row for row in payload if isinstance(row, dict)]
+  if isinstance(payload, dict):
+    if any(key in _ENTITY_OF_ID_FIELD for key in payload):
+      return [payload]
+    for value in payload.values():
+      if isinstance(value, list):
+        return [row for row in value if isinstance(row, dict)]
+  return []
@@ -0,0 +1,106 @@
+"""
+Retry with exponential backoff and a circuit breaker for the calls to the LLM provider.
+
+Transient provider errors (429, 5xx, broken connections) are retried with a growing, randomised delay
+("full jitter"), so many conversations that failed at the same moment do not retry at the same moment.
+After several transient failures in a row the circuit opens: the calls fail fast for a cool-down time
+instead of waiting for a degraded provider. Then one trial call is let through (half-open);
+its success closes the circuit, its failure opens it again.
+"""
+import random
+import threading
+import time
+from ApartmentManager.backend.AI_API.general.error_texts import APIError, ErrorCode
+from ApartmentManager.backend.AI_API.general.logger import log_error, log_info
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class ProviderUnavailable(APIError):
+    """
+    The circuit of the provider is open, the call was not sent.
+    """
+    def __init__(self, trace_id=None):
+        super().__init__(ErrorCode.LLM_PROVIDER_UNAVAILABLE, trace_id)
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, failure_threshold: int, reset_seconds: float):
+        """
+        :param name: Name of the protected provider, used in the log.
+        :param failure_threshold: Transient failures in a row that open the circuit.
+        :param reset_seconds: Time the circuit stays open before a trial call is let through.
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        return self._state
+
+    def before_call(self) -> None:
+        """
+        Checks if a call may be sent.
+        :raise ProviderUnavailable: The circuit is open.
+        """
+        with self._lock:
+            if self._state == CLOSED:
+                return
+
+            if self._state == OPEN and time.monotonic() - self._opened_at >= self.reset_seconds:
+                self._state = HALF_OPEN
+                self._trial_running = False
+
+            # in the half-open state only one trial call at a time
+            if self._state == HALF_OPEN and not self._trial_running:
+                self._trial_running = True
+                return
+
+        trace_id = log_error(ErrorCode.LLM_PROVIDER_UNAVAILABLE)
+        raise ProviderUnavailable(trace_id)
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self._state != CLOSED:
+                log_info(f"Circuit of {self.name} closed.")
+            self._state = CLOSED
+            self._failures = 0
+            self._trial_running = False
+
+    def record_failure(self) -> None:
+        """
+        Counts a transient failure of the provider. Other errors (for example 400) are not counted.
+        """
+        with self._lock:
+            self._failures += 1
+            if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != OPEN:
+                    log_info(f"Circuit of {self.name} opened after {self._failures} failures.")
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+                self._trial_running = False
+
+    def release_trial(self) -> None:
+        """
+        Frees the trial slot of a call that ended without a verdict on the provider
+        (for example a rejected request or an expired deadline).
+        """
+        with self._lock:
+            self._trial_running = False
+
+
+def backoff_delay(retry_number: int, base_seconds: float, max_seconds: float) -> float:
+    """
+    Delay before a retry: random between 0 and base * 2^retry, at most max_seconds.
+    :param retry_number: 0 for the first retry.
+    """
+    return random.uniform(0, min(max_seconds, base_seconds * (2 ** retry_number)))
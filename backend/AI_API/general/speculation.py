@@ -0,0 +1,95 @@
+"""
+Speculative LLM calls of a chat turn.
+
+Most questions without an active write operation end in the general answer, whose first step is the
+function call proposal. In the speculative mode (SPECULATIVE_FUNCTION_CALL) the proposal is requested
+at the same time as the CRUD intent: if the intent is "none", the proposal is already there and the turn
+saves one round trip; otherwise it is abandoned and the call was wasted.
+apartment_speculative_calls_total{outcome="wasted"} / all outcomes is the share of the wasted calls.
+"""
+import asyncio
+import contextvars
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable
+from ApartmentManager.backend.AI_API.general.logger import log_info
+from ApartmentManager.backend.AI_API.general.metrics import REGISTRY, Counter
+from ApartmentManager.backend.config.server_config import MAX_CONCURRENT_CHAT_TURNS
+
+SPECULATIVE_CALLS = Counter(REGISTRY, "apartment_speculative_calls",
+                            "Speculative LLM calls per outcome (committed, wasted, failed).", ("call", "outcome"))
+
+# at most one speculative call per running chat turn
+_EXECUTOR = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_CHAT_TURNS, thread_name_prefix="speculative-llm")
+
+
+class SpeculativeCall:
+    def __init__(self, name: str, future: Future | asyncio.Task):
+        """
+        :param name: Name of the call, label of the metric.
+        :param future: Future of the call in the worker thread (sync) or task on the event loop (async).
+        """
+        self.name = name
+        self._future = future
+        self._settled = False
+
+    @classmethod
+    def start(cls, name: str, function: Callable, *args) -> "SpeculativeCall":
+        """
+        Runs the call in a worker thread. The context is copied,
+        so the call counts to the deadline and the stage timings of the turn.
+        """
+        context = contextvars.copy_context()
+        return cls(name, _EXECUTOR.submit(context.run, function, *args))
+
+    @classmethod
+    def start_async(cls, name: str, coroutine) -> "SpeculativeCall":
+        """
+        Runs the coroutine as a task of the running event loop.
+        """
+        task = asyncio.ensure_future(coroutine)
+        # the error of an abandoned task is not awaited by anybody, mark it as retrieved
+        task.add_done_callback(lambda done: done.cancelled() or done.exception())
+        return cls(name, task)
+
+    def take(self) -> Any | None:
+        """
+        Waits for the result of the call and commits it.
+        :return: Result of the call, None if it failed and the caller has to do the call itself.
+        """
+        self._settled = True
+        try:
+            result = self._future.result()
+        except Exception as error:
+            self._record_failure(error)
+            return None
+        SPECULATIVE_CALLS.inc((self.name, "committed"))
+        return result
+
+    async def take_async(self) -> Any | None:
+        """
+        Async version of take.
+        """
+        self._settled = True
+        try:
+            result = await self._future
+        except Exception as error:
+            self._record_failure(error)
+            return None
+        SPECULATIVE_CALLS.inc((self.name, "committed"))
+        return result
+
+    def abandon(self) -> None:
+        """
+        Drops a result that is not needed. A call already sent cannot be taken back, it runs to its end
+        in the background (an async task is cancelled) and counts as wasted.
+        Does nothing if the result was taken.
+        """
+        if self._settled:
+            return
+        self._settled = True
+        self._future.cancel()
+        SPECULATIVE_CALLS.inc((self.name, "wasted"))
+
+    def _record_failure(self, error: Exception) -> None:
+        SPECULATIVE_CALLS.inc((self.name, "failed"))
+        log_info(f"Speculative call {self.name} failed, it is repeated: {error!r}")
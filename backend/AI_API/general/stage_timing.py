@@ -0,0 +1,84 @@
+"""
+Timers for the stages of one chat turn (LLM calls, loopback HTTP, SQLite, log writes).
+
+The timings of the running turn are kept in a ContextVar, so the assistants do not need to pass them around.
+asyncio.to_thread and contextvars.copy_context copy the context, the copies point to the same dict,
+so the stages measured in worker threads are added to the turn as well.
+Outside of collect_stage_timings the timers do nothing.
+"""
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from ApartmentManager.backend.AI_API.general.logger import log_info
+
+# Stage names, they are also the metric names of the Server-Timing header
+CRUD_INTENT_LLM = "crud_intent_llm"
+WRITE_COLLECT_LLM = "write_collect_llm"
+FUNCTION_CALL_LLM = "function_call_llm"
+GENERAL_ANSWER_LLM = "general_answer_llm"
+LOOPBACK_HTTP = "loopback_http"
+SQLITE = "sqlite"
+LOG_WRITE = "log_write"
+
+# stage name -> [duration in ms, number of measurements]
+_STAGE_TIMINGS: ContextVar[dict[str, list] | None] = ContextVar("stage_timings", default=None)
+
+
+@contextmanager
+def collect_stage_timings():
+    """
+    Collects the stage timings of one chat turn.
+    At the end the breakdown is logged with the trace_id of the turn.
+    :return: Dictionary stage name -> [duration in ms, count], filled while the block runs.
+    """
+    timings = {}
+    token = _STAGE_TIMINGS.set(timings)
+    start = time.perf_counter()
+    try:
+        yield timings
+    finally:
+        timings["total"] = [(time.perf_counter() - start) * 1000, 1]
+        _STAGE_TIMINGS.reset(token)
+        log_info(f"Stage timings: {format_server_timing(timings)}")
+
+
+def record_stage(stage: str, duration_ms: float) -> None:
+    """
+    Adds a measured duration to a stage of the running turn.
+    """
+    timings = _STAGE_TIMINGS.get()
+    if timings is None:
+        return
+    entry = timings.setdefault(stage, [0.0, 0])
+    entry[0] += duration_ms
+    entry[1] += 1
+
+
+@contextmanager
+def stage_timer(stage: str):
+    """
+    Measures the block as a stage of the running turn.
+    """
+    if _STAGE_TIMINGS.get() is None:
+        yield
+        return
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, (time.perf_counter() - start) * 1000)
+
+
+def format_server_timing(timings: dict[str, list]) -> str:
+    """
+    Formats the timings as value of the Server-Timing header,
+    for example: crud_intent_llm;dur=812.4, sqlite;dur=3.1;desc="4x", total;dur=1630.2
+    """
+    metrics = []
+    for stage, (duration_ms, count) in timings.items():
+        metric = f"{stage};dur={duration_ms:.1f}"
+        if count > 1:
+            metric += f';desc="{count}x"'
+        metrics.append(metric)
+    return ", ".join(metrics)
@@ -0,0 +1,73 @@
+"""
+Helpers for streaming chat answers as Server-Sent Events.
+"""
+import json
+import re
+from typing import Any
+
+
+def format_sse(event: str, data: Any) -> str:
+    """
+    Formats one Server-Sent Event.
+    :param event: Name of the event, for example "stage", "delta", "envelope" or "error".
+    :param data: JSON serializable payload of the event.
+    :return: Event text terminated by an empty line.
+    """
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+
+class JsonStringFieldStream:
+    """
+    Extracts the value of one string field from JSON text that arrives in chunks,
+    for example the 'comment' of a structured LLM answer that is still being generated.
+    Each call of feed() returns only the newly decoded characters of the value.
+    """
+    _ESCAPES = {"n": "\n", "t": "\t", "r": "\r", "b": "\b", "f": "\f"}
+
+    def __init__(self, field_name: str):
+        self._field_pattern = re.compile(r'"%s"\s*:\s*"' % re.escape(field_name))
+        self._buffer = ""
+        self._position = None # index of the next undecoded character of the value
+        self._done = False
+
+    def feed(self, chunk: str) -> str:
+        self._buffer += chunk
+        if self._done:
+            return ""
+
+        if self._position is None:
+            match = self._field_pattern.search(self._buffer)
+            if not match:
+                return ""
+            self._position = match.end()
+
+        decoded = []
+        i = self._position
+        while i < len(self._buffer):
+            char = self._buffer[i]
+
+            if char == "\\":
+                # wait for the rest of the escape sequence
+                if i + 1 >= len(self._buffer):
+                    break
+                escaped = self._buffer[i + 1]
+                if escaped == "u":
+                    if i + 6 > len(self._buffer):
+                        break
+                    decoded.append(chr(int(self._buffer[i + 2:i + 6], 16)))
+                    i += 6
+                    continue
+                decoded.append(self._ESCAPES.get(escaped, escaped))
+                i += 2
+                continue
+
+            if char == '"':
+                self._done = True
+                i += 1
+                break
+
+            decoded.append(char)
+            i += 1
+
+        self._position = i
+        return "".join(decoded)
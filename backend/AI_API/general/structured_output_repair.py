@@ -0,0 +1,407 @@
+"""
+Local repair of structured (JSON) LLM answers.
+
+The structured assistants ask for JSON, but the answer sometimes comes with small glitches:
+a code fence, prose around the object, single quotes, Python literals, a trailing comma
+or a closing brace cut off at the token limit. Values may also miss the format of the schema,
+for example "1.200,50 €" for a number or "05.01.2024" for a date.
+These glitches are fixed here deterministically before an answer is declared a parse error,
+which would cost another LLM round trip.
+"""
+import json
+import re
+from datetime import date, datetime
+from typing import Any
+from ApartmentManager.backend.AI_API.general.logger import log_info
+from ApartmentManager.backend.AI_API.general.metrics import STRUCTURED_OUTPUT_PARSES, STRUCTURED_OUTPUT_REPAIRS
+
+_CODE_FENCE = re.compile(r"^\s*```[a-zA-Z]*\s*\n?(.*?)\n?\s*```\s*$", re.DOTALL)
+_PYTHON_LITERALS = {"True": "true", "False": "false", "None": "null"}
+# a key at the end of an object whose value was cut off completely
+_DANGLING_KEY = re.compile(r'([{,])\s*"(?:[^"\\]|\\.)*"\s*:?\s*$')
+# complete value at the end of a cut off answer, a number may have lost its last digits
+_COMPLETE_LAST_VALUE = re.compile(r'(["{\[}\]]|\btrue|\bfalse|\bnull)$')
+
+# number with optional currency or unit, for example "1.200,50 €", "EUR 850", "72 m²"
+_NUMBER_WITH_UNIT = re.compile(r"^\s*(?:€|\$|eur|euro|usd)?\s*([-+]?[\d.,' ]*\d)\s*"
+                               r"(?:€|\$|eur|euro|euros|usd|m2|m²|qm|sqm|%)?\s*$", re.IGNORECASE)
+_DATE_FORMATS = ("%Y-%m-%d", "%d.%m.%Y", "%d.%m.%y", "%d/%m/%Y", "%Y/%m/%d", "%d-%m-%Y")
+
+
+def load_structured_output(text: str, json_schema: dict, source: str) -> Any:
+    """
+    Parses the JSON answer of the LLM, repairs common malformations and coerces the values to the schema.
+    :param text: Raw text of the LLM answer.
+    :param json_schema: JSON schema the answer was requested with (from get_json_schema).
+    :param source: Name of the assistant, label of the metrics.
+    :return: Parsed answer.
+    :raise ValueError: The answer cannot be repaired.
+    """
+    repairs = []
+    try:
+        value = json.loads(text)
+    except (TypeError, ValueError):
+        try:
+            value = json.loads(_repair_json_text(text or "", repairs))
+        except ValueError:
+            STRUCTURED_OUTPUT_PARSES.inc((source, "failed"))
+            raise
+
+    value = coerce_to_schema(value, json_schema, json_schema, repairs)
+    _record_repairs(source, repairs)
+    return value
+
+
+def coerce_structured_output(value: Any, json_schema: dict, source: str) -> Any:
+    """
+    Coerces an answer already parsed by the SDK to the schema, see load_structured_output.
+    """
+    repairs = []
+    value = coerce_to_schema(value, json_schema, json_schema, repairs)
+    _record_repairs(source, repairs)
+    return value
+
+
+def _record_repairs(source: str, repairs: list[str]) -> None:
+    if not repairs:
+        STRUCTURED_OUTPUT_PARSES.inc((source, "clean"))
+        return
+
+    STRUCTURED_OUTPUT_PARSES.inc((source, "repaired"))
+    for kind in repairs:
+        STRUCTURED_OUTPUT_REPAIRS.inc((source, kind))
+    log_info(f"Structured answer of {source} repaired locally: {', '.join(repairs)}")
+
+
+# ========= TEXT REPAIR =========
+
+def _repair_json_text(text: str, repairs: list[str]) -> str:
+    """
+    Applies the text repairs one after another, every applied repair is added to repairs.
+    """
+    fenced = _CODE_FENCE.match(text)
+    if fenced:
+        text = fenced.group(1)
+        repairs.append("code_fence")
+
+    extracted = _extract_json_value(text)
+    if extracted != text.strip():
+        text = extracted
+        repairs.append("surrounding_text")
+
+    normalized, kinds = _normalize_tokens(text)
+    if kinds:
+        text = normalized
+        repairs.extend(kinds)
+
+    closed = _close_truncated(text)
+    if closed != text:
+        text = closed
+        repairs.append("truncated")
+
+    return text
+
+
+def _extract_json_value(text: str) -> str:
+    """
+    Cuts the prose before and after the first JSON object or array.
+    If the value is not closed (truncated answer), the rest of the text is kept.
+    """
+    starts = [index for index in (text.find("{"), text.find("[")) if index >= 0]
+    if not starts:
+        return text.strip()
+
+    start = min(starts)
+    depth = 0
+    quote = None
+    escaped = False
+    for index in range(start, len(text)):
+        char = text[index]
+        if quote:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == quote:
+                quote = None
+        elif char in "\"'":
+            quote = char
+        elif char in "{[":
+            depth += 1
+        elif char in "}]":
+            depth -= 1
+            if depth == 0:
+                return text[start:index + 1]
+
+    return text[start:].strip()
+
+
+def _normalize_tokens(text: str) -> (str, list[str]):
+    """
+    Rewrites single-quoted strings and Python literals into JSON and drops trailing commas.
+    Double-quoted strings are copied unchanged.
+    """
+    result = []
+    kinds = []
+    index = 0
+    length = len(text)
+    while index < length:
+        char = text[index]
+
+        if char == '"':
+            end = _string_end(text, index, '"')
+            result.append(text[index:end])
+            index = end
+
+        elif char == "'":
+            end = _string_end(text, index, "'")
+            content = text[index + 1:end - 1] if end - index >= 2 and text[end - 1] == "'" else text[index + 1:end]
+            result.append(json.dumps(content.replace("\\'", "'"), ensure_ascii=False))
+            _add_once(kinds, "single_quotes")
+            index = end
+
+        elif char.isalpha():
+            end = index
+            while end < length and (text[end].isalnum() or text[end] == "_"):
+                end += 1
+            word = text[index:end]
+            if word in _PYTHON_LITERALS:
+                word = _PYTHON_LITERALS[word]
+                _add_once(kinds, "python_literals")
+            result.append(word)
+            index = end
+
+        elif char == ",":
+            following = text[index + 1:].lstrip()
+            if following[:1] in ("}", "]"):
+                _add_once(kinds, "trailing_comma")
+            else:
+                result.append(char)
+            index += 1
+
+        else:
+            result.append(char)
+            index += 1
+
+    return "".join(result), kinds
+
+
+def _string_end(text: str, start: int, quote: str) -> int:
+    """
+    :return: Index behind the closing quote, or the end of the text for an unterminated string.
+    """
+    index = start + 1
+    while index < len(text):
+        if text[index] == "\\":
+            index += 2
+            continue
+        if text[index] == quote:
+            return index + 1
+        index += 1
+    return len(text)
+
+
+def _close_truncated(text: str) -> str:
+    """
+    Closes all open objects and arrays of an answer cut off at the end.
+    Only a dangling key or comma is dropped. An answer cut off inside a string or a number is not repaired,
+    the value would be stored shortened (a cut off e-mail address or rent).
+    :raise ValueError: The last value of the answer was cut off.
+    """
+    stack = []
+    in_string = False
+    escaped = False
+    for char in text:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in "{[":
+            stack.append("}" if char == "{" else "]")
+        elif char in "}]" and stack:
+            stack.pop()
+
+    if in_string:
+        raise ValueError("The structured answer was cut off inside a string.")
+    if not stack:
+        return text
+
+    text = text.rstrip()
+    dangling_key = _DANGLING_KEY.search(text) if stack[-1] == "}" else None
+    if dangling_key:
+        text = text[:dangling_key.start(1) + 1].rstrip()
+    if text.endswith(","):
+        text = text[:-1].rstrip()
+    if not _COMPLETE_LAST_VALUE.search(text):
+        raise ValueError("The structured answer was cut off inside a value.")
+    return text + "".join(reversed(stack))
+
+
+def _add_once(kinds: list[str], kind: str) -> None:
+    if kind not in kinds:
+        kinds.append(kind)
+
+
+# ========= SCHEMA COERCION =========
+
+def coerce_to_schema(value: Any, schema: dict, root_schema: dict, repairs: list[str]) -> Any:
+    """
+    Converts the values that miss the type of the schema, if they can be converted without guessing.
+    Everything else is left for the Pydantic validation.
+    :param value: Parsed JSON value.
+    :param schema: Schema of the value (may be a $ref into root_schema).
+    :param root_schema: Whole schema with the $defs.
+    :param repairs: Applied coercions are added to this list.
+    """
+    schema = _resolve_ref(schema, root_schema)
+
+    variants = schema.get("anyOf") or schema.get("oneOf")
+    if variants:
+        return _coerce_to_variants(value, variants, root_schema, repairs)
+
+    if "enum" in schema and isinstance(value, str):
+        return _coerce_enum(value, schema["enum"], repairs)
+
+    schema_type = schema.get("type")
+
+    if schema_type == "object" and isinstance(value, dict):
+        properties = schema.get("properties", {})
+        return {key: coerce_to_schema(item, properties[key], root_schema, repairs) if key in properties else item
+                for key, item in value.items()}
+
+    if schema_type == "array" and isinstance(value, list) and "items" in schema:
+        return [coerce_to_schema(item, schema["items"], root_schema, repairs) for item in value]
+
+    if schema_type in ("number", "integer") and isinstance(value, str):
+        number = _parse_number(value)
+        if number is None or (schema_type == "integer" and not number.is_integer()):
+            return value
+        _add_once(repairs, "number")
+        return int(number) if schema_type == "integer" else number
+
+    if schema_type == "string" and schema.get("format") == "date" and isinstance(value, str):
+        parsed_date = _parse_date(value)
+        if parsed_date is None or parsed_date == value:
+            return value
+        _add_once(repairs, "date")
+        return parsed_date
+
+    return value
+
+
+def _resolve_ref(schema: dict, root_schema: dict) -> dict:
+    reference = schema.get("$ref")
+    if not reference or not reference.startswith("#/"):
+        return schema
+    resolved = root_schema
+    for part in reference[2:].split("/"):
+        resolved = resolved.get(part, {})
+    return resolved
+
+
+def _coerce_to_variants(value: Any, variants: list, root_schema: dict, repairs: list[str]) -> Any:
+    if value is None:
+        return None
+
+    for variant in variants:
+        variant = _resolve_ref(variant, root_schema)
+        if variant.get("type") == "null":
+            continue
+        # an object variant only fits if it has all its required keys
+        if variant.get("type") == "object":
+            if not isinstance(value, dict) or not set(variant.get("required", [])) <= value.keys():
+                continue
+        variant_repairs = []
+        coerced = coerce_to_schema(value, variant, root_schema, variant_repairs)
+        if _fits_type(coerced, variant):
+            for kind in variant_repairs:
+                _add_once(repairs, kind)
+            return coerced
+    return value
+
+
+def _fits_type(value: Any, schema: dict) -> bool:
+    schema_type = schema.get("type")
+    if schema_type == "number":
+        return isinstance(value, (int, float)) and not isinstance(value, bool)
+    if schema_type == "integer":
+        return isinstance(value, int) and not isinstance(value, bool)
+    if schema_type == "string":
+        return isinstance(value, str)
+    if schema_type == "object":
+        return isinstance(value, dict)
+    if schema_type == "array":
+        return isinstance(value, list)
+    return True
+
+
+def _coerce_enum(value: str, options: list, repairs: list[str]) -> str:
+    if value in options:
+        return value
+    for option in options:
+        if isinstance(option, str) and option.lower() == value.strip().lower():
+            _add_once(repairs, "enum_case")
+            return option
+    return value
+
+
+def _parse_number(text: str) -> float | None:
+    """
+    Reads numbers written with thousands separators, a decimal comma or a currency,
+    for example "1.200,50 €" -> 1200.5, "1,200.50" -> 1200.5, "12,5" -> 12.5.
+    A single separator before three digits ("1.200", "1,500") is ambiguous, the number is not read.
+    """
+    match = _NUMBER_WITH_UNIT.match(text)
+    if not match:
+        return None
+
+    number = match.group(1).replace(" ", "").replace("'", "")
+    # "1.200" is 1200 in German and 1.2 in English, "1,500" the other way round: left for the validation
+    if number.count(",") + number.count(".") == 1 and len(re.split(r"[.,]", number)[1]) == 3:
+        return None
+
+    if "," in number and "." in number:
+        # the separator that comes last is the decimal separator
+        if number.rfind(",") > number.rfind("."):
+            number = number.replace(".", "").replace(",", ".")
+        else:
+            number = number.replace(",", "")
+    elif "," in number:
+        integer_part, _, fraction = number.rpartition(",")
+        # "12,5" is a decimal comma, "1,200,000" are thousands
+        if number.count(",") == 1:
+            number = f"{integer_part}.{fraction}"
+        else:
+            number = number.replace(",", "")
+    elif number.count(".") > 1:
+        number = number.replace(".", "")
+
+    try:
+        return float(number)
+    except ValueError:
+        return None
+
+
+def _parse_date(text: str) -> str | None:
+    """
+    Reads the usual date notations and returns the ISO date, for example "05.01.2024" -> "2024-01-05".
+    """
+    candidate = text.strip()
+    # a datetime is reduced to its date
+    if "T" in candidate:
+        candidate = candidate.split("T", 1)[0]
+
+    for date_format in _DATE_FORMATS:
+        try:
+            return datetime.strptime(candidate, date_format).date().isoformat()
+        except ValueError:
+            continue
+    try:
+        return date.fromisoformat(candidate).isoformat()
+    except ValueError:
+        return None
@@ -0,0 +1,106 @@
+"""
+Trains the local classifier of the CRUD intent from the logged CRUD_INTENT turns.
+
+    python -m ApartmentManager.backend.AI_API.general.train_intent_classifier [--threshold 0.9]
+
+The answers of the LLM are the labels. Turns that depended on the state of the conversation
+(a continued or interrupted write operation, the feedback of the backend) are skipped,
+the classifier is only asked when no operation is active.
+A part of the turns is held out to report the accuracy and the share of turns
+the classifier would answer at the threshold; then the model is trained on all turns
+and written to data/crud_intent_classifier.json, the running server picks it up.
+"""
+import argparse
+import random
+from ApartmentManager.backend.AI_API.general.intent_classifier import CrudIntentClassifier, label_from_llm_answer, \
+    build_intent_model, MODEL_PATH
+from ApartmentManager.backend.AI_API.general.prompting import Prompt
+from ApartmentManager.backend.SQL_API.logs.read_log import get_log_entries
+from ApartmentManager.backend.config.server_config import CRUD_INTENT_LOCAL_THRESHOLD
+
+MIN_TRAINING_TURNS = 20
+
+
+def load_training_data() -> (list[str], list[dict]):
+    """
+    :return: Questions and their labels, one per distinct question (the latest answer wins).
+    """
+    latest = {}
+    for user_question, llm_answer in get_log_entries(Prompt.CRUD_INTENT.name):
+        question = (user_question or "").strip()
+        # feedback of the backend and repair prompts are not typed by the user
+        if not question or question.startswith("Backend"):
+            continue
+        label = label_from_llm_answer(llm_answer)
+        if label is not None:
+            latest[question] = label
+    return list(latest.keys()), list(latest.values())
+
+
+def evaluate(classifier: CrudIntentClassifier,
+             questions: list[str],
+             labels: list[dict],
+             threshold: float) -> (float, float, float):
+    """
+    :return: Accuracy of all predictions, share of the turns answered locally at the threshold
+             and the accuracy of these local answers.
+    """
+    correct = 0
+    local = 0
+    local_correct = 0
+    for question, label in zip(questions, labels):
+        expected = build_intent_model(label["intent"], label["type"] or "person", label["single"] == "single")
+        predicted, confidence = classifier.predict(question)
+        is_correct = predicted == expected
+        correct += is_correct
+        if predicted is not None and confidence >= threshold:
+            local += 1
+            local_correct += is_correct
+
+    total = len(questions) or 1
+    return correct / total, local / total, local_correct / (local or 1)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Train the local CRUD intent classifier from the conversation log.")
+    parser.add_argument("--threshold", type=float, default=CRUD_INTENT_LOCAL_THRESHOLD,
+                        help="confidence of a local answer, used for the report")
+    parser.add_argument("--holdout", type=float, default=0.2, help="share of the turns held out for the report")
+    parser.add_argument("--output", default=MODEL_PATH, help="path of the model file")
+    arguments = parser.parse_args()
+
+    questions, labels = load_training_data()
+    print(f"Training turns: {len(questions)}")
+    if len(questions) < MIN_TRAINING_TURNS:
+        print(f"At least {MIN_TRAINING_TURNS} turns are needed, the model is not written.")
+        return
+
+    order = list(range(len(questions)))
+    random.Random(0).shuffle(order)
+    split = int(len(order) * (1 - arguments.holdout))
+    train, test = order[:split], order[split:]
+
+    if test:
+        holdout_classifier = CrudIntentClassifier.train([questions[index] for index in train],
+                                                        [labels[index] for index in train])
+        accuracy, coverage, local_accuracy = evaluate(holdout_classifier,
+                                                      [questions[index] for index in test],
+                                                      [labels[index] for index in test],
+                                                      arguments.threshold)
+        print(f"Holdout accuracy: {accuracy:.1%}")
+        print(f"Answered locally at {arguments.threshold}: {coverage:.1%} with accuracy {local_accuracy:.1%}")
+
+    intents = {}
+    for label in labels:
+        intents[label["intent"]] = intents.get(label["intent"], 0) + 1
+    print("Turns per intent: " + ", ".join(f"{intent}={count}" for intent, count in sorted(intents.items())))
+    if len(intents) < 2:
+        print("The log has too few different intents, the model is not written.")
+        return
+
+    CrudIntentClassifier.train(questions, labels).save(arguments.output)
+    print(f"Model written to {arguments.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,19 @@
+import threading
+from collections import OrderedDict
 from ApartmentManager.backend.AI_API.general.error_texts import ErrorCode, APIError
 from ApartmentManager.backend.AI_API.general.logger import log_error
-from ApartmentManager.backend.config.server_config import HOST, PORT
+from ApartmentManager.backend.AI_API.general.stage_timing import stage_timer, LOOPBACK_HTTP
+from ApartmentManager.backend.AI_API.general.deadline import stage_timeout, check_deadline
+from ApartmentManager.backend.config.server_config import HOST, PORT, LOOPBACK_HTTP_TIMEOUT_SECONDS
 import requests
 from requests.exceptions import RequestException
 
+# Last responses of the GET endpoints with their ETag: (url, params) -> (etag, data)
+# If the table was not changed, the endpoint answers 304 and the data is taken from here.
+_MAX_CACHED_GET_RESPONSES = 64
+_get_response_cache: OrderedDict[tuple, tuple[str, object]] = OrderedDict()
+_get_response_cache_lock = threading.Lock()
+
 def make_restful_api_post(path: str, payload: dict) -> requests.Response:
     """
     Executes a POST query from AI to an endpoint RESTFUL API and returns the status response.
@@ -20,14 +30,20 @@ def make_restful_api_post(path: str, payload: dict) -> requests.Response:
         # f. e.  url = f"http://{HOST}:{PORT}/internal{path}"
         url = f"http://{HOST}:{PORT}/internal{path}"
 
-        response = requests.post(
-            url=url,
-            json=payload,  # data to add in the table are sent as JSON-Body
-            headers={"Content-Type": "application/json"},
-            timeout=10
-        )
-        return response.json()
+        with stage_timer(LOOPBACK_HTTP):
+            response = requests.post(
+                url=url,
+                json=payload,  # data to add in the table are sent as JSON-Body
+                headers={"Content-Type": "application/json"},
+                timeout=stage_timeout(LOOPBACK_HTTP_TIMEOUT_SECONDS)
+            )
+            return response.json()
 
+    except APIError:
+        raise
+    except requests.Timeout as error:
+        check_deadline(error)
+        raise
     except requests.ConnectionError:
         raise
     except requests.HTTPError:
@@ -51,13 +67,79 @@ def make_restful_api_get(path: str) -> dict | None:
         url = f"http://{HOST}:{PORT}/internal{path}"
 
         # get response from the endpoint of RESTful API
-        response = requests.get(url, timeout=10)
-        response.raise_for_status()  # raises an HTTPError if the server responds with a failed status code.
-        return response.json()
+        return _get_json_revalidated(url)
 
+    except APIError:
+        raise
+    except requests.Timeout as error:
+        check_deadline(error)
+        raise
     except RequestException:
         # every HTTP error requests: ConnectionError, Timeout, HTTPError, ...
         raise
     except Exception as error:
         trace_id = log_error(ErrorCode.ERROR_DOING_GET_QUERY_TO_AN_ENDPOINT, exception=error)
-        raise APIError(ErrorCode.ERROR_DOING_GET_QUERY_TO_AN_ENDPOINT, trace_id) from error
\ No newline at end of file
+        raise APIError(ErrorCode.ERROR_DOING_GET_QUERY_TO_AN_ENDPOINT, trace_id) from error
+
+def make_restful_api_get_page(path: str, limit: int, after: str) -> dict | None:
+    """
+    Executes a GET query from AI to a list endpoint RESTFUL API and returns one page of the records.
+    Use it for large lists: the records are ordered by their id, every page contains at most 'limit' records.
+    :param path: Path to the endpoint RESTFUL API, for example /persons.
+    :param limit: Maximal number of records in the page.
+    :param after: Value of 'next' from the previous page, an empty string for the first page.
+    :return: { "items": [...], "next": "<cursor of the next page>" | null }
+    """
+    try:
+        url = f"http://{HOST}:{PORT}/internal{path}"
+
+        params = {"limit": limit}
+        if after:
+            params["after"] = after
+
+        return _get_json_revalidated(url, params)
+
+    except APIError:
+        raise
+    except requests.Timeout as error:
+        check_deadline(error)
+        raise
+    except RequestException:
+        raise
+    except Exception as error:
+        trace_id = log_error(ErrorCode.ERROR_DOING_GET_QUERY_TO_AN_ENDPOINT, exception=error)
+        raise APIError(ErrorCode.ERROR_DOING_GET_QUERY_TO_AN_ENDPOINT, trace_id) from error
+
+
+def _get_json_revalidated(url: str, params: dict = None):
+    """
+    GET with a conditional request: the ETag of the last response is sent in If-None-Match,
+    on 304 the cached data is returned without transferring and parsing the table again.
+    """
+    cache_key = (url, tuple(sorted((params or {}).items())))
+    with _get_response_cache_lock:
+        cached = _get_response_cache.get(cache_key)
+
+    headers = {"If-None-Match": f'"{cached[0]}"'} if cached else {}
+    with stage_timer(LOOPBACK_HTTP):
+        response = requests.get(url, params=params, headers=headers,
+                                timeout=stage_timeout(LOOPBACK_HTTP_TIMEOUT_SECONDS))
+
+    if response.status_code == 304 and cached:
+        with _get_response_cache_lock:
+            if cache_key in _get_response_cache:
+                _get_response_cache.move_to_end(cache_key)
+        return cached[1]
+
+    response.raise_for_status()  # raises an HTTPError if the server responds with a failed status code.
+    data = response.json()
+
+    etag = response.headers.get("ETag", "").removeprefix("W/").strip('"')
+    if etag:
+        with _get_response_cache_lock:
+            _get_response_cache[cache_key] = (etag, data)
+            _get_response_cache.move_to_end(cache_key)
+            while len(_get_response_cache) > _MAX_CACHED_GET_RESPONSES:
+                _get_response_cache.popitem(last=False)
+
+    return data
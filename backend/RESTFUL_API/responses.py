@@ -0,0 +1,128 @@
+"""
+Response layer of the HTTP endpoints.
+
+Envelopes are serialized by Pydantic directly to JSON bytes (model_dump_json),
+row lists of the internal endpoints by orjson if it is installed.
+The body is compressed with brotli or gzip according to Accept-Encoding, and
+sent as MessagePack instead of JSON if the client asks for it with Accept.
+"""
+import gzip
+import json
+from flask import Request, Response
+from pydantic import BaseModel
+
+try:
+    import orjson
+except ImportError: # optional, the stdlib serializer is used instead
+    orjson = None
+
+try:
+    import brotli
+except ImportError: # optional, only gzip is offered then
+    brotli = None
+
+try:
+    import msgpack
+except ImportError: # optional, only JSON is offered then
+    msgpack = None
+
+JSON_MIMETYPE = "application/json"
+MSGPACK_MIMETYPES = ("application/msgpack", "application/x-msgpack")
+
+# smaller bodies do not get smaller by compression, it would only cost time
+MIN_COMPRESS_BYTES = 1024
+GZIP_LEVEL = 5
+BROTLI_QUALITY = 4
+
+
+def negotiate(request: Request) -> (str, str | None):
+    """
+    Chooses the representation of the response from the headers of the request.
+    :return: Mimetype of the body and the content encoding ("br", "gzip" or None).
+    """
+    mimetype = JSON_MIMETYPE
+    if msgpack is not None:
+        best = request.accept_mimetypes.best_match((JSON_MIMETYPE,) + MSGPACK_MIMETYPES, default=JSON_MIMETYPE)
+        # JSON stays the default for "*/*", MessagePack only if it is asked for explicitly
+        if best in MSGPACK_MIMETYPES and request.accept_mimetypes.quality(best) > request.accept_mimetypes[JSON_MIMETYPE]:
+            mimetype = best
+
+    encoding = None
+    accept_encodings = request.accept_encodings
+    if brotli is not None and accept_encodings["br"]:
+        encoding = "br"
+    elif accept_encodings["gzip"]:
+        encoding = "gzip"
+
+    return mimetype, encoding
+
+
+def representation_key(request: Request) -> str:
+    """
+    Short name of the negotiated representation, for example "application/json+gzip".
+    Part of the ETag, because a strong ETag must differ for different bodies.
+    """
+    mimetype, encoding = negotiate(request)
+    return f"{mimetype}+{encoding or 'identity'}"
+
+
+def envelope_response(request: Request, envelope: BaseModel, status: int = 200) -> Response:
+    """
+    Builds the response for an EnvelopeApi or EnvelopeError.
+    :param request: Current request, used for the content negotiation.
+    :param envelope: Envelope to send.
+    :param status: HTTP status code.
+    """
+    mimetype, encoding = negotiate(request)
+    if mimetype in MSGPACK_MIMETYPES:
+        body = msgpack.packb(envelope.model_dump(mode='json'))
+    else:
+        body = envelope.model_dump_json().encode("utf-8")
+
+    return _build_response(body, mimetype, encoding, status)
+
+
+def rows_response(request: Request, data: list | dict, status: int = 200) -> Response:
+    """
+    Builds the response for the data of the internal endpoints (list of rows or a page of rows).
+    :param request: Current request, used for the content negotiation.
+    :param data: JSON serializable rows.
+    :param status: HTTP status code.
+    """
+    mimetype, encoding = negotiate(request)
+    if mimetype in MSGPACK_MIMETYPES:
+        body = msgpack.packb(data, default=str)
+    else:
+        body = dumps_json_bytes(data)
+
+    return _build_response(body, mimetype, encoding, status)
+
+
+def dumps_json_bytes(data) -> bytes:
+    """
+    Serializes the data to compact UTF-8 JSON, with orjson if it is installed.
+    """
+    if orjson is not None:
+        return orjson.dumps(data, default=str)
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"), default=str).encode("utf-8")
+
+
+def compress(body: bytes, encoding: str | None) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=GZIP_LEVEL)
+    return body
+
+
+def _build_response(body: bytes, mimetype: str, encoding: str | None, status: int) -> Response:
+    if encoding and len(body) >= MIN_COMPRESS_BYTES:
+        body = compress(body, encoding)
+    else:
+        encoding = None
+
+    response = Response(body, status=status, mimetype=mimetype)
+    if encoding:
+        response.headers["Content-Encoding"] = encoding
+    response.vary.update(("Accept", "Accept-Encoding"))
+    return response
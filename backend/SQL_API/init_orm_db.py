@@ -1,11 +1,14 @@
 from ApartmentManager.backend.SQL_API.rental.rental_orm_models import Rental_Base, rental_engine
 from ApartmentManager.backend.SQL_API.logs.logs_orm_models import Log_Base, log_engine
+from ApartmentManager.backend.SQL_API.rental.table_versions import ensure_version_tracking
 
 
 #TODO at the moment start the DB initialisation manually. Later automatically
 
 # create tables with rental information
 Rental_Base.metadata.create_all(rental_engine)
+# triggers counting the changes of the rental tables (ETags, answer cache)
+ensure_version_tracking()
 
 # create table for logging the AI conversation
 Log_Base.metadata.create_all(log_engine)
\ No newline at end of file
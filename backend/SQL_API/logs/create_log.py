@@ -1,6 +1,8 @@
 import traceback
 
 from ApartmentManager.backend.SQL_API.logs.logs_orm_models import Log, Session
+from ApartmentManager.backend.AI_API.general.stage_timing import stage_timer, LOG_WRITE
+from ApartmentManager.backend.AI_API.general.metrics import LOG_WRITE_SECONDS
 
 def create_new_log_entry(llm_model: str,
                          user_question: str,
@@ -30,8 +32,9 @@ def create_new_log_entry(llm_model: str,
                         back_end_response=backend_response,
                         ai_answer=llm_answer,
                         system_prompt_name=system_prompt_name)
-        session.add(log_entry)
-        session.commit()
+        with stage_timer(LOG_WRITE), LOG_WRITE_SECONDS.time():
+            session.add(log_entry)
+            session.commit()
 
     except Exception as error:
         print(f"Error reading database: {error}")
@@ -0,0 +1,18 @@
+from ApartmentManager.backend.SQL_API.logs.logs_orm_models import Log, Session
+
+
+def get_log_entries(system_prompt_name: str) -> list[tuple[str, str]]:
+    """
+    Reads the logged turns of one system prompt, for example to train a model from them.
+    :param system_prompt_name: Name of the Prompt member the turns were answered with.
+    :return: Pairs (user question, LLM answer) ordered by their id.
+    """
+    session = Session()
+    try:
+        rows = (session.query(Log.user_question, Log.ai_answer)
+                .filter(Log.system_prompt_name == system_prompt_name)
+                .order_by(Log.id_log.asc())
+                .all())
+        return [(row.user_question, row.ai_answer) for row in rows]
+    finally:
+        session.close()
@@ -1,7 +1,10 @@
 from ApartmentManager.backend.SQL_API.rental.rental_orm_models import Session, PersonalData, Apartment, Tenancy, Contract
 from ApartmentManager.backend.AI_API.general.error_texts import ErrorCode, APIError
 from ApartmentManager.backend.AI_API.general.logger import log_error
+from ApartmentManager.backend.AI_API.general.metrics import observe_sql_function
+from ApartmentManager.backend.SQL_API.rental.table_versions import notify_table_changed
 
+@observe_sql_function
 def create_person(first_name: str,
                     last_name: str,
                     bank_data: str,
@@ -41,6 +44,7 @@ def create_person(first_name: str,
         person_data = person.to_dict()
 
         session.commit()
+        notify_table_changed(PersonalData.__tablename__)
 
         return person_data
 
@@ -78,6 +82,7 @@ def create_person(first_name: str,
                     comment="new tenant from oktober")
     """
 
+@observe_sql_function
 def create_apartment(area: float,
                      address: str,
                      price_per_square_meter: float,
@@ -102,6 +107,7 @@ def create_apartment(area: float,
         session.flush()
         apartment_data = apartment.to_dict()
         session.commit()
+        notify_table_changed(Apartment.__tablename__)
 
         return apartment_data
 
@@ -118,6 +124,7 @@ def create_apartment(area: float,
         if session:
             session.close()
 
+@observe_sql_function
 def create_tenancy(id_apartment: int,
                    id_tenant_personal_data: int,
                    id_contract: int,
@@ -150,6 +157,7 @@ def create_tenancy(id_apartment: int,
         session.flush()
         tenancy_data = tenancy.to_dict()
         session.commit()
+        notify_table_changed(Tenancy.__tablename__)
 
         return tenancy_data
 
@@ -166,6 +174,7 @@ def create_tenancy(id_apartment: int,
         if session:
             session.close()
 
+@observe_sql_function
 def create_contract(net_rent: float,
                     utility_costs: float,
                     vat: float,
@@ -194,6 +203,7 @@ def create_contract(net_rent: float,
         session.flush()
         contract_data = contract.to_dict()
         session.commit()
+        notify_table_changed(Contract.__tablename__)
 
         return contract_data
 
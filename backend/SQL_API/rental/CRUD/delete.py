@@ -1,7 +1,10 @@
 from ApartmentManager.backend.AI_API.general.error_texts import ErrorCode, APIError
 from ApartmentManager.backend.AI_API.general.logger import log_error
+from ApartmentManager.backend.AI_API.general.metrics import observe_sql_function
+from ApartmentManager.backend.SQL_API.rental.table_versions import notify_table_changed
 from ApartmentManager.backend.SQL_API.rental.rental_orm_models import PersonalData, Session, Apartment, Tenancy, Contract
 
+@observe_sql_function
 def delete_person(*, # make order of arguments not important, as the LLM can mix it
                     first_name: str | None = None,
                     last_name: str | None = None,
@@ -66,6 +69,7 @@ def delete_person(*, # make order of arguments not important, as the LLM can mix
 
         query.delete()
         session.commit()
+        notify_table_changed(PersonalData.__tablename__)
 
         return person_data
 
@@ -82,6 +86,7 @@ def delete_person(*, # make order of arguments not important, as the LLM can mix
         if session:
             session.close()
 
+@observe_sql_function
 def delete_apartment(*,
                      address: str | None = None,
                  id_apartment: int | None = None) -> dict:
@@ -120,6 +125,7 @@ def delete_apartment(*,
 
         query.delete()
         session.commit()
+        notify_table_changed(Apartment.__tablename__)
 
         return apartment_data
 
@@ -136,6 +142,7 @@ def delete_apartment(*,
         if session:
             session.close()
 
+@observe_sql_function
 def delete_tenancy(*,
                    id_tenancy: int | None = None,
                    id_apartment: int | None = None,
@@ -178,6 +185,7 @@ def delete_tenancy(*,
 
         query.delete()
         session.commit()
+        notify_table_changed(Tenancy.__tablename__)
 
         return tenancy_data
 
@@ -194,6 +202,7 @@ def delete_tenancy(*,
         if session:
             session.close()
 
+@observe_sql_function
 def delete_contract(id_contract: int | None = None) -> dict:
     session = None
 
@@ -222,6 +231,7 @@ def delete_contract(id_contract: int | None = None) -> dict:
 
         query.delete()
         session.commit()
+        notify_table_changed(Contract.__tablename__)
 
         return contract_data
 
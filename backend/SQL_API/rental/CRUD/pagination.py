@@ -0,0 +1,97 @@
+import base64
+import binascii
+import json
+from ApartmentManager.backend.AI_API.general.error_texts import ErrorCode, APIError
+from ApartmentManager.backend.AI_API.general.logger import log_error
+from ApartmentManager.backend.config.server_config import DEFAULT_PAGE_LIMIT, MAX_PAGE_LIMIT
+
+
+def encode_cursor(table_name: str, last_key: int) -> str:
+    """
+    Builds the opaque cursor that points behind the last row of a page.
+    The table name is part of the cursor, so a cursor of persons cannot be used for apartments.
+    :param table_name: Name of the SQL table.
+    :param last_key: Primary key of the last row of the page.
+    :return: URL-safe cursor string.
+    """
+    raw = json.dumps({"t": table_name, "k": last_key}, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(table_name: str, cursor: str | None) -> int | None:
+    """
+    Reads the primary key from a cursor created by encode_cursor.
+    :return: Primary key after which the next page starts, or None for the first page.
+    """
+    if not cursor:
+        return None
+
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        last_key = data["k"]
+        if data["t"] != table_name or not isinstance(last_key, int) or isinstance(last_key, bool):
+            raise ValueError(f"Cursor does not belong to the table {table_name}.")
+        return last_key
+    except (ValueError, KeyError, TypeError, UnicodeEncodeError, binascii.Error) as error:
+        trace_id = log_error(ErrorCode.SQL_INVALID_PAGINATION_CURSOR, error)
+        raise APIError(ErrorCode.SQL_INVALID_PAGINATION_CURSOR, trace_id) from error
+
+
+def normalize_limit(limit: int | str | None) -> int:
+    """
+    Checks the requested page size, missing means the default page size.
+    """
+    if limit in (None, ""):
+        return DEFAULT_PAGE_LIMIT
+
+    try:
+        limit = int(limit)
+    except (TypeError, ValueError) as error:
+        trace_id = log_error(ErrorCode.SQL_INVALID_PAGINATION_LIMIT, error)
+        raise APIError(ErrorCode.SQL_INVALID_PAGINATION_LIMIT, trace_id) from error
+
+    if not 1 <= limit <= MAX_PAGE_LIMIT:
+        trace_id = log_error(ErrorCode.SQL_INVALID_PAGINATION_LIMIT)
+        raise APIError(ErrorCode.SQL_INVALID_PAGINATION_LIMIT, trace_id)
+
+    return limit
+
+
+def query_page(session,
+               orm_model,
+               primary_key_column,
+               limit: int | str | None,
+               after: str | None,
+               filters: list = None) -> (list, str | None):
+    """
+    Keyset pagination over the primary key.
+    The rows are ordered by the primary key, the next page starts after the last key of the current page,
+    so the database does not need to skip rows as with OFFSET and new rows do not shift the pages.
+    :param session: Open SQLAlchemy session.
+    :param orm_model: ORM class of the table.
+    :param primary_key_column: Primary key column of the ORM class.
+    :param limit: Maximal number of rows in the page.
+    :param after: Cursor of the previous page or None for the first page.
+    :param filters: Optional SQLAlchemy filter expressions.
+    :return: Rows of the page and the cursor of the next page (None on the last page).
+    """
+    table_name = orm_model.__tablename__
+    page_limit = normalize_limit(limit)
+    last_key = decode_cursor(table_name, after)
+
+    query = session.query(orm_model)
+    if filters:
+        query = query.filter(*filters)
+    if last_key is not None:
+        query = query.filter(primary_key_column > last_key)
+
+    # one row more tells if there is a next page
+    rows = query.order_by(primary_key_column.asc()).limit(page_limit + 1).all()
+
+    next_cursor = None
+    if len(rows) > page_limit:
+        rows = rows[:page_limit]
+        next_cursor = encode_cursor(table_name, getattr(rows[-1], primary_key_column.key))
+
+    return rows, next_cursor
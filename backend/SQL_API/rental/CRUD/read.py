@@ -1,11 +1,23 @@
 from ApartmentManager.backend.AI_API.general.error_texts import ErrorCode, APIError
 from ApartmentManager.backend.AI_API.general.logger import log_error
+from ApartmentManager.backend.AI_API.general.metrics import observe_sql_function
 from ApartmentManager.backend.SQL_API.rental.rental_orm_models import (Apartment,
                                                                        Session,
                                                                        PersonalData,
                                                                        Tenancy,
                                                                        Contract)
-
+from ApartmentManager.backend.SQL_API.rental.CRUD.pagination import query_page
+from ApartmentManager.backend.config.server_config import MAX_BATCH_REQUESTS
+
+# Entities that can be read by read_batch, the names are the paths of the internal endpoints
+BATCH_ENTITIES = {
+    "persons": (PersonalData, PersonalData.id_personal_data),
+    "apartments": (Apartment, Apartment.id_apartment),
+    "tenancies": (Tenancy, Tenancy.id_tenancy),
+    "contract": (Contract, Contract.id_contract),
+}
+
+@observe_sql_function
 def get_apartments() -> list[Apartment]:
     session = None
     try:
@@ -56,6 +68,7 @@ def get_apartments() -> list[Apartment]:
         session.commit()
     """
 
+@observe_sql_function
 def get_single_person(*,first_name: str, last_name: str, id_personal_data: int) -> PersonalData:
     session = None
 
@@ -98,6 +111,7 @@ def get_single_person(*,first_name: str, last_name: str, id_personal_data: int)
             session.close()
 
 
+@observe_sql_function
 def get_persons() -> list[PersonalData]:
     session = None
 
@@ -114,6 +128,7 @@ def get_persons() -> list[PersonalData]:
         if session:
             session.close()
 
+@observe_sql_function
 def get_tenancies() -> list[Tenancy]:
     session = Session()
 
@@ -130,6 +145,7 @@ def get_tenancies() -> list[Tenancy]:
             session.close()
 
 
+@observe_sql_function
 def get_contract() -> list[Contract]:
     session = None
     try:
@@ -147,6 +163,103 @@ def get_contract() -> list[Contract]:
         if session:
             session.close()
 
+@observe_sql_function
+def get_persons_page(*, limit: int | str = None, after: str = None) -> (list[PersonalData], str | None):
+    """
+    Returns one page of persons ordered by the primary key.
+    :param limit: Maximal number of rows in the page.
+    :param after: Cursor of the previous page or None for the first page.
+    :return: Rows of the page and the cursor of the next page (None on the last page).
+    """
+    session = None
+    try:
+        session = Session()
+        return query_page(session, PersonalData, PersonalData.id_personal_data, limit, after)
+    except APIError:
+        raise
+    except Exception as error:
+        if session:
+            session.rollback()
+        trace_id = log_error(ErrorCode.SQL_ERROR_READING_ENTRY_FOR_ALL_PERSONS, error)
+        raise APIError(ErrorCode.SQL_ERROR_READING_ENTRY_FOR_ALL_PERSONS, trace_id) from error
+    finally:
+        if session:
+            session.close()
+
+
+@observe_sql_function
+def get_apartments_page(*, limit: int | str = None, after: str = None) -> (list[Apartment], str | None):
+    """
+    Returns one page of apartments ordered by the primary key.
+    :param limit: Maximal number of rows in the page.
+    :param after: Cursor of the previous page or None for the first page.
+    :return: Rows of the page and the cursor of the next page (None on the last page).
+    """
+    session = None
+    try:
+        session = Session()
+        return query_page(session, Apartment, Apartment.id_apartment, limit, after)
+    except APIError:
+        raise
+    except Exception as error:
+        if session:
+            session.rollback()
+        trace_id = log_error(ErrorCode.SQL_ERROR_READING_ENTRY_FOR_ALL_APARTMENTS, error)
+        raise APIError(ErrorCode.SQL_ERROR_READING_ENTRY_FOR_ALL_APARTMENTS, trace_id) from error
+    finally:
+        if session:
+            session.close()
+
+
+@observe_sql_function
+def get_tenancies_page(*, limit: int | str = None, after: str = None) -> (list[Tenancy], str | None):
+    """
+    Returns one page of tenancies ordered by the primary key.
+    :param limit: Maximal number of rows in the page.
+    :param after: Cursor of the previous page or None for the first page.
+    :return: Rows of the page and the cursor of the next page (None on the last page).
+    """
+    session = None
+    try:
+        session = Session()
+        return query_page(session, Tenancy, Tenancy.id_tenancy, limit, after)
+    except APIError:
+        raise
+    except Exception as error:
+        if session:
+            session.rollback()
+        trace_id = log_error(ErrorCode.SQL_ERROR_READING_ENTRY_FOR_ALL_TENANCIES, error)
+        raise APIError(ErrorCode.SQL_ERROR_READING_ENTRY_FOR_ALL_TENANCIES, trace_id) from error
+    finally:
+        if session:
+            session.close()
+
+
+@observe_sql_function
+def get_contract_page(*, limit: int | str = None, after: str = None) -> (list[Contract], str | None):
+    """
+    Returns one page of contracts ordered by the primary key.
+    :param limit: Maximal number of rows in the page.
+    :param after: Cursor of the previous page or None for the first page.
+    :return: Rows of the page and the cursor of the next page (None on the last page).
+    """
+    session = None
+    try:
+        session = Session()
+        return query_page(session, Contract, Contract.id_contract, limit, after)
+    except APIError:
+        raise
+    except Exception as error:
+        if session:
+            session.rollback()
+        trace_id = log_error(ErrorCode.SQL_ERROR_READING_ENTRY_FOR_ALL_CONTRACTS, error)
+        raise APIError(ErrorCode.SQL_ERROR_READING_ENTRY_FOR_ALL_CONTRACTS, trace_id) from error
+    finally:
+        if session:
+            session.close()
+
+
+@observe_sql_function
 def get_single_apartment(*, address: str = None, id_apartment: int = None) -> Apartment:
     session = None
     try:
@@ -177,6 +290,7 @@ def get_single_apartment(*, address: str = None, id_apartment: int = None) -> Ap
         if session:
             session.close()
 
+@observe_sql_function
 def get_single_tenancy(*, id_tenancy: int = None) -> Tenancy:
     session = None
     try:
@@ -204,6 +318,7 @@ def get_single_tenancy(*, id_tenancy: int = None) -> Tenancy:
         if session:
             session.close()
 
+@observe_sql_function
 def get_single_contract(*, id_contract: int = None) -> Contract:
     session = None
     try:
@@ -230,3 +345,86 @@ def get_single_contract(*, id_contract: int = None) -> Contract:
     finally:
         if session:
             session.close()
+
+
+@observe_sql_function
+def read_batch(sub_requests: list[dict]) -> dict:
+    """
+    Runs several reads in one session and one SQLite read transaction,
+    so all results come from the same snapshot of the database.
+    Sub-request: {"key": "<name in the result>", "entity": "persons" | "apartments" | "tenancies" | "contract",
+                  "filters": {"<column>": <value>, ...}, "limit": <int>, "after": "<cursor>"}
+    "key" defaults to the entity, "filters" are equality filters.
+    With "limit" or "after" the result is a page { "items": [...], "next": <cursor> | None }, otherwise a list.
+    :param sub_requests: List of the reads.
+    :return: Results of the reads by their key.
+    """
+    reads = _parse_batch_requests(sub_requests)
+
+    session = None
+    try:
+        session = Session()
+        # pysqlite does not open a transaction for SELECT, without it every query would see its own snapshot
+        session.connection().exec_driver_sql("BEGIN")
+
+        results = {}
+        for key, orm_model, primary_key_column, filters, limit, after, is_page in reads:
+            if is_page:
+                rows, next_cursor = query_page(session, orm_model, primary_key_column, limit, after, filters)
+                results[key] = {"items": [row.to_dict() for row in rows], "next": next_cursor}
+            else:
+                rows = session.query(orm_model).filter(*filters).order_by(primary_key_column.asc()).all()
+                results[key] = [row.to_dict() for row in rows]
+
+        return results
+    except APIError:
+        raise
+    except Exception as error:
+        trace_id = log_error(ErrorCode.SQL_ERROR_READING_BATCH, error)
+        raise APIError(ErrorCode.SQL_ERROR_READING_BATCH, trace_id) from error
+    finally:
+        if session:
+            # ends the read transaction
+            session.rollback()
+            session.close()
+
+
+def _parse_batch_requests(sub_requests: list[dict]) -> list[tuple]:
+    """
+    Checks the sub-requests of read_batch before the database is touched.
+    """
+    if not isinstance(sub_requests, list) or not 0 < len(sub_requests) <= MAX_BATCH_REQUESTS:
+        trace_id = log_error(ErrorCode.SQL_INVALID_BATCH_REQUEST)
+        raise APIError(ErrorCode.SQL_INVALID_BATCH_REQUEST, trace_id)
+
+    reads = []
+    keys = set()
+    for sub_request in sub_requests:
+        entity = sub_request.get("entity") if isinstance(sub_request, dict) else None
+        if entity not in BATCH_ENTITIES:
+            trace_id = log_error(ErrorCode.SQL_INVALID_BATCH_REQUEST)
+            raise APIError(ErrorCode.SQL_INVALID_BATCH_REQUEST, trace_id)
+
+        orm_model, primary_key_column = BATCH_ENTITIES[entity]
+        key = sub_request.get("key") or entity
+        raw_filters = sub_request.get("filters") or {}
+        columns = orm_model.__table__.columns
+
+        if (not isinstance(key, str) or key in keys or not isinstance(raw_filters, dict)
+                or any(name not in columns or not _is_scalar(value) for name, value in raw_filters.items())):
+            trace_id = log_error(ErrorCode.SQL_INVALID_BATCH_REQUEST)
+            raise APIError(ErrorCode.SQL_INVALID_BATCH_REQUEST, trace_id)
+        keys.add(key)
+
+        filters = [columns[name] == value for name, value in raw_filters.items()]
+        limit = sub_request.get("limit")
+        after = sub_request.get("after")
+        is_page = "limit" in sub_request or "after" in sub_request
+        reads.append((key, orm_model, primary_key_column, filters, limit, after, is_page))
+
+    return reads
+
+
+def _is_scalar(value) -> bool:
+    # a list or an object as filter value is an error of the client, not of the database
+    return value is None or isinstance(value, (str, int, float, bool))
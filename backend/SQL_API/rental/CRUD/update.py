@@ -1,7 +1,10 @@
 from ApartmentManager.backend.AI_API.general.error_texts import ErrorCode, APIError
 from ApartmentManager.backend.AI_API.general.logger import log_error
+from ApartmentManager.backend.AI_API.general.metrics import observe_sql_function
+from ApartmentManager.backend.SQL_API.rental.table_versions import notify_table_changed
 from ApartmentManager.backend.SQL_API.rental.rental_orm_models import PersonalData, Session, Apartment, Tenancy, Contract
 
+@observe_sql_function
 def update_person(
                     first_name: str | None = None,
                     last_name: str | None = None,
@@ -69,6 +72,7 @@ def update_person(
             raise APIError(ErrorCode.SQL_SUCH_PERSON_DOES_NOT_EXIST, trace_id)
 
         session.commit()
+        notify_table_changed(PersonalData.__tablename__)
 
         return person_data
 
@@ -81,6 +85,7 @@ def update_person(
         if session:
             session.close()
 
+@observe_sql_function
 def update_apartment(
                     address: str | None = None,
                     id_apartment: int | None = None,
@@ -138,6 +143,7 @@ def update_apartment(
             raise APIError(ErrorCode.SQL_SUCH_APARTMENT_DOES_NOT_EXIST, trace_id)
 
         session.commit()
+        notify_table_changed(Apartment.__tablename__)
 
         return apartment_data
 
@@ -150,6 +156,7 @@ def update_apartment(
         if session:
             session.close()
 
+@observe_sql_function
 def update_tenancy(
                     id_tenancy: int | None = None,
                     id_apartment: int | None = None,
@@ -216,6 +223,7 @@ def update_tenancy(
             raise APIError(ErrorCode.SQL_SUCH_TENANCY_DOES_NOT_EXIST, trace_id)
 
         session.commit()
+        notify_table_changed(Tenancy.__tablename__)
 
         return tenancy_data
 
@@ -228,6 +236,7 @@ def update_tenancy(
         if session:
             session.close()
 
+@observe_sql_function
 def update_contract(
                     id_contract: int | None = None,
                     new_net_rent: float | None = None,
@@ -286,6 +295,7 @@ def update_contract(
             raise APIError(ErrorCode.SQL_SUCH_CONTRACT_DOES_NOT_EXIST, trace_id)
 
         session.commit()
+        notify_table_changed(Contract.__tablename__)
 
         return contract_data
 
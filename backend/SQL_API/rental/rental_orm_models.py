@@ -1,7 +1,9 @@
 import os
+import time
 
-from sqlalchemy import create_engine, Column, Float, Integer, String
+from sqlalchemy import create_engine, event, Column, Float, Integer, String
 from sqlalchemy.orm import declarative_base, sessionmaker
+from ApartmentManager.backend.AI_API.general.stage_timing import record_stage, SQLITE
 
 # Define a path to the database
 BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../../"))
@@ -12,6 +14,22 @@ rental_engine = create_engine(f'sqlite:///{DB_PATH}',
                               connect_args={'check_same_thread': False, "timeout": 15},
                               echo=True)
 
+# Every SQL statement is measured as the stage "sqlite" of the running chat turn (Server-Timing).
+# The start time lives on the execution context of the statement: a failed statement has no after_cursor_execute,
+# its start time goes away with the context instead of staying on the pooled connection.
+@event.listens_for(rental_engine, "before_cursor_execute")
+def _start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._query_start_time = time.perf_counter()
+
+
+@event.listens_for(rental_engine, "after_cursor_execute")
+def _stop_query_timer(conn, cursor, statement, parameters, context, executemany):
+    start = getattr(context, "_query_start_time", None)
+    if start is not None:
+        record_stage(SQLITE, (time.perf_counter() - start) * 1000)
+
+
 # Create a database session (performs CRUD operations with ORM objects)
 Session = sessionmaker(bind=rental_engine) # returns Fabric
 
@@ -147,4 +165,15 @@ class Contract(Rental_Base):
             "garage": self.garage,
             "parking_spot": self.parking_spot,
             "comment": self.comment
-        }
\ No newline at end of file
+        }
+
+class TableVersion(Rental_Base):
+    __tablename__ = "table_versions"
+    # counter of the changes of a rental table, increased by SQLite triggers (see table_versions.py)
+    table_name = Column(String, primary_key=True)
+    version = Column(Integer, nullable=False)
+
+    def __repr__(self):
+        return (f"TableVersion ("
+                f"table_name={self.table_name}, "
+                f"version={self.version})")
@@ -0,0 +1,123 @@
+import hashlib
+import threading
+import time
+from typing import Callable
+from sqlalchemy import inspect, text
+from ApartmentManager.backend.SQL_API.rental.rental_orm_models import Rental_Base, rental_engine, TableVersion
+from ApartmentManager.backend.config.server_config import TABLE_VERSION_REFRESH_SECONDS
+
+# The counters live in the table "table_versions" of the rental database. SQLite triggers increase the counter
+# of a table in the transaction of every INSERT/UPDATE/DELETE, so all server processes (ASGI/uvicorn workers)
+# see the same versions, also after a restart and after a change made outside the app.
+
+# the rental tables with triggers, the tracking is set up once per process
+_tracked_tables: set[str] = set()
+_tracking_lock = threading.Lock()
+
+# callbacks (table name) called after each change made by this process, for example to drop cached answers
+_change_listeners: list[Callable[[str], None]] = []
+
+# (time of the read, table name -> version), a conditional GET within the refresh interval does not touch SQLite
+_versions_snapshot: tuple[float, dict[str, int]] | None = None
+# increased by every change of this process, a read that started before the change does not keep its snapshot
+_versions_generation = 0
+
+
+def ensure_version_tracking() -> None:
+    """
+    Creates the table of the versions and the triggers of the rental tables, if they do not exist yet.
+    The triggers are stored in the database file, a write of any process is counted once they exist.
+    A rental table that is not created yet (database not initialized) gets its trigger with the next call.
+    """
+    rental_tables = [table.name for table in Rental_Base.metadata.sorted_tables
+                     if table.name != TableVersion.__tablename__]
+    if _tracked_tables.issuperset(rental_tables):
+        return
+
+    with _tracking_lock, rental_engine.begin() as connection:
+        TableVersion.__table__.create(connection, checkfirst=True)
+        existing_tables = set(inspect(connection).get_table_names())
+        for table_name in rental_tables:
+            if table_name in _tracked_tables or table_name not in existing_tables:
+                continue
+            # a recreated database counts on from the time of its creation,
+            # an ETag of the old database does not match the new one
+            connection.execute(text("INSERT OR IGNORE INTO table_versions (table_name, version) "
+                                    "VALUES (:table_name, :version)"),
+                               {"table_name": table_name, "version": int(time.time() * 1000)})
+            for statement in ("INSERT", "UPDATE", "DELETE"):
+                connection.execute(text(
+                    f"CREATE TRIGGER IF NOT EXISTS {table_name}_version_after_{statement.lower()} "
+                    f"AFTER {statement} ON {table_name} BEGIN "
+                    f"UPDATE table_versions SET version = version + 1 WHERE table_name = '{table_name}'; END"))
+            _tracked_tables.add(table_name)
+
+
+def notify_table_changed(table_name: str) -> None:
+    """
+    Calls the change listeners of this process. Called by the create/update/delete functions after a successful
+    commit, the version itself was already increased by the trigger within the transaction.
+    :param table_name: Name of the SQL table, for example PersonalData.__tablename__
+    """
+    global _versions_snapshot, _versions_generation
+    # the next read sees the new version at once
+    _versions_generation += 1
+    _versions_snapshot = None
+    for listener in _change_listeners:
+        listener(table_name)
+
+
+def get_database_version() -> int:
+    """
+    Returns the version of the whole rental database, it changes with every change of any table.
+    """
+    return sum(_read_versions().values())
+
+
+def add_change_listener(listener: Callable[[str], None]) -> None:
+    """
+    Registers a callback that is called with the table name after every change of a table made by this process.
+    Changes of other processes are only visible in the versions.
+    """
+    _change_listeners.append(listener)
+
+
+def get_table_version(table_name: str) -> int:
+    """
+    Returns the current version of a table, 0 if the table does not exist yet.
+    """
+    return _read_versions().get(table_name, 0)
+
+
+def build_etag(table_name: str, query_string: str = "") -> str:
+    """
+    Builds a strong ETag for a response read from one table.
+    The tag changes with every write to the table and differs for every query (for example each page).
+    Must be built BEFORE the data is read: if a write happens during the read,
+    the response gets the old tag and the next request will not be answered with 304.
+    :param table_name: Name of the SQL table.
+    :param query_string: Query parameters of the request that influence the response.
+    :return: ETag value without the quotes.
+    """
+    query_hash = hashlib.sha1(query_string.encode("utf-8")).hexdigest()[:12]
+    return f"{table_name}-{get_table_version(table_name)}-{query_hash}"
+
+
+
+def _read_versions() -> dict[str, int]:
+    """
+    Versions of all rental tables, read from SQLite once per TABLE_VERSION_REFRESH_SECONDS.
+    """
+    global _versions_snapshot
+    snapshot = _versions_snapshot
+    now = time.monotonic()
+    if snapshot is not None and now - snapshot[0] < TABLE_VERSION_REFRESH_SECONDS:
+        return snapshot[1]
+
+    generation = _versions_generation
+    ensure_version_tracking()
+    with rental_engine.connect() as connection:
+        versions = dict(connection.execute(text("SELECT table_name, version FROM table_versions")).all())
+    if generation == _versions_generation:
+        _versions_snapshot = (now, versions)
+    return versions
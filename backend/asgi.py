@@ -0,0 +1,178 @@
+"""
+ASGI serving mode.
+
+POST /api/chat is served natively by an async handler: the Gemini assistants use the async
+transport of the SDK and the SQLite work runs in worker threads, so a conversation that waits
+for the model does not hold a worker thread.
+All other routes (internal API, CORS preflight) are delegated to the Flask app.
+
+Run with:
+    uvicorn ApartmentManager.backend.asgi:app --host 127.0.0.1 --port 5003
+
+The synchronous Flask server (python backend/main.py) stays available as a fallback.
+"""
+import json
+from asgiref.wsgi import WsgiToAsgi
+from google.genai import errors as genai_errors
+from ApartmentManager.backend.main import initialize
+from ApartmentManager.backend.AI_API.general.error_texts import APIError, ErrorCode
+from ApartmentManager.backend.AI_API.general.envelopes.envelopes_api import build_error, AnswerSource
+from ApartmentManager.backend.AI_API.general.logger import get_logger, log_error
+from ApartmentManager.backend.AI_API.general.admission import CHAT_ADMISSION, AdmissionRejected
+from ApartmentManager.backend.AI_API.general.deadline import deadline_after, request_deadline
+from ApartmentManager.backend.config.server_config import CHAT_REQUEST_DEADLINE_SECONDS
+from ApartmentManager.backend.AI_API.general.stage_timing import collect_stage_timings, format_server_timing
+from ApartmentManager.backend.AI_API.general.conversation_registry import SESSION_HEADER, SESSION_COOKIE, \
+    resolve_session_id
+
+flask_app = initialize()
+flask_asgi_app = WsgiToAsgi(flask_app)
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        await _handle_lifespan(receive, send)
+        return
+
+    if scope["type"] == "http" and scope["path"] == "/api/chat" and scope["method"] == "POST":
+        await chat_api_async(scope, receive, send)
+        return
+
+    # every other route is answered by the synchronous Flask app
+    await flask_asgi_app(scope, receive, send)
+
+
+async def chat_api_async(scope, receive, send):
+    """
+    JSON-only endpoint for chat.
+    Request JSON: { "user_input": "<string>" }
+    The conversation is identified by the header X-Session-Id (or the cookie session_id).
+    """
+    registry = flask_app.extensions["conversation_registry"]
+    deadline = deadline_after(CHAT_REQUEST_DEADLINE_SECONDS)
+    headers = _read_headers(scope)
+    session_id, is_new_session = resolve_session_id(headers.get(SESSION_HEADER.lower()),
+                                                    _read_cookies(headers).get(SESSION_COOKIE))
+    session_headers = [(SESSION_HEADER.encode("latin-1"), session_id.encode("latin-1"))]
+    if is_new_session:
+        cookie = f"{SESSION_COOKIE}={session_id}; HttpOnly; SameSite=Lax; Path=/"
+        session_headers.append((b"set-cookie", cookie.encode("latin-1")))
+
+    try:
+        if not headers.get("content-type", "").startswith("application/json"):
+            trace_id = log_error(ErrorCode.FLASK_ERROR_HTTP_REQUEST_INPUT_MUST_BY_JSON)
+            raise APIError(ErrorCode.FLASK_ERROR_HTTP_REQUEST_INPUT_MUST_BY_JSON, trace_id)
+
+        body = await _read_body(receive)
+        try:
+            data = json.loads(body) if body else {}
+        except ValueError:
+            data = {}
+        if not isinstance(data, dict):
+            data = {}
+
+        # The API defines and expects this key in the request body
+        value = data.get('user_input')
+        user_question_str = value.strip() if isinstance(value, str) else ''
+
+        if not user_question_str:
+            trace_id = log_error(ErrorCode.FLASK_ERROR_USER_QUESTION_IS_NOT_STRING)
+            raise APIError(ErrorCode.FLASK_ERROR_USER_QUESTION_IS_NOT_STRING, trace_id)
+
+        # LLM answers, a limited number of turns at a time and one turn at a time per session
+        async with CHAT_ADMISSION.admit_async():
+            with collect_stage_timings() as stage_timings, request_deadline(deadline):
+                async with registry.conversation_async(session_id) as ai_client:
+                    model_answer = await ai_client.get_llm_answer_async(user_question_str)
+
+        server_timing = [(b"server-timing", format_server_timing(stage_timings).encode("latin-1")),
+                         (b"timing-allow-origin", b"*")]
+        await _send_json(send, model_answer.model_dump_json(), 200, session_headers + server_timing)
+
+    # same mapping as the error handlers of the Flask app
+    except AdmissionRejected as rejected:
+        result = build_error(code=rejected.error_code,
+                             message=rejected.message,
+                             llm_model=registry.model_name,
+                             answer_source=AnswerSource.BACKEND,
+                             trace_id=rejected.trace_id)
+        retry_after = [(b"retry-after", str(rejected.retry_after).encode("latin-1"))]
+        await _send_json(send, result.model_dump_json(), 429, retry_after)
+
+    except APIError as api_error:
+        result = build_error(code=api_error.error_code,
+                             message=api_error.message,
+                             llm_model=registry.model_name,
+                             answer_source=AnswerSource.BACKEND,
+                             trace_id=api_error.trace_id)
+        await _send_json(send, result.model_dump_json(), 200)
+
+    except genai_errors.APIError as err:
+        trace_id = log_error(exception=err)
+        status_code = getattr(err, "code", None) or 500
+        message = getattr(err, "message", None) or str(err)
+        result = build_error(code=status_code,
+                             message=message,
+                             llm_model=registry.model_name,
+                             answer_source=AnswerSource.BACKEND,
+                             trace_id=trace_id)
+        await _send_json(send, result.model_dump_json(), int(status_code))
+
+    except Exception as general_error:
+        get_logger().exception(general_error)
+        message = getattr(general_error, "error_message", None) or str(general_error) or "Unexpected error"
+        result = build_error(code=-1,
+                             message=message,
+                             llm_model=registry.model_name,
+                             answer_source=AnswerSource.BACKEND,
+                             trace_id=getattr(general_error, "trace_id", "-"))
+        await _send_json(send, result.model_dump_json(), 500)
+
+
+async def _handle_lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+def _read_headers(scope) -> dict:
+    return {key.decode("latin-1").lower(): value.decode("latin-1") for key, value in scope.get("headers", [])}
+
+
+def _read_cookies(headers: dict) -> dict:
+    cookies = {}
+    for pair in headers.get("cookie", "").split(";"):
+        name, _, value = pair.strip().partition("=")
+        if name:
+            cookies[name] = value
+    return cookies
+
+
+async def _read_body(receive) -> bytes:
+    body = b""
+    more_body = True
+    while more_body:
+        message = await receive()
+        body += message.get("body", b"")
+        more_body = message.get("more_body", False)
+    return body
+
+
+async def _send_json(send, json_str: str, status: int, extra_headers: list = None):
+    body = json_str.encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode("latin-1")),
+            # the route /api/* is accessible from any origin (see CORS in main.py)
+            (b"access-control-allow-origin", b"*"),
+            (b"access-control-expose-headers", f"{SESSION_HEADER}, Server-Timing, Retry-After".encode("latin-1")),
+        ] + (extra_headers or []),
+    })
+    await send({"type": "http.response.body", "body": body})
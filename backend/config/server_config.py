@@ -1,2 +1,71 @@
 HOST = "127.0.0.1"
-PORT = 5003
\ No newline at end of file
+PORT = 5003
+
+# Conversations kept in memory per worker (one per browser session)
+MAX_CONVERSATION_SESSIONS = 200
+CONVERSATION_IDLE_TTL_SECONDS = 30 * 60
+
+# Keyset pagination of the internal list endpoints
+DEFAULT_PAGE_LIMIT = 100
+MAX_PAGE_LIMIT = 1000
+
+# Maximal number of reads in one request of /internal/batch
+MAX_BATCH_REQUESTS = 20
+
+# Admission control of the chat endpoints: turns running at the same time,
+# requests waiting for a free slot and how long they may wait before HTTP 429
+MAX_CONCURRENT_CHAT_TURNS = 8
+MAX_QUEUED_CHAT_TURNS = 32
+MAX_CHAT_QUEUE_SECONDS = 15
+CHAT_RETRY_AFTER_SECONDS = 5
+
+# Time budget of one chat request, shared by all LLM calls and loopback requests of the turn
+CHAT_REQUEST_DEADLINE_SECONDS = 60
+# Timeout of one request to the internal API, cut to the remaining budget of the chat request
+LOOPBACK_HTTP_TIMEOUT_SECONDS = 10
+
+# Retries of the LLM calls after transient provider errors (429, 5xx, connection errors)
+LLM_MAX_ATTEMPTS = 3 # including the first call
+LLM_BACKOFF_BASE_SECONDS = 0.5
+LLM_BACKOFF_MAX_SECONDS = 8
+# Circuit breaker: transient failures in a row that stop the calls, and the pause before the next trial call
+LLM_CIRCUIT_FAILURE_THRESHOLD = 5
+LLM_CIRCUIT_RESET_SECONDS = 30
+
+# Repair calls of the write flow when the collected data fails the validation
+MAX_VALIDATION_REPAIR_ATTEMPTS = 2
+
+# Conversation history resent with every LLM call: the last turns are kept verbatim within the token budget,
+# older turns are folded into a summary, function responses longer than the limit are shortened after the answer
+HISTORY_TOKEN_BUDGET = 8000
+HISTORY_VERBATIM_TURNS = 6
+HISTORY_SUMMARY_MAX_CHARS = 2000
+HISTORY_MAX_FUNCTION_RESPONSE_CHARS = 1000
+
+# Size limit of the digest of the previous answer in the CRUD intent prompt, independent of the size of the table
+FEEDBACK_DIGEST_MAX_BYTES = 512
+
+# Explicit prompt caching of the provider: the largest static prompts are stored as cached contents and
+# refreshed before the TTL ends. Off by default, the storage of a cached content is billed per hour
+EXPLICIT_PROMPT_CACHE = False
+EXPLICIT_CACHED_PROMPTS = ("CRUD_INTENT", "UPDATE_ENTITY", "CREATE_ENTITY")
+PROMPT_CACHE_TTL_SECONDS = 60 * 60
+
+# The versions of the rental tables (ETags, answer cache) are read from SQLite at most once per interval,
+# a write of this process is seen at once, a write of another process or outside the app after the interval
+TABLE_VERSION_REFRESH_SECONDS = 1.0
+
+# Answers of repeated read questions cached per process, dropped on every write to the rental database
+MAX_CACHED_ANSWERS = 256
+
+# Speculative mode: the function call proposal is requested at the same time as the CRUD intent
+# on turns without an active write operation, it is wasted if the turn turns out to be a CRUD operation
+SPECULATIVE_FUNCTION_CALL = False
+
+# Local classifier of the CRUD intent (train_intent_classifier): minimal confidence of a local answer,
+# below it the CRUD intent assistant asks the LLM
+CRUD_INTENT_LOCAL_THRESHOLD = 0.9
+
+# CRUD intents of the LLM for turns without conversation state, reused for the same question
+CRUD_INTENT_CACHE_MAX_ENTRIES = 512
+CRUD_INTENT_CACHE_TTL_SECONDS = 60 * 60
@@ -1,18 +1,32 @@
+import contextvars
+import functools
 import inspect
 import os
+import queue
+import threading
 from dotenv import load_dotenv
-from flask import Flask, jsonify, request, Blueprint, current_app
+from flask import Flask, jsonify, request, Blueprint, current_app, make_response, Response, stream_with_context
 from flask_cors import CORS
 from requests import RequestException
 from werkzeug.exceptions import HTTPException
 from google.genai import errors as genai_errors
 from ApartmentManager.backend.SQL_API.rental.CRUD import create
-from ApartmentManager.backend.config.server_config import HOST, PORT
+from ApartmentManager.backend.config.server_config import HOST, PORT, MAX_CONVERSATION_SESSIONS, \
+    CONVERSATION_IDLE_TTL_SECONDS, CHAT_REQUEST_DEADLINE_SECONDS
 import ApartmentManager.backend.SQL_API.rental.CRUD.read as read_sql
-from ApartmentManager.backend.AI_API.general.conversation_client import ConversationClient
+from ApartmentManager.backend.SQL_API.rental.rental_orm_models import Apartment, Tenancy, PersonalData, Contract
+from ApartmentManager.backend.SQL_API.rental.table_versions import build_etag, ensure_version_tracking
+from ApartmentManager.backend.RESTFUL_API.responses import envelope_response, rows_response, representation_key
+from ApartmentManager.backend.AI_API.general.conversation_registry import ConversationRegistry, SESSION_HEADER, \
+    SESSION_COOKIE, resolve_session_id
 from ApartmentManager.backend.AI_API.general.error_texts import APIError, ErrorCode
 from ApartmentManager.backend.AI_API.general.envelopes.envelopes_api import build_error, AnswerSource
 from ApartmentManager.backend.AI_API.general.logger import init_logging, get_logger, log_error
+from ApartmentManager.backend.AI_API.general.streaming import format_sse
+from ApartmentManager.backend.AI_API.general.admission import CHAT_ADMISSION, AdmissionRejected
+from ApartmentManager.backend.AI_API.general.deadline import deadline_after, request_deadline
+from ApartmentManager.backend.AI_API.general.metrics import REGISTRY, PROMETHEUS_CONTENT_TYPE
+from ApartmentManager.backend.AI_API.general.stage_timing import collect_stage_timings, format_server_timing
 
 # Helps access the decorator names after initialization
 public_bp = Blueprint("public_api", __name__) # http://HOST:PORT/api/...
@@ -27,18 +41,30 @@ def initialize():
 
     flask_app = Flask(__name__)
 
+    # the triggers counting the changes of the rental tables must exist before the first write,
+    # a database that is not initialized yet gets them with the first read of a version
+    try:
+        ensure_version_tracking()
+    except Exception as error:
+        logger.info(f"Table versions cannot be set up yet, retried with the next read: {error!r}")
+
     # allow route to the endpoint /api/ and /internal/ to be accessed from any origin
     CORS(flask_app, resources={r"/api/*": {"origins": "*"},
-                               r"/internal/*": {"origins": "*"}})
+                               r"/internal/*": {"origins": "*"}},
+         expose_headers=[SESSION_HEADER, "ETag", "Server-Timing", "Retry-After"])
 
     # Specify the model to use
     load_dotenv()
     some_gemini_model = os.getenv("GEMINI_MODEL")  # for example, gemini-2.5-flash
 
-    # Here we put the object of LlmClient inside the extension of the Flask app
-    # Then we can access it from any route inside the app using current_app.extensions["ai_client"]
+    # Here we put the registry of the conversations inside the extension of the Flask app
+    # Then we can access it from any route inside the app using current_app.extensions["conversation_registry"]
+    # Every browser session gets its own ConversationClient, so the conversation states are not mixed.
     flask_app.extensions = getattr(flask_app, "extensions", {})
-    flask_app.extensions["ai_client"] = ConversationClient(some_gemini_model)
+    flask_app.extensions["conversation_registry"] = ConversationRegistry(
+        model_name=some_gemini_model,
+        max_sessions=MAX_CONVERSATION_SESSIONS,
+        idle_ttl_seconds=CONVERSATION_IDLE_TTL_SECONDS)
 
     # register routes/error handlers defined on the both blueprints
     flask_app.register_blueprint(public_bp)
@@ -52,42 +78,44 @@ def home():
     return 'OK'
 
 
+@public_bp.route('/metrics')
+def metrics():
+    """
+    Metrics of the chat pipeline in the Prometheus text format.
+    """
+    return Response(REGISTRY.render(), mimetype=None, content_type=PROMETHEUS_CONTENT_TYPE)
+
+
 @public_bp.route('/api/chat', methods=['POST'])
 def chat_api():
     """
     JSON-only endpoint for chat.
     Request JSON: { "user_input": "<string>" }
+    The conversation is identified by the header X-Session-Id (or the cookie session_id).
     """
+    # the budget of the request starts at the entry, the wait for a free slot is part of it
+    deadline = deadline_after(CHAT_REQUEST_DEADLINE_SECONDS)
     try:
-        if not request.is_json:
-            trace_id = log_error(ErrorCode.FLASK_ERROR_HTTP_REQUEST_INPUT_MUST_BY_JSON)
-            raise APIError(ErrorCode.FLASK_ERROR_HTTP_REQUEST_INPUT_MUST_BY_JSON, trace_id)
-
-        # silent= True -> try to get JSON from an HTTP request
-        data = request.get_json(silent=True)
-        if data is None:
-            data = {}
+        user_question_str = _read_user_question()
 
-        # The API defines and expects this key in the request body
-        value = data.get('user_input')
-        user_question_str = value.strip() if value else ''
-        print(user_question_str)
-
-        if not user_question_str:
-            trace_id = log_error(ErrorCode.FLASK_ERROR_USER_QUESTION_IS_NOT_STRING)
-            raise APIError(ErrorCode.FLASK_ERROR_USER_QUESTION_IS_NOT_STRING, trace_id)
+        session_id, is_new_session = resolve_session_id(request.headers.get(SESSION_HEADER),
+                                                        request.cookies.get(SESSION_COOKIE))
 
         # current_app is the variable of Flask that points to the actual app
         # Different objects of the business logic can be stored inside
-        ai_client = current_app.extensions["ai_client"]
-
-        # LLM answers
-        model_answer = ai_client.get_llm_answer(user_question_str)
-
-        result = model_answer.model_dump(mode='json')
-
-        print(result)
-        return result, 200
+        registry = current_app.extensions["conversation_registry"]
+
+        # LLM answers, a limited number of turns at a time and one turn at a time per session
+        with CHAT_ADMISSION.admit(), collect_stage_timings() as stage_timings:
+            with request_deadline(deadline), registry.conversation(session_id) as ai_client:
+                model_answer = ai_client.get_llm_answer(user_question_str)
+
+        print(model_answer)
+        response = envelope_response(request, model_answer, 200)
+        response.headers["Server-Timing"] = format_server_timing(stage_timings)
+        response.headers["Timing-Allow-Origin"] = "*" # the frontend runs on another origin
+        _attach_session(response, session_id, is_new_session)
+        return response
         # TODO implement close client to release the http resources
 
     except APIError:
@@ -99,37 +127,202 @@ def chat_api():
     except Exception:
         raise
 
+
+@public_bp.route('/api/chat/stream', methods=['POST'])
+def chat_stream_api():
+    """
+    Streaming variant of /api/chat as Server-Sent Events.
+    Request JSON: { "user_input": "<string>" }
+    Events:
+        stage    - {"name": "accepted" | "intent_detected" | "db_read_done", ...}
+        delta    - {"text": "<next part of the answer text>"}
+        envelope - the same envelope as returned by /api/chat, the last event of a successful turn
+        error    - error envelope, the last event of a failed turn
+    """
+    deadline = deadline_after(CHAT_REQUEST_DEADLINE_SECONDS)
+    user_question_str = _read_user_question()
+
+    session_id, is_new_session = resolve_session_id(request.headers.get(SESSION_HEADER),
+                                                    request.cookies.get(SESSION_COOKIE))
+    registry = current_app.extensions["conversation_registry"]
+
+    # admitted before the stream starts, so a rejection is still answered with HTTP 429
+    CHAT_ADMISSION.acquire()
+
+    events = queue.Queue()
+
+    def run_turn():
+        try:
+            with collect_stage_timings(), request_deadline(deadline), registry.conversation(session_id) as ai_client:
+                ai_client.event_sink = lambda event, data: events.put((event, data))
+                try:
+                    model_answer = ai_client.get_llm_answer(user_question_str)
+                finally:
+                    ai_client.event_sink = None
+            events.put(("envelope", model_answer.model_dump(mode='json')))
+        except Exception as error:
+            events.put(("error", _build_stream_error(error, registry.model_name)))
+        finally:
+            CHAT_ADMISSION.release()
+            events.put(None)
+
+    # The turn runs in its own thread, so the events can be sent while the LLM is still working.
+    # The copied context keeps the trace id of the logger.
+    worker = threading.Thread(target=contextvars.copy_context().run, args=(run_turn,), daemon=True)
+    worker.start()
+
+    def generate():
+        yield format_sse("stage", {"name": "accepted"})
+        while True:
+            item = events.get()
+            if item is None:
+                break
+            event, data = item
+            yield format_sse(event, data)
+
+    response = Response(stream_with_context(generate()), mimetype="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no" # no buffering in a reverse proxy
+    _attach_session(response, session_id, is_new_session)
+    return response
+
+
+def _read_user_question() -> str:
+    """
+    Reads and checks the user question of a chat request.
+    """
+    if not request.is_json:
+        trace_id = log_error(ErrorCode.FLASK_ERROR_HTTP_REQUEST_INPUT_MUST_BY_JSON)
+        raise APIError(ErrorCode.FLASK_ERROR_HTTP_REQUEST_INPUT_MUST_BY_JSON, trace_id)
+
+    # silent= True -> try to get JSON from an HTTP request
+    data = request.get_json(silent=True)
+    if data is None:
+        data = {}
+
+    # The API defines and expects this key in the request body
+    value = data.get('user_input')
+    user_question_str = value.strip() if value else ''
+    print(user_question_str)
+
+    if not user_question_str:
+        trace_id = log_error(ErrorCode.FLASK_ERROR_USER_QUESTION_IS_NOT_STRING)
+        raise APIError(ErrorCode.FLASK_ERROR_USER_QUESTION_IS_NOT_STRING, trace_id)
+
+    return user_question_str
+
+
+def _attach_session(response, session_id: str, is_new_session: bool) -> None:
+    response.headers[SESSION_HEADER] = session_id
+    if is_new_session:
+        response.set_cookie(SESSION_COOKIE, session_id, httponly=True, samesite="Lax")
+
+
+def _build_stream_error(error: Exception, llm_model: str) -> dict:
+    """
+    Builds the error envelope for the streaming endpoint.
+    The HTTP status is already sent, so the mapping of the error handlers below is done here.
+    """
+    if isinstance(error, APIError):
+        code, message, trace_id = error.error_code, error.message, error.trace_id
+    elif isinstance(error, genai_errors.APIError):
+        trace_id = log_error(exception=error)
+        code = getattr(error, "code", None) or 500
+        message = getattr(error, "message", None) or str(error)
+    else:
+        get_logger().exception(error)
+        code = -1
+        message = getattr(error, "error_message", None) or str(error) or "Unexpected error"
+        trace_id = getattr(error, "trace_id", "-")
+
+    result = build_error(code=code,
+                         message=message,
+                         llm_model=llm_model,
+                         answer_source=AnswerSource.BACKEND,
+                         trace_id=trace_id)
+    return result.model_dump(mode='json')
+
+def conditional_get(table_name: str):
+    """
+    Decorator for the GET routes that read one table.
+    The response gets an ETag built from the version of the table. If the client sends the same tag
+    in If-None-Match, the route answers 304 without reading the database.
+    :param table_name: Name of the SQL table read by the route.
+    """
+    def decorator(view_func):
+        @functools.wraps(view_func)
+        def wrapper(*args, **kwargs):
+            # the tag is built before reading, so a concurrent write can only make it outdated, never too new
+            etag = build_etag(table_name, f"{request.query_string.decode('utf-8')}|{representation_key(request)}")
+
+            if request.if_none_match.contains_weak(etag):
+                response = make_response("", 304)
+            else:
+                response = make_response(view_func(*args, **kwargs))
+
+            response.set_etag(etag)
+            # the client may keep the data, but has to revalidate it on every use
+            response.headers["Cache-Control"] = "no-cache"
+            return response
+        return wrapper
+    return decorator
+
+
 @internal_bp.route('/tenancies', methods=['GET'])
+@conditional_get(Tenancy.__tablename__)
 def get_tenancies():
     """
      Returns a JSON list of tenancies.
+    With the query parameters limit and/or after one page is returned:
+    { "items": [...], "next": "<cursor of the next page>" | null }
     :return:
     """
+    if _is_page_request():
+        tenancies, next_cursor = read_sql.get_tenancies_page(limit=request.args.get("limit"),
+                                                             after=request.args.get("after"))
+        return _page_response(tenancies, next_cursor)
+
     tenancies = read_sql.get_tenancies()
     tenancies_to_json = [tenancy.to_dict() for tenancy in tenancies]
-    return jsonify(tenancies_to_json)
+    return rows_response(request, tenancies_to_json)
 
 
 @internal_bp.route('/contract', methods=['GET'])
+@conditional_get(Contract.__tablename__)
 def get_contract():
     """
      Returns a JSON list of contracts.
+    With the query parameters limit and/or after one page is returned:
+    { "items": [...], "next": "<cursor of the next page>" | null }
     :return:
     """
+    if _is_page_request():
+        contracts, next_cursor = read_sql.get_contract_page(limit=request.args.get("limit"),
+                                                            after=request.args.get("after"))
+        return _page_response(contracts, next_cursor)
+
     contracts = read_sql.get_contract()
     contracts_to_json = [data.to_dict() for data in contracts]
-    return jsonify(contracts_to_json)
+    return rows_response(request, contracts_to_json)
 
 
 @internal_bp.route('/persons', methods=['GET'])
+@conditional_get(PersonalData.__tablename__)
 def get_persons():
     """
      Returns a JSON list of persons.
+    With the query parameters limit and/or after one page is returned:
+    { "items": [...], "next": "<cursor of the next page>" | null }
     :return:
     """
+    if _is_page_request():
+        persons, next_cursor = read_sql.get_persons_page(limit=request.args.get("limit"),
+                                                         after=request.args.get("after"))
+        return _page_response(persons, next_cursor)
+
     persons = read_sql.get_persons()
     persons_to_json = [person.to_dict() for person in persons]
-    return jsonify(persons_to_json)
+    return rows_response(request, persons_to_json)
 
 
 @internal_bp.route('/persons', methods=['POST'])
@@ -156,14 +349,48 @@ def add_person():
     return result, 200
 
 @internal_bp.route('/apartments', methods=['GET'])
+@conditional_get(Apartment.__tablename__)
 def get_apartments():
     """
     Returns a JSON list of apartments.
+    With the query parameters limit and/or after one page is returned:
+    { "items": [...], "next": "<cursor of the next page>" | null }
     :return:
     """
+    if _is_page_request():
+        apartments, next_cursor = read_sql.get_apartments_page(limit=request.args.get("limit"),
+                                                               after=request.args.get("after"))
+        return _page_response(apartments, next_cursor)
+
     apartments = read_sql.get_apartments()
     apartments_to_json = [apartment.to_dict() for apartment in apartments]
-    return jsonify(apartments_to_json)
+    return rows_response(request, apartments_to_json)
+
+
+@internal_bp.route('/batch', methods=['POST'])
+def read_batch():
+    """
+    Runs several reads in one request and one database snapshot.
+    Request JSON: { "requests": [ {"key": "flats", "entity": "apartments", "filters": {...}, "limit": 100}, ... ] }
+    Response JSON: { "results": { "flats": [...], ... } }
+    :return:
+    """
+    if not request.is_json:
+        return jsonify(error="Content-Type must be application/json"), 415
+
+    data = request.get_json(silent=True)
+    # a body that is not an object is rejected by read_batch like missing requests
+    results = read_sql.read_batch(data.get("requests") if isinstance(data, dict) else None)
+    return rows_response(request, {"results": results})
+
+
+def _is_page_request() -> bool:
+    # without the pagination parameters the endpoints keep returning the whole list
+    return "limit" in request.args or "after" in request.args
+
+
+def _page_response(rows: list, next_cursor: str | None):
+    return rows_response(request, {"items": [row.to_dict() for row in rows], "next": next_cursor})
 
 
 # processes all exceptions in the business logic
@@ -171,10 +398,22 @@ def get_apartments():
 def handle_api_error(api_error: APIError):
     result = build_error(code=api_error.error_code,
                          message=api_error.message,
-                         llm_model=current_app.extensions["ai_client"].model_name,
+                         llm_model=current_app.extensions["conversation_registry"].model_name,
                          answer_source=AnswerSource.BACKEND,
                          trace_id=api_error.trace_id if hasattr(api_error, "trace_id") else "")
-    return result.model_dump(mode='json'), 200
+    return envelope_response(request, result, 200)
+
+
+@public_bp.app_errorhandler(AdmissionRejected)
+def handle_admission_rejected(rejected: AdmissionRejected):
+    result = build_error(code=rejected.error_code,
+                         message=rejected.message,
+                         llm_model=current_app.extensions["conversation_registry"].model_name,
+                         answer_source=AnswerSource.BACKEND,
+                         trace_id=rejected.trace_id)
+    response = envelope_response(request, result, 429)
+    response.headers["Retry-After"] = str(rejected.retry_after)
+    return response
 
 
 @public_bp.app_errorhandler(HTTPException)
@@ -183,11 +422,11 @@ def handle_http_error(http_err: HTTPException):
     result = build_error(
         code=http_err.code,
         message=message,
-        llm_model=current_app.extensions["ai_client"].model_name,
+        llm_model=current_app.extensions["conversation_registry"].model_name,
         answer_source=AnswerSource.BACKEND,
         trace_id=getattr(http_err, "trace_id", "-")
     )
-    return result.model_dump(mode='json'), http_err.code
+    return envelope_response(request, result, http_err.code)
 
 
 # universal handler for all exceptions that were not catch ->
@@ -202,11 +441,11 @@ def handle_unexpected_error(general_error):
 
     result = build_error(code=-1,
                          message=message,
-                         llm_model=current_app.extensions["ai_client"].model_name,
+                         llm_model=current_app.extensions["conversation_registry"].model_name,
                          answer_source=AnswerSource.BACKEND,
                          trace_id=general_error.trace_id if hasattr(general_error, "trace_id") else "-")
 
-    return result.model_dump(mode='json'), 500
+    return envelope_response(request, result, 500)
 
 @public_bp.app_errorhandler(genai_errors.APIError)
 def handle_gemini_api_error(err: genai_errors.APIError):
@@ -224,11 +463,11 @@ def handle_gemini_api_error(err: genai_errors.APIError):
     result = build_error(
         code=status_code,
         message=message,
-        llm_model=current_app.extensions["ai_client"].model_name,
+        llm_model=current_app.extensions["conversation_registry"].model_name,
         answer_source=AnswerSource.BACKEND,
         trace_id=trace_id
     )
-    return result.model_dump(mode='json'), int(status_code or 500)
+    return envelope_response(request, result, int(status_code or 500))
 
 if __name__ == '__main__':
     app = initialize()
@@ -1,4 +1,12 @@
 const API_BASE = 'http://127.0.0.1:5003';
+// Answers are streamed as Server-Sent Events from /api/chat/stream, set to false to use /api/chat
+const CHAT_STREAMING = true;
+
+const STAGE_NOTICES = {
+  accepted: 'Assistant is thinking…',
+  intent_detected: 'Understood the request…',
+  db_read_done: 'Data loaded from the database…',
+};
 
 const { useState, useEffect, useRef, useMemo } = React;
 
@@ -21,6 +29,16 @@ function shortModelName(model) {
   } catch { return String(model); }
 }
 
+// Every browser tab keeps its own conversation on the backend
+function getChatSessionId() {
+  let sessionId = sessionStorage.getItem('chatSessionId');
+  if (!sessionId) {
+    sessionId = (window.crypto && crypto.randomUUID) ? crypto.randomUUID().replace(/-/g, '') : String(Date.now()) + Math.random().toString(16).slice(2);
+    sessionStorage.setItem('chatSessionId', sessionId);
+  }
+  return sessionId;
+}
+
 function normalizeEnvelope(data) {
   const type = data && data.type ? String(data.type) : null;
   const llm_model = (data && (data.llm_model || data.llmModel)) || null;
@@ -431,7 +449,7 @@ function ChatPanel({ onSend, messages, loading }) {
           })
         ]);
       }),
-      loading ? React.createElement('div', { className: 'msg system' }, 'Assistant is thinking…') : null,
+      (loading && !messages.some(m => m.streaming)) ? React.createElement('div', { className: 'msg system' }, 'Assistant is thinking…') : null,
       React.createElement('div', { ref: messagesEndRef })
     ),
     React.createElement('div', { className: 'chat-input' },
@@ -605,18 +623,42 @@ function ClassicalTileView() {
     async function fetchData() {
       try {
         setLoading(true);
-        // Fetch apartments and persons as requested, though we can't link them without tenancies yet.
-        const [apartmentsRes, personsRes] = await Promise.all([
-          fetch(`${API_BASE}/internal/apartments`),
-          fetch(`${API_BASE}/internal/persons`)
-        ]);
+        // One request and one consistent database snapshot for all tables of the view
+        const batchRes = await fetch(`${API_BASE}/internal/batch`, {
+          method: 'POST',
+          headers: { 'Content-Type': 'application/json' },
+          body: JSON.stringify({
+            requests: [
+              { entity: 'apartments' },
+              { entity: 'persons' },
+              { entity: 'tenancies' },
+              { entity: 'contract' }
+            ]
+          })
+        });
+
+        if (!batchRes.ok) {
+          throw new Error('Failed to fetch data');
+        }
 
-        if (!apartmentsRes.ok || !personsRes.ok) {
+        const batch = await batchRes.json();
+        // Errors of the backend come as an error envelope
+        if (!batch.results) {
           throw new Error('Failed to fetch data');
         }
+        const { apartments, persons, tenancies } = batch.results;
+
+        const personsById = {};
+        persons.forEach(person => { personsById[person.id_personal_data] = person; });
 
-        const apartments = await apartmentsRes.json();
-        const persons = await personsRes.json(); // Available for future use
+        // The current tenant of an apartment is the one of the tenancy without move-out date
+        const tenantByApartment = {};
+        tenancies.forEach(tenancy => {
+          const person = personsById[tenancy.id_tenant_personal_data];
+          if (!tenancy.move_out_date && person) {
+            tenantByApartment[tenancy.id_apartment] = `${person.first_name} ${person.last_name}`;
+          }
+        });
 
         const groupedFloors = {};
 
@@ -629,9 +671,7 @@ function ClassicalTileView() {
             groupedFloors[floorName] = [];
           }
 
-          // Without tenancies, we cannot determine who lives where.
-          // Defaulting to 'Vacant' for now.
-          const tenantName = 'Vacant';
+          const tenantName = tenantByApartment[apt.id_apartment] || 'Vacant';
 
           groupedFloors[floorName].push({
             id: apt.id_apartment,
@@ -791,7 +831,7 @@ function App() {
     try {
       const res = await fetch(`${API_BASE}/api/chat`, {
         method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
+        headers: { 'Content-Type': 'application/json', 'X-Session-Id': getChatSessionId() },
         body: JSON.stringify({ user_input: userText }),
         signal: controller.signal,
       });
@@ -826,84 +866,196 @@ function App() {
       }
 
       const data = await res.json();
-      const env = normalizeEnvelope(data);
+      handleEnvelope(data);
+    } catch (err) {
+      clearTimeout(timeoutId);
+      handleRequestFailure(err);
+    } finally {
+      setLoading(false);
+    }
+  }
 
-      if (!env || !env.type) {
-        addMessage('assistant', 'Unknown response format from server', true);
+  async function sendToApiStream(userText) {
+    const controller = new AbortController();
+    const timeoutId = setTimeout(() => controller.abort(), 100000);
+    setLoading(true);
+    addMessage('user', userText);
+    let finished = false;
+    try {
+      const res = await fetch(`${API_BASE}/api/chat/stream`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json', 'X-Session-Id': getChatSessionId() },
+        body: JSON.stringify({ user_input: userText }),
+        signal: controller.signal,
+      });
+
+      // Errors before the stream starts are answered as a normal JSON envelope
+      const contentType = res.headers.get('Content-Type') || '';
+      if (!contentType.startsWith('text/event-stream')) {
+        clearTimeout(timeoutId);
+        let data;
+        try {
+          data = await res.json();
+        } catch (e) {
+          throw new Error(res.status >= 500 || res.status === 0 ? 'backend_unavailable' : 'internal_error');
+        }
+        const env = normalizeEnvelope(data);
+        if (env.type === 'error') { handleErrorEnvelope(env); return; }
+        if (!res.ok) throw new Error('internal_error');
+        handleEnvelope(data);
         return;
       }
 
-      switch (env.type) {
-        case 'error': { handleErrorEnvelope(env); break; }
-
-        case 'text': {
-          const msg = (env.result && (env.result.message || env.result.text || env.result.content))
-            || data.message
-            || 'Received empty response from model.';
-          const rawSource = env.answer_source ? String(env.answer_source).toLowerCase() : null;
-          addMessage('assistant', msg, false, rawSource, env.llm_model || null, env.trace_id || null);
-          break;
+      // Placeholder of the answer that grows with the received text
+      setMessages(prev => [...prev, { role: 'assistant', content: STAGE_NOTICES.accepted, source: 'llm', streaming: true, streamedText: '' }]);
+
+      const reader = res.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+      while (!finished) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        // Events are separated by an empty line
+        let separatorIndex;
+        while ((separatorIndex = buffer.indexOf('\n\n')) >= 0) {
+          const rawEvent = buffer.slice(0, separatorIndex);
+          buffer = buffer.slice(separatorIndex + 2);
+          finished = handleStreamEvent(rawEvent) || finished;
         }
+      }
+      clearTimeout(timeoutId);
 
-        case 'data': {
-          setDataEnvelope(env.full);
-          const note = (env.result && env.result.message)
-            ? env.result.message
-            : 'Received structured data.';
-          const rawSource = env.answer_source ? String(env.answer_source).toLowerCase() : null;
-          addMessage('assistant', note, false, rawSource, env.llm_model || null, env.trace_id || null);
-          break;
-        }
+      if (!finished) throw new Error('internal_error');
+    } catch (err) {
+      clearTimeout(timeoutId);
+      removeStreamingMessage();
+      handleRequestFailure(err);
+    } finally {
+      setLoading(false);
+    }
+  }
 
-        default: {
-          addMessage('assistant', `Unsupported response type: ${String(env.type)}`, true, env.answer_source || null, env.llm_model || null, env.trace_id || null);
+  // Returns true if the event closes the stream
+  function handleStreamEvent(rawEvent) {
+    let eventName = 'message';
+    const dataLines = [];
+    rawEvent.split('\n').forEach(line => {
+      if (line.startsWith('event:')) eventName = line.slice(6).trim();
+      else if (line.startsWith('data:')) dataLines.push(line.slice(5).trim());
+    });
+    let data = null;
+    try { data = dataLines.length ? JSON.parse(dataLines.join('\n')) : null; } catch { data = null; }
+
+    switch (eventName) {
+      case 'stage': {
+        const notice = data && STAGE_NOTICES[data.name];
+        if (notice) {
+          setMessages(prev => prev.map(m => (m.streaming && !m.streamedText) ? { ...m, content: notice } : m));
         }
+        return false;
       }
-    } catch (err) {
-      // This block will now only be reached for network errors, timeouts,
-      // or non-JSON server errors, which is what we want for the modal.
-      clearTimeout(timeoutId);
+      case 'delta': {
+        const text = (data && data.text) || '';
+        setMessages(prev => prev.map(m => {
+          if (!m.streaming) return m;
+          const streamedText = (m.streamedText || '') + text;
+          return { ...m, streamedText, content: streamedText };
+        }));
+        return false;
+      }
+      case 'envelope':
+      case 'error': {
+        removeStreamingMessage();
+        handleEnvelope(data);
+        return true;
+      }
+      default:
+        return false;
+    }
+  }
+
+  function removeStreamingMessage() {
+    setMessages(prev => prev.filter(m => !m.streaming));
+  }
 
-      console.error('Request to backend failed:', err);
+  function handleEnvelope(data) {
+    const env = normalizeEnvelope(data);
 
-      const errMsg = err && typeof err.message === 'string' ? err.message : '';
+    if (!env || !env.type) {
+      addMessage('assistant', 'Unknown response format from server', true);
+      return;
+    }
 
-      let title = 'Request error';
-      let message = 'There was an error or timeout. Please re-enter your message in chat.';
+    switch (env.type) {
+      case 'error': { handleErrorEnvelope(env); break; }
 
-      // 1) Timeout via AbortController → dedicated message
-      if (err && err.name === 'AbortError') {
-        title = 'Backend timeout';
-        message = 'The request to the backend timed out. Please check if the backend server is running and reachable.';
-      }
-      // 2) Explicit backend_unavailable marker or typical fetch TypeError (network unreachable)
-      else if (errMsg === 'backend_unavailable' || err instanceof TypeError) {
-        title = 'Backend unavailable';
-        message = 'Backend server is not running or unreachable.';
+      case 'text': {
+        const msg = (env.result && (env.result.message || env.result.text || env.result.content))
+          || data.message
+          || 'Received empty response from model.';
+        const rawSource = env.answer_source ? String(env.answer_source).toLowerCase() : null;
+        addMessage('assistant', msg, false, rawSource, env.llm_model || null, env.trace_id || null);
+        break;
       }
-      // 3) Known logical errors that we explicitly throw
-      else if (errMsg === '`user_input` is required' || errMsg === 'Content-Type must be application/json') {
-        // Keep the generic title, but refine the message text
-        message = errMsg;
+
+      case 'data': {
+        setDataEnvelope(env.full);
+        const note = (env.result && env.result.message)
+          ? env.result.message
+          : 'Received structured data.';
+        const rawSource = env.answer_source ? String(env.answer_source).toLowerCase() : null;
+        addMessage('assistant', note, false, rawSource, env.llm_model || null, env.trace_id || null);
+        break;
       }
-      // 4) Internal backend error while the server is running
-      else if (errMsg === 'internal_error') {
-        title = 'Backend error';
-        message = 'The backend responded with an internal error. Please check the backend logs for details.';
+
+      default: {
+        addMessage('assistant', `Unsupported response type: ${String(env.type)}`, true, env.answer_source || null, env.llm_model || null, env.trace_id || null);
       }
-      // 5) In all other cases, keep the default "Request error"
+    }
+  }
 
-      setModal({
-        open: true,
-        title,
-        message,
-      });
+  function handleRequestFailure(err) {
+    // This function is only reached for network errors, timeouts,
+    // or non-JSON server errors, which is what we want for the modal.
+    console.error('Request to backend failed:', err);
 
-      // Mirror the same information in the chat as an assistant error message
-      addMessage('assistant', message, true, 'backend', null, null, 'error');
-    } finally {
-      setLoading(false);
+    const errMsg = err && typeof err.message === 'string' ? err.message : '';
+
+    let title = 'Request error';
+    let message = 'There was an error or timeout. Please re-enter your message in chat.';
+
+    // 1) Timeout via AbortController → dedicated message
+    if (err && err.name === 'AbortError') {
+      title = 'Backend timeout';
+      message = 'The request to the backend timed out. Please check if the backend server is running and reachable.';
+    }
+    // 2) Explicit backend_unavailable marker or typical fetch TypeError (network unreachable)
+    else if (errMsg === 'backend_unavailable' || err instanceof TypeError) {
+      title = 'Backend unavailable';
+      message = 'Backend server is not running or unreachable.';
     }
+    // 3) Known logical errors that we explicitly throw
+    else if (errMsg === '`user_input` is required' || errMsg === 'Content-Type must be application/json') {
+      // Keep the generic title, but refine the message text
+      message = errMsg;
+    }
+    // 4) Internal backend error while the server is running
+    else if (errMsg === 'internal_error') {
+      title = 'Backend error';
+      message = 'The backend responded with an internal error. Please check the backend logs for details.';
+    }
+    // 5) In all other cases, keep the default "Request error"
+
+    setModal({
+      open: true,
+      title,
+      message,
+    });
+
+    // Mirror the same information in the chat as an assistant error message
+    addMessage('assistant', message, true, 'backend', null, null, 'error');
   }
 
   function handleErrorEnvelope(env) {
@@ -961,7 +1113,7 @@ function App() {
     viewMode === 'chat'
       ? React.createElement('main', { className: 'content' },
         React.createElement('section', { className: 'panel' }, React.createElement(JsonViewerPanel, { dataEnvelope, keyMapping })),
-        React.createElement('section', { className: 'panel' }, React.createElement(ChatPanel, { onSend: sendToApi, messages, loading }))
+        React.createElement('section', { className: 'panel' }, React.createElement(ChatPanel, { onSend: CHAT_STREAMING ? sendToApiStream : sendToApi, messages, loading }))
       )
       : React.createElement('main', { className: 'content classical-mode' }, React.createElement(ClassicalModeRoot)),
     React.createElement(Modal, { open: modal.open, title: modal.title, message: modal.message, onClose: () => setModal(m => ({ ...m, open: false })) })